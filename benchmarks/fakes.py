@@ -0,0 +1,161 @@
+"""In-process stand-ins for Elasticsearch and Ollama with injectable latency.
+
+They implement just the API surface the agent uses, so the real code paths
+(pipeline, search_hits, graph nodes) run unchanged against them.
+"""
+
+import math
+import re
+import time
+from collections import Counter
+from itertools import repeat
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+_TOKEN = re.compile(r"\w+")
+
+
+def _sleep_ms(ms: float) -> None:
+    if ms > 0:
+        time.sleep(ms / 1000)
+
+
+class FakeEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic vectors; each call costs `latency_ms` plus `per_text_ms` per text."""
+
+    latency_ms: float = 0.0
+    per_text_ms: float = 0.0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        _sleep_ms(self.latency_ms + self.per_text_ms * len(texts))
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        _sleep_ms(self.latency_ms + self.per_text_ms)
+        return super().embed_query(text)
+
+
+def fake_llm(answer: str = "This is a benchmark answer from the stand-in model.", token_ms: float = 0.0):
+    """Chat model that streams `answer` word by word, `token_ms` per token."""
+
+    class _SlowFakeChatModel(GenericFakeChatModel):
+        def _stream(self, *args, **kwargs):
+            for chunk in super()._stream(*args, **kwargs):
+                _sleep_ms(token_ms)
+                yield chunk
+
+    return _SlowFakeChatModel(messages=repeat(AIMessage(content=answer)))
+
+
+class _FakeIndices:
+    def __init__(self, es: "FakeElasticsearch"):
+        self._es = es
+
+    def exists(self, index):
+        return index in self._es.indices_data
+
+    def create(self, index, **kwargs):
+        self._es.indices_data.setdefault(index, {})
+
+    def delete(self, index, ignore_unavailable=False):
+        self._es.indices_data.pop(index, None)
+
+    def refresh(self, index):
+        pass
+
+
+class FakeElasticsearch:
+    """Brute-force kNN (cosine) and a small BM25 over in-memory documents."""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.indices_data: dict[str, dict[str, dict]] = {}
+        self.indices = _FakeIndices(self)
+
+    def options(self, **kwargs):
+        return self
+
+    def ping(self):
+        return True
+
+    def count(self, index):
+        return {"count": len(self.indices_data.get(index, {}))}
+
+    def index_docs(self, index: str, docs: list[dict]) -> None:
+        store = self.indices_data.setdefault(index, {})
+        for doc in docs:
+            store[doc["_id"]] = doc
+
+    def _hit(self, doc: dict, score: float) -> dict:
+        return {"_id": doc["_id"], "_score": score, "_source": {"text": doc["text"], "metadata": doc["metadata"]}}
+
+    def _knn(self, docs: list[dict], knn: dict) -> list[dict]:
+        if not docs:
+            return []
+        matrix = np.asarray([d["vector"] for d in docs], dtype=np.float32)
+        query = np.asarray(knn["query_vector"], dtype=np.float32)
+        cos = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+        top = np.argsort(-cos)[: knn["k"]]
+        return [self._hit(docs[i], float((1 + cos[i]) / 2)) for i in top]
+
+    def _bm25(self, docs: list[dict], text: str, size: int, k1: float = 1.2, b: float = 0.75) -> list[dict]:
+        terms = set(_TOKEN.findall(text.lower()))
+        tokenized = [Counter(_TOKEN.findall(d["text"].lower())) for d in docs]
+        avg_len = sum(sum(t.values()) for t in tokenized) / max(len(docs), 1)
+        df = {t: sum(1 for tok in tokenized if t in tok) for t in terms}
+        scored = []
+        for doc, tok in zip(docs, tokenized):
+            length = sum(tok.values())
+            score = 0.0
+            for t in terms:
+                if tok[t]:
+                    idf = math.log(1 + (len(docs) - df[t] + 0.5) / (df[t] + 0.5))
+                    score += idf * tok[t] * (k1 + 1) / (tok[t] + k1 * (1 - b + b * length / avg_len))
+            if score > 0:
+                scored.append((score, doc))
+        scored.sort(key=lambda s: s[0], reverse=True)
+        return [self._hit(doc, score) for score, doc in scored[:size]]
+
+    def _search(self, index: str, body: dict) -> dict:
+        docs = list(self.indices_data.get(index, {}).values())
+        if "knn" in body:
+            hits = self._knn(docs, body["knn"])
+        else:
+            hits = self._bm25(docs, body["query"]["match"]["text"], body.get("size", 10))
+        return {"hits": {"hits": hits[: body.get("size", 10)]}}
+
+    def search(self, index, **body):
+        _sleep_ms(self.latency_ms)
+        return self._search(index, body)
+
+    def msearch(self, index, searches):
+        _sleep_ms(self.latency_ms)
+        return {"responses": [self._search(index, body) for body in searches[1::2]]}
+
+
+class FakeVectorStore:
+    """Write side of the ES vector store, backed by a FakeElasticsearch."""
+
+    def __init__(self, es: FakeElasticsearch, index_name: str, embeddings, write_latency_ms: float = 0.0):
+        self.client = es
+        self.index_name = index_name
+        self.embedding = embeddings
+        self.write_latency_ms = write_latency_ms
+
+    def add_embeddings(self, text_embeddings, metadatas=None, ids=None, **kwargs):
+        _sleep_ms(self.write_latency_ms)
+        docs = [
+            {"_id": doc_id, "text": text, "vector": vector, "metadata": metadata}
+            for (text, vector), metadata, doc_id in zip(text_embeddings, metadatas, ids)
+        ]
+        self.client.index_docs(self.index_name, docs)
+        return ids
+
+    def delete(self, ids=None, **kwargs):
+        store = self.client.indices_data.get(self.index_name, {})
+        for doc_id in ids or []:
+            store.pop(doc_id, None)
+        return True
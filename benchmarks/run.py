@@ -0,0 +1,346 @@
+"""Benchmark suite for the agent's hot paths.
+
+Runs fully offline by default: Elasticsearch, Ollama (embeddings + LLM) and
+DuckDuckGo are replaced by the in-process stand-ins in benchmarks/fakes.py,
+each with configurable injected latency, so numbers reflect our own code plus
+a known backend cost. --real benchmarks search, routing and the graph against
+the configured backends instead (ingestion is skipped so the live index is
+never touched). Offline runs also time dense search on the embedded index
+(src/local_index.py) in float32, int8 and IVF layouts, next to the ES numbers.
+
+Usage:
+    python -m benchmarks.run [--output bench_results.json] [--compare previous.json]
+                             [--embed-ms 20] [--es-ms 2] [--write-ms 5] [--token-ms 0] [--web-ms 50]
+                             [--queries 50] [--real]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+from benchmarks.fakes import FakeElasticsearch, FakeEmbeddings, FakeVectorStore, fake_llm
+from src.config import settings
+
+SAMPLE_QUESTIONS = [
+    "hello",
+    "thanks, bye",
+    "what's the latest news on elasticsearch",
+    "How does the booking state machine handle cancellations?",
+    "Which RLS policies apply to the guests table?",
+    "What does EMAIL_TEMPLATE_PII_COMPLIANCE cover?",
+    "How is the financial engine reconciled nightly?",
+    "Explain the canonical image model",
+]
+
+
+def _stats(samples: list[float]) -> dict:
+    """Latency summary in milliseconds from samples in seconds."""
+    ms = sorted(s * 1000 for s in samples)
+    return {
+        "n": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "p50_ms": round(ms[len(ms) // 2], 3),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+        "min_ms": round(ms[0], 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+def _timed(fn, *args, **kwargs) -> tuple[float, object]:
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+class _FakeWebSearch:
+    def __init__(self, latency_ms: float):
+        self.latency_ms = latency_ms
+
+    def invoke(self, query):
+        time.sleep(self.latency_ms / 1000)
+        return f"[Result 1] {query}\nURL: https://example.com\nSnippet: stand-in web result"
+
+    async def ainvoke(self, query):
+        return self.invoke(query)
+
+
+def install_fakes(args) -> tuple[dict, Callable[[], None]]:
+    """Route the client registry (and the web search tool) to the stand-ins. Returns (fakes, undo)."""
+    from src import clients
+    from src.agent import nodes
+
+    web_search = nodes.web_search
+
+    def undo() -> None:
+        nodes.web_search = web_search
+        clients.reset_clients()
+
+    embeddings = FakeEmbeddings(size=768, latency_ms=args.embed_ms, per_text_ms=args.embed_per_text_ms)
+    es = FakeElasticsearch(latency_ms=args.es_ms)
+    store = FakeVectorStore(es, settings.ES_INDEX_NAME, embeddings, write_latency_ms=args.write_ms)
+    clients.override_client("es", es)
+    clients.override_client("embeddings", embeddings)
+    clients.override_client(f"vector_store:{settings.ES_INDEX_NAME}", store)
+    clients.override_client("llm", fake_llm(token_ms=args.token_ms))
+    nodes.web_search = _FakeWebSearch(args.web_ms)
+    return {"es": es, "embeddings": embeddings, "store": store}, undo
+
+
+# ── Benchmarks ──
+def bench_load(data_dir: str) -> tuple[dict, list]:
+    from src.ingest.loader import LoadStats, iter_documents
+
+    stats = LoadStats()
+    elapsed, docs = _timed(lambda d: list(iter_documents(d, stats=stats)), data_dir)
+    files = len({d.metadata.get("source") for d in docs})
+    per_format = {f"files_per_sec_{fmt}": round(stats.files_per_sec(fmt), 1) for fmt in sorted(stats.files)}
+    return {"files": files, "documents": len(docs), "seconds": round(elapsed, 3),
+            "files_per_sec": round(files / elapsed, 1) if elapsed else 0.0, **per_format}, docs
+
+
+def bench_chunk(docs: list) -> tuple[dict, list]:
+    from src.ingest.loader import chunk_documents
+
+    elapsed, chunks = _timed(chunk_documents, docs)
+    return {"chunks": len(chunks), "seconds": round(elapsed, 3),
+            "chunks_per_sec": round(len(chunks) / elapsed, 1) if elapsed else 0.0}, chunks
+
+
+def bench_ingest(chunks: list, fakes: dict) -> dict:
+    from src.ingest.pipeline import run_pipeline
+
+    stats = run_pipeline(chunks, fakes["embeddings"], fakes["store"], on_committed=lambda batch: None)
+    return {
+        "chunks": stats.chunks,
+        "batches": stats.batches,
+        "seconds": round(stats.elapsed, 3),
+        "chunks_per_sec": round(stats.chunks_per_sec, 1),
+        "batches_per_sec": round(stats.batches / stats.elapsed, 2) if stats.elapsed else 0.0,
+        "retries": stats.retries,
+    }
+
+
+def bench_search(queries: list[str]) -> dict:
+    from src.tools.elastic_search import search_hits
+
+    results = {}
+    for strategy in ("dense", "bm25", "hybrid"):
+        samples, stages = [], {}
+        for query in queries:
+            elapsed, (_, timings) = _timed(search_hits, query, strategy=strategy)
+            samples.append(elapsed)
+            for stage, ms in timings.items():
+                stages.setdefault(stage, []).append(ms / 1000)
+        results[strategy] = {**_stats(samples), "stages": {k: _stats(v) for k, v in stages.items()}}
+    return results
+
+
+def bench_local_search(chunks: list, queries: list[str], k: int = 4) -> dict:
+    """Dense search against the embedded index (src/local_index.py), side by side with bench_search.
+
+    Each layout is built in a temp dir from the same chunk vectors; approximate
+    ones (int8, IVF) report recall@k against exact float32 search.
+    """
+    import math
+    import tempfile
+
+    from src import clients
+    from src.local_index import LocalVectorIndex
+    from src.tools.elastic_search import search_hits
+
+    texts = [c.page_content for c in chunks]
+    vectors = clients.get_embeddings().embed_documents(texts) if texts else []
+    nlist = max(1, int(math.sqrt(len(texts))))
+    layouts = {
+        "local_float32": {"dtype": "float32"},
+        "local_int8": {"dtype": "int8"},
+        f"local_ivf{nlist}": {"dtype": "float32", "nlist": nlist, "nprobe": max(1, nlist // 8)},
+    }
+    key = f"local_index:{settings.ES_INDEX_NAME}"
+    backend = settings.RETRIEVAL_BACKEND
+    results, exact = {}, {}
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            settings.RETRIEVAL_BACKEND = "local"
+            for name, layout in layouts.items():
+                local = LocalVectorIndex(Path(tmp) / name, **layout)
+                for start in range(0, len(texts), 500):
+                    local.add_embeddings(
+                        list(zip(texts[start:start + 500], vectors[start:start + 500])),
+                        metadatas=[c.metadata for c in chunks[start:start + 500]],
+                        ids=[str(i) for i in range(start, min(start + 500, len(texts)))],
+                    )
+                local.train()
+                clients.override_client(key, local)
+                samples, stages, found = [], {}, 0
+                for query in queries:
+                    elapsed, (hits, timings) = _timed(search_hits, query, k=k, strategy="dense")
+                    samples.append(elapsed)
+                    for stage, ms in timings.items():
+                        stages.setdefault(stage, []).append(ms / 1000)
+                    ids = {hit.id for hit in hits}
+                    found += len(ids & exact.setdefault(query, ids))
+                results[name] = {**_stats(samples), "stages": {s: _stats(v) for s, v in stages.items()},
+                                 f"recall_at_{k}": round(found / max(1, sum(len(v) for v in exact.values())), 3)}
+        finally:
+            settings.RETRIEVAL_BACKEND = backend
+            clients.reset_clients(key)
+    return results
+
+
+def bench_routing(questions: list[str], rounds: int = 200) -> dict:
+    from src.agent.nodes import route_question
+
+    samples = []
+    for _ in range(rounds):
+        for question in questions:
+            elapsed, _ = _timed(route_question, {"question": question})
+            samples.append(elapsed)
+    return _stats(samples)
+
+
+def bench_graph(questions: list[str], rounds: int = 5) -> dict:
+    """Per-node latency (nodes called directly) and graph overhead (invoke minus node time)."""
+    from src.agent import nodes
+    from src.agent.graph import _initial_state, agent_graph
+
+    path = {
+        "direct": ["route_question", "direct_response"],
+        "websearch": ["route_question", "web_search_node", "generate_with_web"],
+        "vectorstore": ["route_question", "retrieve", "grade_documents", "pack_context", "generate"],
+    }
+    per_node: dict[str, list[float]] = {}
+    overhead: dict[str, list[float]] = {}
+    for _ in range(rounds):
+        for question in questions:
+            state = _initial_state(question)
+            node_time = 0.0
+            route = nodes.route_question(state)["route"]
+            for name in path[route]:
+                elapsed, update = _timed(getattr(nodes, name), state)
+                state = {**state, **update}
+                per_node.setdefault(name, []).append(elapsed)
+                node_time += elapsed
+            if state.get("route") != route:  # grading fell back to the web
+                for name in path["websearch"][1:]:
+                    elapsed, update = _timed(getattr(nodes, name), state)
+                    state = {**state, **update}
+                    per_node.setdefault(name, []).append(elapsed)
+                    node_time += elapsed
+            graph_time, _ = _timed(agent_graph.invoke, _initial_state(question))
+            overhead.setdefault(route, []).append(max(graph_time - node_time, 0.0))
+    return {"nodes": {k: _stats(v) for k, v in per_node.items()},
+            "graph_overhead": {k: _stats(v) for k, v in overhead.items()}}
+
+
+# ── Reporting ──
+def _flatten(prefix: str, value, out: dict) -> dict:
+    if isinstance(value, dict):
+        for k, v in value.items():
+            _flatten(f"{prefix}.{k}" if prefix else k, v, out)
+    elif isinstance(value, (int, float)):
+        out[prefix] = value
+    return out
+
+
+def compare(current: dict, previous: dict, threshold: float = 0.10) -> list[str]:
+    """Lines for latency/throughput metrics that moved by more than `threshold`."""
+    now, before = _flatten("", current["results"], {}), _flatten("", previous.get("results", {}), {})
+    lines = []
+    for key, value in now.items():
+        old = before.get(key)
+        if not old or not (key.endswith("_ms") or key.endswith("_per_sec")):
+            continue
+        change = (value - old) / old
+        worse = change > 0 if key.endswith("_ms") else change < 0
+        if abs(change) >= threshold:
+            lines.append(f"{'REGRESSION' if worse else 'improved  '} {key}: {old} -> {value} ({change:+.0%})")
+    return lines
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: list[str] | None = None) -> dict:
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, retrieval and graph overhead")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="previous results JSON to diff against")
+    parser.add_argument("--data-dir", default=settings.DATA_DIR)
+    parser.add_argument("--queries", type=int, default=50, help="search queries per strategy")
+    parser.add_argument("--rounds", type=int, default=5, help="graph benchmark rounds")
+    parser.add_argument("--embed-ms", type=float, default=20.0, help="stand-in latency per embedding call")
+    parser.add_argument("--embed-per-text-ms", type=float, default=1.0, help="stand-in latency per embedded text")
+    parser.add_argument("--es-ms", type=float, default=2.0, help="stand-in latency per ES search")
+    parser.add_argument("--write-ms", type=float, default=5.0, help="stand-in latency per bulk write")
+    parser.add_argument("--token-ms", type=float, default=0.0, help="stand-in LLM latency per token")
+    parser.add_argument("--web-ms", type=float, default=50.0, help="stand-in web search latency")
+    parser.add_argument("--real", action="store_true", help="use the configured ES/Ollama/web backends")
+    args = parser.parse_args(argv)
+
+    fakes, undo = (None, lambda: None) if args.real else install_fakes(args)
+    answer_cache = settings.ANSWER_CACHE_ENABLED
+    settings.ANSWER_CACHE_ENABLED = False
+    results: dict = {}
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.ExitStack() as restore:
+        restore.callback(undo)
+        restore.callback(setattr, settings, "ANSWER_CACHE_ENABLED", answer_cache)
+        if args.real:
+            from src.warmup import warmup
+
+            results["warmup"] = warmup()  # cold start reported separately from the warm runs below
+        results["load_documents"], docs = bench_load(args.data_dir)
+        results["chunk_documents"], chunks = bench_chunk(docs)
+        if fakes:
+            results["ingest"] = bench_ingest(chunks, fakes)
+        stems = sorted({Path(d.metadata.get("source", "")).stem for d in docs})
+        queries = ([s.replace("_", " ").lower() for s in stems] + stems)[: args.queries] or SAMPLE_QUESTIONS
+        results["search_knowledge_base"] = bench_search(queries)
+        if fakes:
+            results["local_index_search"] = bench_local_search(chunks, queries)
+        results["route_question"] = bench_routing(SAMPLE_QUESTIONS)
+        results["graph"] = bench_graph(SAMPLE_QUESTIONS, rounds=args.rounds)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mode": "real" if args.real else "offline",
+            "injected_latency_ms": None if args.real else {
+                "embed": args.embed_ms, "embed_per_text": args.embed_per_text_ms, "es": args.es_ms,
+                "write": args.write_ms, "token": args.token_ms, "web": args.web_ms,
+            },
+            "settings": {k: getattr(settings, k) for k in (
+                "CHUNK_SIZE", "CHUNK_OVERLAP", "RETRIEVAL_BACKEND", "RETRIEVAL_STRATEGY", "RETRIEVAL_K", "RETRIEVAL_NUM_CANDIDATES",
+                "INGEST_BATCH_SIZE", "INGEST_EMBED_CONCURRENCY", "INGEST_WRITE_CONCURRENCY",
+            )},
+        },
+        "results": results,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(json.dumps(results, indent=2))
+    print(f"\nWrote {args.output}", file=sys.stderr)
+
+    if args.compare:
+        lines = compare(report, json.loads(Path(args.compare).read_text()))
+        print("\n".join(lines) or "No changes beyond 10%", file=sys.stderr)
+    return report
+
+
+if __name__ == "__main__":
+    main()
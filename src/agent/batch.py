@@ -0,0 +1,151 @@
+"""Run many questions through the agent concurrently (offline evaluation).
+
+Usage:
+    python -m src.agent.batch questions.jsonl results.jsonl [--max-concurrency 4] [--metrics metrics.prom]
+
+Each input line is {"question": "...", "id": optional, ...}; any extra fields
+are copied to the output. Each output line carries the route, generation,
+documents, web results, timings and error (if any). Results are written as
+they complete, so a partial run still leaves usable output.
+
+Questions run as asyncio tasks on `arun_agent`, sharing the pooled clients;
+LLM calls are additionally capped at OLLAMA_MAX_CONCURRENCY.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+from typing import Callable, Iterable
+
+from src.agent.graph import arun_agent
+from src.config import settings
+from src.observability import write_metrics
+from src.warmup import warmup
+
+
+def _record(item: dict, result: dict | None, error: Exception | None, elapsed: float) -> dict:
+    result = result or {}
+    return {
+        **{k: v for k, v in item.items() if k != "question"},
+        "question": item["question"],
+        "route": result.get("route", "error" if error else ""),
+        "generation": result.get("generation", ""),
+        "documents": result.get("documents", []),
+        "web_results": result.get("web_results", []),
+        "cache_hit": result.get("cache_hit"),
+        "timings": {"total_s": round(elapsed, 3)},
+        "error": f"{type(error).__name__}: {error}" if error else None,
+    }
+
+
+def summarize(records: list[dict], wall_seconds: float) -> dict:
+    """Aggregate throughput and latency for a finished batch."""
+    latencies = sorted(r["timings"]["total_s"] for r in records)
+    return {
+        "questions": len(records),
+        "errors": sum(1 for r in records if r["error"]),
+        "routes": dict(Counter(r["route"] for r in records)),
+        "wall_s": round(wall_seconds, 3),
+        "questions_per_min": round(60 * len(records) / wall_seconds, 2) if wall_seconds else 0.0,
+        "latency_mean_s": round(statistics.fmean(latencies), 3) if latencies else 0.0,
+        "latency_p50_s": round(latencies[len(latencies) // 2], 3) if latencies else 0.0,
+        "latency_p95_s": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else 0.0,
+    }
+
+
+async def arun_agent_batch(
+    questions: Iterable[str | dict],
+    max_concurrency: int | None = None,
+    use_cache: bool = False,
+    on_result: Callable[[dict], None] | None = None,
+    quiet: bool = True,
+) -> tuple[list[dict], dict]:
+    """Answer questions with at most `max_concurrency` in flight.
+
+    Returns (records in input order, summary). `on_result` is called as each
+    record completes. The answer cache is off by default so every question is
+    actually evaluated. With quiet=True the per-node progress prints are dropped.
+    """
+    items = [q if isinstance(q, dict) else {"question": q} for q in questions]
+    semaphore = asyncio.Semaphore(max_concurrency or settings.BATCH_MAX_CONCURRENCY)
+    records: list[dict | None] = [None] * len(items)
+
+    async def _one(i: int, item: dict) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            result, error = None, None
+            try:
+                result = await arun_agent(item["question"], use_cache=use_cache)
+            except Exception as e:
+                error = e
+            records[i] = _record(item, result, error, time.perf_counter() - started)
+            if on_result:
+                on_result(records[i])
+
+    started = time.perf_counter()
+    # Progress lines go to the null device rather than a buffer, which would grow with the batch
+    with contextlib.ExitStack() as stack:
+        if quiet:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        await asyncio.gather(*(_one(i, item) for i, item in enumerate(items)))
+    return records, summarize(records, time.perf_counter() - started)
+
+
+def run_agent_batch(questions: Iterable[str | dict], max_concurrency: int | None = None, **kwargs) -> tuple[list[dict], dict]:
+    """Synchronous wrapper around `arun_agent_batch`."""
+    return asyncio.run(arun_agent_batch(questions, max_concurrency=max_concurrency, **kwargs))
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions with the agent")
+    parser.add_argument("questions", help="input JSONL, one {\"question\": ...} per line")
+    parser.add_argument("results", help="output JSONL")
+    parser.add_argument("--max-concurrency", type=int, default=settings.BATCH_MAX_CONCURRENCY)
+    parser.add_argument("--use-cache", action="store_true", help="allow answers from the answer cache")
+    parser.add_argument("--verbose", action="store_true", help="keep per-node progress output")
+    parser.add_argument("--metrics", help="enable tracing and write Prometheus metrics to this file")
+    parser.add_argument("--no-warmup", action="store_true", help="skip preloading the models")
+    args = parser.parse_args(argv)
+    if args.metrics:
+        settings.TRACING_ENABLED = True
+
+    with open(args.questions, encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+
+    # Load the models first so cold-start time is reported on its own, not in question latencies
+    warmup_report = None
+    if settings.WARMUP_ON_START and not args.no_warmup:
+        with contextlib.redirect_stdout(sys.stderr):
+            warmup_report = warmup()
+
+    with open(args.results, "w", encoding="utf-8") as out:
+        done = 0
+
+        def _write(record: dict) -> None:
+            nonlocal done
+            done += 1
+            out.write(json.dumps(record, default=str) + "\n")
+            out.flush()
+            status = "ERROR" if record["error"] else record["route"]
+            print(f"[{done}/{len(items)}] {status:<11} {record['timings']['total_s']:>7.1f}s  {record['question'][:60]}",
+                  file=sys.stderr)
+
+        _, summary = run_agent_batch(
+            items, max_concurrency=args.max_concurrency, use_cache=args.use_cache,
+            on_result=_write, quiet=not args.verbose,
+        )
+
+    print(json.dumps({**summary, "warmup": warmup_report}, indent=2), file=sys.stderr)
+    if args.metrics:
+        write_metrics(args.metrics)
+        print(f"Metrics written to {args.metrics}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
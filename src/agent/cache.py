@@ -0,0 +1,148 @@
+"""Semantic answer cache in front of the agent graph.
+
+Repeated questions are answered without a retrieve or an LLM call:
+  - exact hits on the normalized question return immediately
+  - near-duplicates ("what is RRF?" vs "what's RRF") hit when the cosine
+    similarity of their query embeddings clears ANSWER_CACHE_SIMILARITY
+
+Entries are LRU- and TTL-bounded, TTLs are set per route (websearch answers
+about current events are never cached), and everything is dropped when the
+knowledge-base ingest generation changes.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+
+from src.config import settings
+from src.ingest.manifest import current_generation
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?!. ")
+
+
+def _default_embed(text: str) -> list[float]:
+    from src.clients import get_embeddings
+
+    return get_embeddings().embed_query(text)
+
+
+def _default_generation() -> int:
+    return current_generation(settings.INGEST_MANIFEST_PATH)
+
+
+class AnswerCache:
+    """Thread-safe LRU/TTL cache of agent results keyed by question."""
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        similarity: float = 0.95,
+        route_ttls: dict[str, float] | None = None,
+        embed: Callable[[str], list[float]] = _default_embed,
+        generation: Callable[[], int] = _default_generation,
+    ):
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.route_ttls = route_ttls if route_ttls is not None else {}
+        self._embed = embed
+        self._generation = generation
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._index: tuple[list[str], np.ndarray] | None = None  # keys + stacked unit vectors
+        self._lock = threading.Lock()
+        self._seen_generation: int | None = None
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+
+    def _vector(self, question: str) -> np.ndarray | None:
+        try:
+            vector = np.asarray(self._embed(question), dtype=np.float32)
+        except Exception:
+            return None  # Ollama unavailable — fall back to exact matching only
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _check_generation(self) -> None:
+        generation = self._generation()
+        if generation != self._seen_generation:
+            self._entries.clear()
+            self._index = None
+            self._seen_generation = generation
+
+    def _expire(self) -> None:
+        now = time.time()
+        expired = [key for key, entry in self._entries.items() if entry["expires_at"] <= now]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._index = None
+
+    def _semantic_match(self, vector: np.ndarray) -> str | None:
+        if self._index is None:
+            keys = [key for key, entry in self._entries.items() if entry["vector"] is not None]
+            if not keys:
+                return None
+            self._index = (keys, np.stack([self._entries[key]["vector"] for key in keys]))
+        keys, matrix = self._index
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.similarity else None
+
+    def lookup(self, question: str) -> dict | None:
+        """Return a cached result (with `cache_hit` set to "exact" or "semantic") or None."""
+        key = normalize_question(question)
+        with self._lock:
+            self._check_generation()
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits["exact"] += 1
+                return {**entry["result"], "cache_hit": "exact"}
+        # Embed outside the lock; the same query embedding is reused by retrieval via the embedding cache
+        vector = self._vector(question)
+        with self._lock:
+            match = self._semantic_match(vector) if vector is not None else None
+            if match is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(match)
+            self.hits["semantic"] += 1
+            return {**self._entries[match]["result"], "cache_hit": "semantic"}
+
+    def store(self, question: str, result: dict) -> bool:
+        """Cache a result if its route's policy allows it. Returns True if stored."""
+        ttl = self.route_ttls.get(result.get("route", ""), 0)
+        if ttl <= 0 or not result.get("generation"):
+            return False
+        vector = self._vector(question)
+        key = normalize_question(question)
+        with self._lock:
+            self._check_generation()
+            self._entries[key] = {"result": dict(result), "vector": vector, "expires_at": time.time() + ttl}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._index = None
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._index = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+answer_cache = AnswerCache(
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    similarity=settings.ANSWER_CACHE_SIMILARITY,
+    route_ttls=settings.ANSWER_CACHE_ROUTE_TTLS,
+)
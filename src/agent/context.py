@@ -0,0 +1,146 @@
+"""Context assembly between retrieval and generation.
+
+Retrieved chunks are packed into the KB prompt in three steps:
+  1. merge: chunks of the same source (and page) that overlap or touch by
+     `start_index` are stitched into one passage, so CHUNK_OVERLAP text is
+     sent once instead of twice
+  2. diversify: passages are ordered by maximal marginal relevance (MMR),
+     trading retrieval score against lexical similarity to passages already
+     picked, so near-duplicates from different files don't crowd out others
+  3. pack: passages are added in MMR order until CONTEXT_TOKEN_BUDGET is
+     reached
+
+Token counts are estimated from characters (no tokenizer round-trip); the
+stats returned alongside the context record how many were saved versus
+joining every retrieved chunk verbatim.
+"""
+
+import re
+from collections import Counter
+
+import numpy as np
+
+CHARS_PER_TOKEN = 4  # rough average for English text with llama-family tokenizers
+DOC_SEPARATOR = "\n\n---\n\n"
+
+_WORD = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _doc_header(i: int, hit: dict) -> str:
+    return f"[Doc {i}] (source: {hit['source']})\n"
+
+
+def format_context(hits: list[dict]) -> str:
+    """Same layout as the search tool's formatted output."""
+    return DOC_SEPARATOR.join(_doc_header(i, h) + h["text"] for i, h in enumerate(hits, 1))
+
+
+def merge_overlapping(hits: list[dict], max_gap: int = 1) -> list[dict]:
+    """Stitch same-source chunks whose character spans overlap or are at most `max_gap` apart.
+
+    Hits without a `start_index` are kept as they are; exact duplicate texts are dropped.
+    The merged passage keeps the best score of its parts.
+    """
+    groups: dict[tuple, list[dict]] = {}
+    passages, seen_texts = [], set()
+    for hit in hits:
+        if hit["text"] in seen_texts:
+            continue
+        seen_texts.add(hit["text"])
+        start = hit.get("metadata", {}).get("start_index")
+        if start is None:
+            passages.append(dict(hit))
+        else:
+            groups.setdefault((hit["source"], hit["metadata"].get("page")), []).append(hit)
+
+    for group in groups.values():
+        group.sort(key=lambda h: h["metadata"]["start_index"])
+        current = dict(group[0], metadata=dict(group[0]["metadata"]))
+        end = current["metadata"]["start_index"] + len(current["text"])
+        for hit in group[1:]:
+            start = hit["metadata"]["start_index"]
+            if start - end <= max_gap:
+                overlap = end - start
+                if overlap >= 0:
+                    current["text"] += hit["text"][overlap:]
+                else:
+                    current["text"] += "\n" + hit["text"]
+                current["score"] = max(current["score"], hit["score"])
+                end = max(end, start + len(hit["text"]))
+            else:
+                passages.append(current)
+                current = dict(hit, metadata=dict(hit["metadata"]))
+                end = start + len(hit["text"])
+        passages.append(current)
+    return passages
+
+
+def _term_matrix(texts: list[str]) -> np.ndarray:
+    """Unit-normalized term-frequency vectors over the passages' shared vocabulary."""
+    counts = [Counter(_WORD.findall(t.lower())) for t in texts]
+    vocab = {term: i for i, term in enumerate({term for c in counts for term in c})}
+    matrix = np.zeros((len(texts), max(len(vocab), 1)), dtype=np.float32)
+    for row, c in enumerate(counts):
+        for term, n in c.items():
+            matrix[row, vocab[term]] = n
+    return matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12)
+
+
+def mmr_order(passages: list[dict], lambda_mult: float = 0.7) -> list[dict]:
+    """Order passages by maximal marginal relevance: λ·relevance − (1−λ)·max similarity to those picked."""
+    if len(passages) <= 1:
+        return list(passages)
+    scores = np.asarray([p["score"] for p in passages], dtype=np.float32)
+    spread = scores.max() - scores.min()
+    relevance = (scores - scores.min()) / spread if spread else np.ones_like(scores)
+    similarity = _term_matrix([p["text"] for p in passages])
+    similarity = similarity @ similarity.T
+
+    selected: list[int] = []
+    remaining = list(range(len(passages)))
+    while remaining:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        mmr = lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy
+        selected.append(remaining.pop(int(np.argmax(mmr))))
+    return [passages[i] for i in selected]
+
+
+def assemble_context(hits: list[dict], token_budget: int, lambda_mult: float = 0.7) -> tuple[str, dict]:
+    """Merge, diversify and pack hits into at most `token_budget` (estimated) tokens.
+
+    Returns (context, stats). If even the best passage exceeds the budget it is
+    truncated rather than dropped, so there is always some context.
+    """
+    raw_tokens = estimate_tokens(format_context(hits))
+    passages = mmr_order(merge_overlapping(hits), lambda_mult)
+
+    packed: list[dict] = []
+    used = 0
+    for passage in passages:
+        header = estimate_tokens(_doc_header(len(packed) + 1, passage) + DOC_SEPARATOR)
+        cost = header + estimate_tokens(passage["text"])
+        if used + cost <= token_budget:
+            packed.append(passage)
+            used += cost
+        elif not packed:
+            packed.append(dict(passage, text=passage["text"][: max(token_budget - header, 0) * CHARS_PER_TOKEN]))
+            break
+
+    context = format_context(packed)
+    context_tokens = estimate_tokens(context)
+    stats = {
+        "hits": len(hits),
+        "passages": len(passages),
+        "packed": len(packed),
+        "raw_tokens": raw_tokens,
+        "context_tokens": context_tokens,
+        "tokens_saved": max(raw_tokens - context_tokens, 0),
+    }
+    return context, stats
@@ -1,47 +1,192 @@
 """LangGraph StateGraph workflow definition.
+
+Without a session_id every call starts from empty state. With one, the call
+is a turn of that session's thread, checkpointed in SQLite, and prompts see
+the bounded conversation history (src/agent/memory.py).
+
 Usage: python -m src.agent.graph
 """
+import asyncio
+import functools
+import time
+from collections.abc import Iterator
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
 from langgraph.graph import END, StateGraph
-from src.agent.nodes import direct_response, generate, generate_with_web, grade_documents, retrieve, route_question, web_search_node
+from src.agent.cache import answer_cache
+from src.agent import nodes
+from src.agent.memory import get_checkpointer, thread_config
+from src.agent.nodes import calculate, direct_response, generate, generate_with_web, grade_documents, pack_context, remember, retrieve, route_question, web_search_node
 from src.agent.state import AgentState
+from src.config import settings
+from src.observability import span, traced
+from src.tools.calculator import arithmetic_expression
 
 def _route_after_question(state):
     route = state.get("route", "direct")
     if route == "vectorstore": return "retrieve"
     elif route == "websearch": return "web_search"
+    elif route == "calculate": return "calculate"
     else: return "direct_response"
 
 def _route_after_grading(state):
-    if state.get("documents"): return "generate"
+    if state.get("documents"): return "pack_context"
     else: return "web_search"
 
-def build_graph():
+def build_graph(use_async: bool = False, speculative: bool = False, checkpointer=None):
+    """Compile the workflow. use_async swaps in the async nodes; speculative (async only)
+    starts the web search alongside KB retrieval; a checkpointer makes runs resumable threads."""
+    if use_async:
+        impl = {"route_question": nodes.aroute_question, "retrieve": nodes.aretrieve_speculative if speculative else nodes.aretrieve,
+                "grade_documents": nodes.agrade_documents, "pack_context": nodes.apack_context, "generate": nodes.agenerate, "web_search": nodes.aweb_search_node,
+                "generate_with_web": nodes.agenerate_with_web, "direct_response": nodes.adirect_response, "calculate": nodes.acalculate, "remember": nodes.aremember}
+    else:
+        impl = {"route_question": route_question, "retrieve": retrieve, "grade_documents": grade_documents, "pack_context": pack_context, "generate": generate,
+                "web_search": web_search_node, "generate_with_web": generate_with_web, "direct_response": direct_response, "calculate": calculate, "remember": remember}
     workflow = StateGraph(AgentState)
-    workflow.add_node("route_question", route_question)
-    workflow.add_node("retrieve", retrieve)
-    workflow.add_node("grade_documents", grade_documents)
-    workflow.add_node("generate", generate)
-    workflow.add_node("web_search", web_search_node)
-    workflow.add_node("generate_with_web", generate_with_web)
-    workflow.add_node("direct_response", direct_response)
+    for name, node in impl.items():
+        workflow.add_node(name, traced(f"node.{name}", nodes.span_attributes)(node))
     workflow.set_entry_point("route_question")
-    workflow.add_conditional_edges("route_question", _route_after_question, {"retrieve": "retrieve", "web_search": "web_search", "direct_response": "direct_response"})
+    workflow.add_conditional_edges("route_question", _route_after_question, {"retrieve": "retrieve", "web_search": "web_search", "direct_response": "direct_response", "calculate": "calculate"})
     workflow.add_edge("retrieve", "grade_documents")
-    workflow.add_conditional_edges("grade_documents", _route_after_grading, {"generate": "generate", "web_search": "web_search"})
+    workflow.add_conditional_edges("grade_documents", _route_after_grading, {"pack_context": "pack_context", "web_search": "web_search"})
+    workflow.add_edge("pack_context", "generate")
     workflow.add_edge("web_search", "generate_with_web")
-    workflow.add_edge("generate_with_web", END)
-    workflow.add_edge("generate", END)
-    workflow.add_edge("direct_response", END)
-    return workflow.compile()
+    for answered in ("generate_with_web", "generate", "direct_response", "calculate"):
+        workflow.add_edge(answered, "remember")
+    workflow.add_edge("remember", END)
+    return workflow.compile(checkpointer=checkpointer)
 
 agent_graph = build_graph()
+async_agent_graph = build_graph(use_async=True, speculative=settings.SPECULATIVE_WEB_SEARCH)
+
+@functools.cache
+def _session_graph(use_async: bool):
+    return build_graph(use_async=use_async, speculative=use_async and settings.SPECULATIVE_WEB_SEARCH,
+                       checkpointer=get_checkpointer())
+
+def _graph_for(session_id: str | None, use_async: bool = False) -> tuple:
+    """(graph, config) for a stateless call or for a turn of the session's thread."""
+    if session_id is None:
+        return (async_agent_graph if use_async else agent_graph), None
+    return _session_graph(use_async), thread_config(session_id)
+
+def _record_cached_turn(graph, config, question: str, result: dict) -> None:
+    # Keep the thread's history complete when the answer came from the cache
+    graph.update_state(config, {"messages": [HumanMessage(question), AIMessage(result["generation"])]}, as_node="remember")
+
+# Nodes whose LLM tokens are forwarded by stream_agent()
+STREAMING_NODES = {"generate", "generate_with_web", "direct_response"}
+
+def _use_cache(question: str, use_cache: bool | None) -> bool:
+    # Arithmetic is answered faster than the cache lookup's query embedding
+    use_cache = settings.ANSWER_CACHE_ENABLED if use_cache is None else use_cache
+    return use_cache and not (settings.CALCULATOR_ROUTE_ENABLED and arithmetic_expression(question))
+
+def _initial_state(question: str) -> dict:
+    # summary / last_retrieval are left out so a session thread carries them over
+    return {"question": question, "generation": "", "documents": [], "hits": [], "web_results": [], "route": "", "retry_count": 0,
+            "messages": [HumanMessage(question)]}
+
+def _first_turn(graph, config) -> bool:
+    # The answer cache is keyed by question alone, so only a thread's first turn may use it
+    values = graph.get_state(config).values
+    return not (values.get("messages") or values.get("summary"))
 
-def run_agent(question: str) -> dict:
+def _end_turn(session_id: str | None) -> None:
+    if session_id is not None:
+        get_checkpointer().prune([session_id])  # only the latest checkpoint is ever read
+
+def run_agent(question: str, use_cache: bool | None = None, session_id: str | None = None) -> dict:
+    graph, config = _graph_for(session_id)
+    use_cache = _use_cache(question, use_cache) and (config is None or _first_turn(graph, config))
+    print(f"\n{'='*50}\nQuestion: {question}\n{'='*50}")
+    with span("agent.run", question_chars=len(question)) as root:
+        if use_cache and (cached := answer_cache.lookup(question)):
+            print(f"--- CACHE: {cached['cache_hit']} hit ---\n{'='*50}\n")
+            root.set(route=cached["route"], cache_hit=cached["cache_hit"])
+            if config:
+                _record_cached_turn(graph, config, question, cached)
+                _end_turn(session_id)
+            return cached
+        result = graph.invoke(_initial_state(question), config)
+        root.set(route=result.get("route"), cache_hit=None)
+    _end_turn(session_id)
+    if use_cache:
+        answer_cache.store(question, result)
+    print(f"{'='*50}\n")
+    return result
+
+async def arun_agent(question: str, use_cache: bool | None = None, session_id: str | None = None) -> dict:
+    """Async counterpart of run_agent, running the async nodes (speculative if SPECULATIVE_WEB_SEARCH)."""
+    graph, config = _graph_for(session_id, use_async=True)
+    use_cache = _use_cache(question, use_cache) and (config is None or await asyncio.to_thread(_first_turn, graph, config))
     print(f"\n{'='*50}\nQuestion: {question}\n{'='*50}")
-    result = agent_graph.invoke({"question": question, "generation": "", "documents": [], "web_results": [], "route": "", "retry_count": 0, "messages": []})
+    with span("agent.arun", question_chars=len(question)) as root:
+        if use_cache and (cached := await asyncio.to_thread(answer_cache.lookup, question)):
+            print(f"--- CACHE: {cached['cache_hit']} hit ---\n{'='*50}\n")
+            root.set(route=cached["route"], cache_hit=cached["cache_hit"])
+            if config:
+                await asyncio.to_thread(_record_cached_turn, graph, config, question, cached)
+                await asyncio.to_thread(_end_turn, session_id)
+            return cached
+        result = await graph.ainvoke(_initial_state(question), config)
+        root.set(route=result.get("route"), cache_hit=None)
+    await asyncio.to_thread(_end_turn, session_id)
+    if use_cache:
+        await asyncio.to_thread(answer_cache.store, question, result)
     print(f"{'='*50}\n")
     return result
 
+def stream_agent(question: str, use_cache: bool | None = None, session_id: str | None = None) -> Iterator[dict]:
+    """Run the agent, yielding answer tokens as they are decoded.
+
+    Yields {"type": "token", "content": str, "node": str} events, then one
+    {"type": "result", "result": dict} with the final state. The result's
+    "timings" holds time-to-first-token (the headline latency) and total time.
+    """
+    graph, config = _graph_for(session_id)
+    use_cache = _use_cache(question, use_cache) and (config is None or _first_turn(graph, config))
+    print(f"\n{'='*50}\nQuestion: {question}\n{'='*50}")
+    started = time.perf_counter()
+    if use_cache and (cached := answer_cache.lookup(question)):
+        print(f"--- CACHE: {cached['cache_hit']} hit ---")
+        if config:
+            _record_cached_turn(graph, config, question, cached)
+            _end_turn(session_id)
+        yield {"type": "token", "content": cached["generation"], "node": "cache"}
+        elapsed = time.perf_counter() - started
+        yield {"type": "result", "result": {**cached, "timings": {"ttft_s": elapsed, "total_s": elapsed}}}
+        return
+
+    ttft = None
+    result: dict = {}
+    with span("agent.stream", question_chars=len(question)) as root:
+        for mode, payload in graph.stream(_initial_state(question), config, stream_mode=["messages", "values"]):
+            if mode == "values":
+                result = payload
+                continue
+            chunk, metadata = payload
+            # Only live token chunks; the node's final AIMessage state update is emitted here too
+            if isinstance(chunk, AIMessageChunk) and metadata.get("langgraph_node") in STREAMING_NODES and chunk.content:
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                    print(f"   Time to first token: {ttft:.2f}s")
+                    root.set(ttft_ms=round(ttft * 1000, 3))
+                yield {"type": "token", "content": chunk.content, "node": metadata["langgraph_node"]}
+        root.set(route=result.get("route"))
+    _end_turn(session_id)
+
+    if ttft is None and result.get("generation"):  # answered without an LLM (calculate)
+        ttft = time.perf_counter() - started
+        yield {"type": "token", "content": result["generation"], "node": result.get("route", "")}
+    total = time.perf_counter() - started
+    result = {**result, "timings": {"ttft_s": ttft if ttft is not None else total, "total_s": total}}
+    if use_cache:
+        answer_cache.store(question, result)
+    print(f"   Total: {total:.2f}s\n{'='*50}\n")
+    yield {"type": "result", "result": result}
+
 if __name__ == "__main__":
     result = run_agent("Hello, what can you help me with?")
     print(f"Response: {result['generation']}")
@@ -0,0 +1,183 @@
+"""Per-session conversation memory.
+
+A conversation is a LangGraph thread: given a `session_id`, `run_agent`,
+`arun_agent` and `stream_agent` run a graph compiled with a SQLite
+checkpointer (MEMORY_CHECKPOINT_PATH), so every turn starts from the
+thread's saved state. Only the latest checkpoint per thread is kept.
+
+History is bounded. After every turn the `remember` node keeps at most
+MEMORY_WINDOW_TURNS recent turns as messages and folds older ones into a
+running summary: an extractive one-line digest per turn (question plus the
+answer's first sentence, no extra LLM call), oldest lines dropped beyond
+MEMORY_SUMMARY_TOKENS. Turns keep being folded until summary and window fit
+MEMORY_TOKEN_BUDGET, which is what the generation prompts receive.
+
+The thread also keeps the previous turn's graded KB hits. A follow-up whose
+embedding is within MEMORY_REUSE_SIMILARITY of the question that retrieved
+them reuses them instead of searching Elasticsearch again.
+"""
+
+import asyncio
+import re
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from src.agent.context import estimate_tokens
+from src.config import settings
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+DIGEST_CHARS = 160  # per question / answer in a summary line
+
+
+class ThreadedSqliteSaver(SqliteSaver):
+    """SqliteSaver whose async methods run the sync ones in a worker thread, so the async graph can share it.
+
+    Also implements `prune`, which SqliteSaver leaves out.
+    """
+
+    def prune(self, thread_ids, *, strategy="keep_latest"):
+        """Keep only each namespace's latest checkpoint (IDs sort by time) and its writes; "delete" drops the threads."""
+        if strategy == "delete":
+            for thread_id in thread_ids:
+                self.delete_thread(thread_id)
+            return
+        with self.cursor() as cur:
+            for thread_id in map(str, thread_ids):
+                latest = "SELECT MAX(checkpoint_id) FROM checkpoints c WHERE c.thread_id = t.thread_id AND c.checkpoint_ns = t.checkpoint_ns"
+                cur.execute(f"DELETE FROM checkpoints AS t WHERE thread_id = ? AND checkpoint_id < ({latest})", (thread_id,))
+                cur.execute(f"DELETE FROM writes AS t WHERE thread_id = ? AND checkpoint_id < ({latest})", (thread_id,))
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    async def aprune(self, thread_ids, *, strategy="keep_latest"):
+        await asyncio.to_thread(self.prune, thread_ids, strategy=strategy)
+
+
+_checkpointer: ThreadedSqliteSaver | None = None
+_checkpointer_lock = threading.Lock()
+
+
+def get_checkpointer() -> ThreadedSqliteSaver:
+    """Process-wide checkpointer on MEMORY_CHECKPOINT_PATH (one SQLite connection)."""
+    global _checkpointer
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            path = Path(settings.MEMORY_CHECKPOINT_PATH)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            _checkpointer = ThreadedSqliteSaver(sqlite3.connect(path, check_same_thread=False))
+        return _checkpointer
+
+
+def thread_config(session_id: str) -> dict:
+    return {"configurable": {"thread_id": session_id}}
+
+
+def _turns(messages: list[BaseMessage]) -> list[list[BaseMessage]]:
+    """Group messages into turns: a question and the answer that followed it, if any."""
+    turns: list[list[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def _clip(text: str, limit: int = DIGEST_CHARS) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+def _digest(turn: list[BaseMessage]) -> str:
+    question = next((m.content for m in turn if isinstance(m, HumanMessage)), "")
+    answer = next((m.content for m in turn if isinstance(m, AIMessage)), "")
+    first_sentence = _SENTENCE_END.split(answer.strip(), maxsplit=1)[0] if answer else "(no answer)"
+    return f"- {_clip(question)} → {_clip(first_sentence)}"
+
+
+def _render(turns: list[list[BaseMessage]]) -> str:
+    lines = []
+    for turn in turns:
+        for message in turn:
+            lines.append(f"{'User' if isinstance(message, HumanMessage) else 'Assistant'}: {message.content}")
+    return "\n".join(lines)
+
+
+def compact(
+    messages: list[BaseMessage],
+    summary: str,
+    window_turns: int | None = None,
+    token_budget: int | None = None,
+    summary_tokens: int | None = None,
+) -> tuple[list[str], str]:
+    """Fold turns beyond the window (or the token budget) into the summary.
+
+    Returns (IDs of the messages to remove, new summary). The latest turn is always kept.
+    """
+    window_turns = settings.MEMORY_WINDOW_TURNS if window_turns is None else window_turns
+    token_budget = settings.MEMORY_TOKEN_BUDGET if token_budget is None else token_budget
+    summary_tokens = settings.MEMORY_SUMMARY_TOKENS if summary_tokens is None else summary_tokens
+
+    turns = _turns(messages)
+    evicted = turns[:max(0, len(turns) - max(window_turns, 1))]
+    kept = turns[len(evicted):]
+    while True:
+        lines = [line for line in summary.splitlines() if line] + [_digest(turn) for turn in evicted]
+        while lines and estimate_tokens("\n".join(lines)) > summary_tokens:
+            lines.pop(0)
+        new_summary = "\n".join(lines)
+        if len(kept) <= 1 or estimate_tokens(_render(kept)) + estimate_tokens(new_summary) <= token_budget:
+            break
+        evicted.append(kept.pop(0))
+    return [m.id for turn in evicted for m in turn if m.id], new_summary
+
+
+def history_text(state: dict) -> str:
+    """Summary plus recent turns for the prompt ("" on a fresh conversation); excludes the question being answered."""
+    messages = list(state.get("messages", []))
+    if messages and isinstance(messages[-1], HumanMessage):
+        messages.pop()
+    summary = state.get("summary", "")
+    if not messages and not summary:
+        return ""
+    parts = ["Conversation so far:"]
+    if summary:
+        parts.append(f"Earlier turns:\n{summary}")
+    if messages:
+        parts.append(_render(_turns(messages)))
+    return "\n".join(parts) + "\n\n"
+
+
+def _default_embed(text: str) -> list[float]:
+    from src.clients import get_embeddings
+
+    return get_embeddings().embed_query(text)
+
+
+def topic_similarity(question: str, previous_question: str, embed=_default_embed) -> float:
+    """Cosine similarity of two questions' (disk-cached) embeddings; 0.0 if embedding fails."""
+    try:
+        a, b = np.asarray(embed(question)), np.asarray(embed(previous_question))
+    except Exception:
+        return 0.0
+    return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-12))
@@ -4,29 +4,167 @@ Each node takes AgentState, performs an action, and returns a partial state upda
 
 Routing strategy: default to knowledge base search (vectorstore) since we have
 thousands of chunks of real data. Only route to "direct" for simple greetings,
-and to "websearch" for current events. Skip LLM grading = only 1 LLM call per question.
+and to "websearch" for current events. Grading uses retrieval scores, not the LLM = only 1 LLM call per question.
+Plain arithmetic questions take the "calculate" route and are answered by the
+bounded evaluator in src/tools/calculator.py with no LLM call at all.
+
+With a session (see src/agent/memory.py), generation prompts also get the
+bounded conversation history, the `remember` node compacts it after every
+turn, and on-topic follow-ups reuse the previous turn's KB hits.
+
+Every node has an async twin (a-prefixed) used by `arun_agent()`. In speculative
+mode, `aretrieve_speculative` starts the web search alongside the KB search and
+cancels it if the KB results pass grading, so a KB miss costs max(KB, web)
+instead of KB + web.
 """
 
-import platform
-from langchain_core.messages import AIMessage
+import asyncio
+import threading
+import time
+from dataclasses import asdict
+
+from langchain_core.messages import AIMessage, RemoveMessage, ToolMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_ollama import ChatOllama
 
+from src.agent.context import assemble_context, format_context
+from src.agent.memory import compact, history_text, topic_similarity
+from src.agent.router import semantic_router
+from src.clients import allm_slot, get_llm, llm_slot
 from src.config import settings
+from src.observability import count, observe, span
+from src.tools.calculator import arithmetic_expression, evaluate_to_text
 from src.tools.elastic_search import search_knowledge_base
-from src.tools.web_search import web_search
-
-
-def _get_llm() -> ChatOllama:
-    """Create the ChatOllama LLM instance with arch-aware settings."""
-    is_intel = platform.machine() == "x86_64"
-    return ChatOllama(
-        model=settings.LLM_MODEL,
-        base_url=settings.OLLAMA_BASE_URL,
-        temperature=0,
-        num_predict=256 if is_intel else 512,
-        timeout=120 if is_intel else 60,
-    )
+from src.tools.web_search import cancel_event, web_search
+
+
+# Ollama reports a few ms of load_duration for a resident model; more means it was (re)loaded
+COLD_LOAD_MS = 500
+
+
+def _stream_llm(chain, inputs: dict):
+    """Run an LLM chain token by token and return the aggregated message.
+
+    Streaming (rather than invoke) lets `stream_agent()` forward each token to
+    the UI as it is decoded; the merged chunk keeps Ollama's response metadata.
+    """
+    response = None
+    with span("llm.generate", model=settings.LLM_MODEL) as s:
+        started = time.perf_counter()
+        with llm_slot():
+            s.set(queue_ms=_ms_since(started))
+            for chunk in chain.stream(inputs):
+                if response is None:
+                    s.set(ttft_ms=_ms_since(started))
+                response = chunk if response is None else response + chunk
+        cold = _trace_llm(s, response)
+    observe("llm.generate.cold" if cold else "llm.generate.warm", time.perf_counter() - started)
+    return response
+
+
+async def _astream_llm(chain, inputs: dict):
+    """Async counterpart of `_stream_llm`."""
+    response = None
+    with span("llm.generate", model=settings.LLM_MODEL) as s:
+        started = time.perf_counter()
+        async with allm_slot():
+            s.set(queue_ms=_ms_since(started))
+            async for chunk in chain.astream(inputs):
+                if response is None:
+                    s.set(ttft_ms=_ms_since(started))
+                response = chunk if response is None else response + chunk
+        cold = _trace_llm(s, response)
+    observe("llm.generate.cold" if cold else "llm.generate.warm", time.perf_counter() - started)
+    return response
+
+
+def _ms_since(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+def _trace_llm(s, response) -> bool:
+    """Attach token counts and Ollama's server-side durations (ns) to an LLM span.
+
+    Returns whether the call was a cold start (Ollama had to load the model).
+    """
+    if response is None:
+        return False
+    usage = response.usage_metadata or {}
+    metadata = response.response_metadata or {}
+    s.set(prompt_tokens=usage.get("input_tokens"), completion_tokens=usage.get("output_tokens"))
+    for key in ("load_duration", "prompt_eval_duration", "eval_duration", "total_duration"):
+        if metadata.get(key) is not None:
+            s.set(**{f"{key}_ms": round(metadata[key] / 1e6, 3)})
+    count("agent_llm_tokens_total", usage.get("input_tokens", 0), kind="prompt")
+    count("agent_llm_tokens_total", usage.get("output_tokens", 0), kind="completion")
+
+    load_ms = (metadata.get("load_duration") or 0) / 1e6
+    cold = load_ms >= COLD_LOAD_MS
+    s.set(cold=cold)
+    if cold:
+        print(f"   Cold start: model load took {load_ms:.0f}ms")
+    return cold
+
+
+def span_attributes(update: dict) -> dict:
+    """Span attributes summarizing a node's state update (see build_graph)."""
+    attributes = {}
+    if "route" in update:
+        attributes["route"] = update["route"]
+    if "documents" in update:
+        attributes["docs"] = len(update["documents"])
+        attributes["context_chars"] = sum(len(d) for d in update["documents"])
+    if "web_results" in update:
+        attributes["web_results"] = len(update["web_results"])
+        attributes["web_chars"] = sum(len(r) for r in update["web_results"])
+    if "generation" in update:
+        attributes["generation_chars"] = len(update["generation"])
+    if "context_stats" in update:
+        attributes.update({f"context_{k}": v for k, v in update["context_stats"].items()})
+    return attributes
+
+
+def _generation_update(response) -> dict:
+    generation = response.content
+    print(f"   Generated response ({len(generation)} chars)")
+    return {
+        "generation": generation,
+        "messages": [AIMessage(content=generation)],
+    }
+
+
+# System prompts are static so they are byte-identical across requests: Ollama
+# then reuses the KV cache for that prefix and only prefills the context and question.
+KB_SYSTEM = (
+    "You are a helpful assistant. Answer the user's question based ONLY on the provided context.\n"
+    "Do NOT say you cannot access information — the context IS your information source.\n"
+    "If the context doesn't fully answer the question, say what you can from it.\n"
+    "Be concise and accurate."
+)
+
+WEB_SYSTEM = (
+    "You are a helpful assistant. Answer the user's question using ONLY the web search results provided.\n"
+    "These are REAL, LIVE search results from DuckDuckGo — use them to answer.\n"
+    "Do NOT say 'I cannot access real-time information' — the results ARE real-time info.\n"
+    "Cite sources (URLs) where possible. Be concise and accurate."
+)
+
+DIRECT_SYSTEM = "You are a friendly, helpful assistant. Respond naturally to the user. Keep your answers concise."
+
+# Conversation history (empty outside sessions) follows the system prompt, so the prefix stays shared.
+KB_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", KB_SYSTEM),
+    ("human", "{history}Context:\n{context}\n\nQuestion: {question}"),
+]).partial(history="")
+
+WEB_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", WEB_SYSTEM),
+    ("human", "{history}Web search results:\n{context}\n\nQuestion: {question}"),
+]).partial(history="")
+
+DIRECT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", DIRECT_SYSTEM),
+    ("human", "{history}{question}"),
+]).partial(history="")
 
 
 # ──────────────────────────────────────────────
@@ -35,12 +173,32 @@ def _get_llm() -> ChatOllama:
 def route_question(state: dict) -> dict:
     """Route question — defaults to vectorstore since we have a large knowledge base.
 
-    With 5000+ chunks of real project data, most questions should search the KB first.
-    Only simple greetings go direct, and current-events questions go to web search.
+    The semantic router picks the route whose labeled examples are nearest to
+    the question; when it is not confident, the keyword rules below decide.
     """
     print("--- NODE: route_question ---")
 
     question = state["question"]
+    if settings.CALCULATOR_ROUTE_ENABLED and arithmetic_expression(question):
+        print("   Route: calculate")
+        return {"route": "calculate"}
+
+    route = None
+    if settings.ROUTER_STRATEGY == "semantic":
+        with span("router.semantic") as s:
+            route, similarity = semantic_router.classify(question)
+            s.set(route=route, similarity=round(similarity, 4))
+        if route:
+            print(f"   Route: {route} (semantic, {similarity:.2f})")
+            return {"route": route}
+
+    route = _keyword_route(question)
+    print(f"   Route: {route}")
+    return {"route": route}
+
+
+def _keyword_route(question: str) -> str:
+    """Fallback rules: only simple greetings go direct, current-events questions go to web search."""
     q_lower = question.lower().strip()
 
     # Only these go to direct — simple greetings and chitchat
@@ -58,15 +216,12 @@ def route_question(state: dict) -> dict:
     ]
 
     if any(q_lower.startswith(p) or q_lower == p for p in direct_patterns):
-        route = "direct"
+        return "direct"
     elif any(kw in q_lower for kw in web_keywords):
-        route = "websearch"
+        return "websearch"
     else:
         # Default: search the knowledge base first
-        route = "vectorstore"
-
-    print(f"   Route: {route}")
-    return {"route": route}
+        return "vectorstore"
 
 
 # ──────────────────────────────────────────────
@@ -76,34 +231,94 @@ def retrieve(state: dict) -> dict:
     """Retrieve relevant documents from the knowledge base."""
     print("--- NODE: retrieve ---")
 
-    question = state["question"]
-    result = search_knowledge_base.invoke(question)
-    documents = [result] if result else []
+    return _reused_retrieval(state) or _retrieved(search_knowledge_base.invoke(_kb_tool_call(state["question"])))
 
-    print(f"   Retrieved {len(documents)} document(s)")
-    return {"documents": documents}
+
+def _reused_retrieval(state: dict) -> dict | None:
+    """The previous turn's graded hits, if this question stays on its topic."""
+    previous = state.get("last_retrieval") or {}
+    if not previous.get("hits"):
+        return None
+    with span("memory.topic_check") as s:
+        similarity = topic_similarity(state["question"], previous["question"])
+        s.set(similarity=round(similarity, 4))
+    if similarity < settings.MEMORY_REUSE_SIMILARITY:
+        return None
+    print(f"   Reusing {len(previous['hits'])} hit(s) from the previous turn (similarity {similarity:.2f})")
+    count("agent_memory_reused_retrievals_total")
+    return {"documents": [format_context(previous["hits"])], "hits": previous["hits"]}
+
+
+def _kb_tool_call(question: str) -> dict:
+    # Invoking with a tool call returns a ToolMessage carrying the structured hits as its artifact
+    return {
+        "type": "tool_call",
+        "id": "retrieve",
+        "name": "search_knowledge_base",
+        "args": {"query": question, "k": settings.CONTEXT_CANDIDATES},
+    }
+
+
+def _retrieved(message: ToolMessage) -> dict:
+    result = message.content
+    documents = [result] if result else []
+    hits = [asdict(hit) for hit in (message.artifact or {}).get("hits", [])]
+    print(f"   Retrieved {len(documents)} document(s), {len(hits)} hit(s)")
+    return {"documents": documents, "hits": hits}
 
 
 # ──────────────────────────────────────────────
-# Node: grade_documents (content check — no LLM call)
+# Node: grade_documents (score thresholds — no LLM call)
 # ──────────────────────────────────────────────
 def grade_documents(state: dict) -> dict:
-    """Grade documents by checking content length (no LLM call for speed)."""
+    """Keep only hits whose retrieval scores clear the GRADE_MIN_* thresholds (no LLM call).
+
+    If none do — including the tool's "no documents" / error results, which
+    carry no hits — go straight to web search without spending a generation.
+    """
     print("--- NODE: grade_documents ---")
 
-    documents = state.get("documents", [])
+    hits = state.get("hits", [])
+    kept = _passing_hits(hits)
 
-    if not documents:
-        print("   No documents — routing to websearch")
-        return {"documents": [], "route": "websearch"}
+    if not kept:
+        print(f"   No hits above threshold (0/{len(hits)}) — routing to websearch")
+        return {"documents": [], "hits": [], "route": "websearch"}
 
-    total_content = "".join(documents)
-    if len(total_content.strip()) > 50:
-        print(f"   Documents look relevant ({len(total_content)} chars)")
-        return {"documents": documents, "route": "vectorstore"}
-    else:
-        print("   Documents too short — routing to websearch")
-        return {"documents": [], "route": "websearch"}
+    print(f"   Kept {len(kept)}/{len(hits)} hit(s) (best score {kept[0]['score']:.3f})")
+    return {"documents": [format_context(kept)], "hits": kept, "route": "vectorstore"}
+
+
+def _hit_passes(hit: dict) -> bool:
+    """A hit passes if either leg's raw score clears its threshold."""
+    vector, bm25 = hit.get("vector_score"), hit.get("bm25_score")
+    return (vector is not None and vector >= settings.GRADE_MIN_VECTOR_SCORE) or (
+        bm25 is not None and bm25 >= settings.GRADE_MIN_BM25_SCORE
+    )
+
+
+def _passing_hits(hits: list[dict]) -> list[dict]:
+    kept = [hit for hit in hits if _hit_passes(hit)]
+    return kept if len(kept) >= settings.GRADE_MIN_HITS else []
+
+
+# ──────────────────────────────────────────────
+# Node: pack_context (merge overlaps, MMR, token budget — no LLM call)
+# ──────────────────────────────────────────────
+def pack_context(state: dict) -> dict:
+    """Replace the raw retrieved text with a deduplicated, diversified, budgeted context."""
+    print("--- NODE: pack_context ---")
+
+    hits = state.get("hits", [])
+    if not hits:
+        print("   No structured hits — keeping retrieved text as is")
+        return {}
+
+    context, stats = assemble_context(hits, settings.CONTEXT_TOKEN_BUDGET, settings.CONTEXT_MMR_LAMBDA)
+    print(f"   Packed {stats['packed']}/{stats['hits']} hit(s) into ~{stats['context_tokens']} tokens "
+          f"(saved ~{stats['tokens_saved']})")
+    count("agent_context_tokens_saved_total", stats["tokens_saved"])
+    return {"documents": [context], "context_stats": stats}
 
 
 # ──────────────────────────────────────────────
@@ -113,30 +328,13 @@ def generate(state: dict) -> dict:
     """Generate a response using retrieved documents as context."""
     print("--- NODE: generate ---")
 
-    llm = _get_llm()
-    question = state["question"]
-    documents = state.get("documents", [])
-    context = "\n\n".join(documents)
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system",
-         "You are a helpful assistant. Answer the user's question based ONLY on the provided context.\n"
-         "Do NOT say you cannot access information — the context below IS your information source.\n"
-         "If the context doesn't fully answer the question, say what you can from it.\n"
-         "Be concise and accurate.\n\n"
-         "Context:\n{context}"),
-        ("human", "{question}"),
-    ])
-
-    chain = prompt | llm
-    response = chain.invoke({"context": context, "question": question})
-    generation = response.content
+    response = _stream_llm(KB_PROMPT | get_llm(), _kb_inputs(state))
+    return _generation_update(response)
 
-    print(f"   Generated response ({len(generation)} chars)")
-    return {
-        "generation": generation,
-        "messages": [AIMessage(content=generation)],
-    }
+
+def _kb_inputs(state: dict) -> dict:
+    return {"context": "\n\n".join(state.get("documents", [])), "question": state["question"],
+            "history": history_text(state)}
 
 
 # ──────────────────────────────────────────────
@@ -146,10 +344,12 @@ def web_search_node(state: dict) -> dict:
     """Search the web for information."""
     print("--- NODE: web_search ---")
 
-    question = state["question"]
-    result = web_search.invoke(question)
-    web_results = [result] if result else []
+    result = web_search.invoke(state["question"])
+    return _searched(result)
+
 
+def _searched(result: str) -> dict:
+    web_results = [result] if result else []
     print(f"   Got {len(web_results)} web result(s)")
     if web_results:
         print(f"   Preview: {web_results[0][:200]}")
@@ -163,30 +363,25 @@ def generate_with_web(state: dict) -> dict:
     """Generate a response using web search results as context."""
     print("--- NODE: generate_with_web ---")
 
-    llm = _get_llm()
-    question = state["question"]
-    web_results = state.get("web_results", [])
-    context = "\n\n".join(web_results)
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system",
-         "You are a helpful assistant. Answer the user's question using ONLY the web search results below.\n"
-         "These are REAL, LIVE search results from DuckDuckGo — use them to answer.\n"
-         "Do NOT say 'I cannot access real-time information' — the results below ARE real-time info.\n"
-         "Cite sources (URLs) where possible. Be concise and accurate.\n\n"
-         "Web search results:\n{context}"),
-        ("human", "{question}"),
-    ])
-
-    chain = prompt | llm
-    response = chain.invoke({"context": context, "question": question})
-    generation = response.content
+    response = _stream_llm(WEB_PROMPT | get_llm(), _web_inputs(state))
+    return _generation_update(response)
 
-    print(f"   Generated response ({len(generation)} chars)")
-    return {
-        "generation": generation,
-        "messages": [AIMessage(content=generation)],
-    }
+
+def _web_inputs(state: dict) -> dict:
+    return {"context": "\n\n".join(state.get("web_results", [])), "question": state["question"],
+            "history": history_text(state)}
+
+
+# ──────────────────────────────────────────────
+# Node: calculate (no LLM)
+# ──────────────────────────────────────────────
+def calculate(state: dict) -> dict:
+    """Answer an arithmetic question with the bounded evaluator."""
+    print("--- NODE: calculate ---")
+
+    generation = evaluate_to_text(arithmetic_expression(state["question"]) or state["question"])
+    print(f"   {generation}")
+    return {"generation": generation, "messages": [AIMessage(content=generation)]}
 
 
 # ──────────────────────────────────────────────
@@ -196,22 +391,119 @@ def direct_response(state: dict) -> dict:
     """Respond directly without retrieval (greetings, chitchat, general knowledge)."""
     print("--- NODE: direct_response ---")
 
-    llm = _get_llm()
-    question = state["question"]
+    response = _stream_llm(DIRECT_PROMPT | get_llm(), _direct_inputs(state))
+    return _generation_update(response)
 
-    prompt = ChatPromptTemplate.from_messages([
-        ("system",
-         "You are a friendly, helpful assistant. Respond naturally to the user. "
-         "Keep your answers concise."),
-        ("human", "{question}"),
-    ])
 
-    chain = prompt | llm
-    response = chain.invoke({"question": question})
-    generation = response.content
+def _direct_inputs(state: dict) -> dict:
+    return {"question": state["question"], "history": history_text(state)}
 
-    print(f"   Generated response ({len(generation)} chars)")
-    return {
-        "generation": generation,
-        "messages": [AIMessage(content=generation)],
-    }
+
+# ──────────────────────────────────────────────
+# Node: remember (bound the conversation — no LLM call)
+# ──────────────────────────────────────────────
+def remember(state: dict) -> dict:
+    """Fold turns beyond the memory window into the summary; keep this turn's KB hits for follow-ups."""
+    print("--- NODE: remember ---")
+
+    removed, summary = compact(state.get("messages", []), state.get("summary", ""))
+    update: dict = {"summary": summary}
+    if removed:
+        update["messages"] = [RemoveMessage(id=message_id) for message_id in removed]
+        print(f"   Folded {len(removed)} message(s) into the conversation summary")
+    kb_hits = state.get("hits") if state.get("route") == "vectorstore" else None
+    update["last_retrieval"] = {"question": state["question"], "hits": kb_hits} if kb_hits else {}
+    return update
+
+
+# ──────────────────────────────────────────────
+# Async nodes (used by arun_agent)
+# ──────────────────────────────────────────────
+async def aroute_question(state: dict) -> dict:
+    # The semantic router embeds the question; keep that HTTP call off the event loop
+    return await asyncio.to_thread(route_question, state)
+
+
+async def aretrieve(state: dict) -> dict:
+    print("--- NODE: retrieve ---")
+    if reused := await asyncio.to_thread(_reused_retrieval, state):
+        return reused
+    return _retrieved(await search_knowledge_base.ainvoke(_kb_tool_call(state["question"])))
+
+
+async def aretrieve_speculative(state: dict) -> dict:
+    """Retrieve from the KB while a web search runs speculatively in the background.
+
+    If the KB results pass grading the web search is cancelled; otherwise its
+    results are handed to `aweb_search_node`, which then has nothing left to do.
+    Cancelling the task alone would leave the search thread running, so the
+    search also gets a `cancel_event`: it then frees its slot as soon as any
+    request already in flight returns.
+    """
+    print("--- NODE: retrieve (speculative web search) ---")
+    if reused := await asyncio.to_thread(_reused_retrieval, state):
+        return reused
+    cancelled = threading.Event()
+
+    async def _speculate() -> str:
+        cancel_event.set(cancelled)  # local to this task's context, which the tool's worker thread copies
+        return await web_search.ainvoke(state["question"])
+
+    web_task = asyncio.create_task(_speculate())
+    try:
+        update = _retrieved(await search_knowledge_base.ainvoke(_kb_tool_call(state["question"])))
+    except BaseException:
+        cancelled.set()
+        web_task.cancel()
+        raise
+
+    if _passing_hits(update["hits"]):
+        cancelled.set()
+        web_task.cancel()
+        print("   KB results pass grading — cancelled speculative web search")
+        return update
+
+    print("   KB results fail grading — using speculative web search")
+    return {**update, **_searched(await web_task)}
+
+
+async def agrade_documents(state: dict) -> dict:
+    return grade_documents(state)
+
+
+async def apack_context(state: dict) -> dict:
+    return pack_context(state)
+
+
+async def agenerate(state: dict) -> dict:
+    print("--- NODE: generate ---")
+    response = await _astream_llm(KB_PROMPT | get_llm(), _kb_inputs(state))
+    return _generation_update(response)
+
+
+async def aweb_search_node(state: dict) -> dict:
+    print("--- NODE: web_search ---")
+    if state.get("web_results"):
+        print("   Reusing speculative web results")
+        return {"web_results": state["web_results"]}
+    return _searched(await web_search.ainvoke(state["question"]))
+
+
+async def agenerate_with_web(state: dict) -> dict:
+    print("--- NODE: generate_with_web ---")
+    response = await _astream_llm(WEB_PROMPT | get_llm(), _web_inputs(state))
+    return _generation_update(response)
+
+
+async def acalculate(state: dict) -> dict:
+    return calculate(state)  # microseconds of CPU, no I/O
+
+
+async def adirect_response(state: dict) -> dict:
+    print("--- NODE: direct_response ---")
+    response = await _astream_llm(DIRECT_PROMPT | get_llm(), _direct_inputs(state))
+    return _generation_update(response)
+
+
+async def aremember(state: dict) -> dict:
+    return remember(state)
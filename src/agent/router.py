@@ -0,0 +1,104 @@
+"""Embedding-based question router.
+
+Each route ("direct", "websearch", "vectorstore") is described by a few
+labeled example questions in route_examples.json. Their embeddings are
+averaged into one unit-length centroid per route, stacked into a matrix once,
+and a question is routed with a single matrix-vector product to the nearest
+centroid.
+
+Low-confidence matches (best similarity under ROUTER_MIN_SIMILARITY, or
+within ROUTER_MIN_MARGIN of the runner-up) return None so `route_question`
+falls back to its keyword rules; so does an embedding failure.
+
+Query embeddings go through the shared (disk-cached) embeddings, so the
+retrieve step that follows reuses the vector instead of re-embedding.
+"""
+
+import json
+import threading
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from src.config import settings
+
+
+def _default_embed_documents(texts: list[str]) -> list[list[float]]:
+    from src.clients import get_embeddings
+
+    return get_embeddings().embed_documents(texts)
+
+
+def load_examples(path: str | Path) -> dict[str, list[str]]:
+    """Read {"route": ["example question", ...]} from a JSON file."""
+    with open(path, encoding="utf-8") as f:
+        examples = json.load(f)
+    return {route: [q for q in questions if q.strip()] for route, questions in examples.items() if questions}
+
+
+class SemanticRouter:
+    """Nearest-centroid classifier over labeled example questions."""
+
+    def __init__(
+        self,
+        examples: dict[str, list[str]],
+        min_similarity: float = 0.6,
+        min_margin: float = 0.03,
+        embed_documents: Callable[[list[str]], list[list[float]]] = _default_embed_documents,
+    ):
+        self.examples = examples
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self._embed_documents = embed_documents
+        self._routes: list[str] = []
+        self._centroids: np.ndarray | None = None  # (routes, dim) unit vectors
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str | Path, **kwargs) -> "SemanticRouter":
+        return cls(load_examples(path), **kwargs)
+
+    def _build(self) -> None:
+        routes = sorted(self.examples)
+        texts = [q for route in routes for q in self.examples[route]]
+        vectors = np.asarray(self._embed_documents(texts), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+
+        centroids, start = [], 0
+        for route in routes:
+            end = start + len(self.examples[route])
+            centroid = vectors[start:end].mean(axis=0)
+            centroids.append(centroid / (np.linalg.norm(centroid) + 1e-12))
+            start = end
+        self._routes, self._centroids = routes, np.stack(centroids)
+
+    def scores(self, question: str) -> dict[str, float]:
+        """Cosine similarity of the question to every route centroid."""
+        if self._centroids is None:
+            with self._lock:
+                if self._centroids is None:
+                    self._build()
+        vector = np.asarray(self._embed_documents([question])[0], dtype=np.float32)
+        vector /= np.linalg.norm(vector) + 1e-12
+        return dict(zip(self._routes, (self._centroids @ vector).tolist()))
+
+    def classify(self, question: str) -> tuple[str | None, float]:
+        """Return (route, similarity), with route None when the match is not confident."""
+        try:
+            scores = self.scores(question)
+        except Exception:
+            return None, 0.0  # Ollama unavailable — caller uses the keyword rules
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        route, best = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else -1.0
+        if best < self.min_similarity or best - runner_up < self.min_margin:
+            return None, best
+        return route, best
+
+
+semantic_router = SemanticRouter.from_file(
+    settings.ROUTER_EXAMPLES_PATH,
+    min_similarity=settings.ROUTER_MIN_SIMILARITY,
+    min_margin=settings.ROUTER_MIN_MARGIN,
+)
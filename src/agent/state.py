@@ -1,14 +1,19 @@
 """Agent state schema for the LangGraph workflow."""
-import operator
 from typing import Annotated
 from langchain_core.messages import BaseMessage
+from langgraph.graph.message import add_messages
 from typing_extensions import TypedDict
 
 class AgentState(TypedDict):
     question: str
     generation: str
     documents: list[str]
+    hits: list[dict]  # structured search hits (SearchHit fields) behind `documents`
+    context_stats: dict  # token accounting from pack_context
     web_results: list[str]
     route: str
     retry_count: int
-    messages: Annotated[list[BaseMessage], operator.add]
+    # Conversation memory (src/agent/memory.py); persists across turns of a session thread
+    messages: Annotated[list[BaseMessage], add_messages]  # recent turns; RemoveMessage folds them into `summary`
+    summary: str
+    last_retrieval: dict  # {"question", "hits"} of the previous turn's KB retrieval
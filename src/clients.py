@@ -0,0 +1,200 @@
+"""Process-wide client registry for Elasticsearch and Ollama.
+
+Every backend client is created once per process and reused, so questions
+share pooled keep-alive HTTP connections instead of reconnecting on every
+call. All getters are thread-safe; the Ollama clients carry both a sync and an
+async httpx pool, so they can also be shared across asyncio tasks.
+
+If a backend restarts, call `reset_clients()` (or `check_health(reset=True)`)
+and the next getter call reconnects.
+
+`llm_slot()` / `allm_slot()` draw on one process-wide pool of
+OLLAMA_MAX_CONCURRENCY slots, shared by threads and every event loop, so
+concurrent callers queue here instead of overloading Ollama.
+"""
+
+import asyncio
+import platform
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Any, Callable
+
+import httpx
+from elasticsearch import Elasticsearch
+from langchain_core.embeddings import Embeddings
+from langchain_elasticsearch import ElasticsearchStore
+from langchain_ollama import ChatOllama, OllamaEmbeddings
+
+from src.config import settings
+from src.embeddings import CachedEmbeddings, get_embedding_cache
+from src.local_index import LocalVectorIndex
+
+_lock = threading.RLock()
+_clients: dict[str, Any] = {}
+_llm_slots = threading.BoundedSemaphore(settings.OLLAMA_MAX_CONCURRENCY)
+
+
+def _get_or_create(name: str, factory: Callable[[], Any]) -> Any:
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+
+def _ollama_client_kwargs(timeout: float | None) -> dict:
+    """httpx options for a pooled, keep-alive Ollama connection."""
+    return {
+        "timeout": timeout,
+        "limits": httpx.Limits(
+            max_connections=settings.OLLAMA_POOL_SIZE,
+            max_keepalive_connections=settings.OLLAMA_POOL_SIZE,
+        ),
+    }
+
+
+def get_es_client() -> Elasticsearch:
+    """Shared Elasticsearch client with a pooled transport."""
+    return _get_or_create(
+        "es",
+        lambda: Elasticsearch(
+            settings.ELASTICSEARCH_URL,
+            connections_per_node=settings.ES_POOL_SIZE,
+            request_timeout=settings.ES_REQUEST_TIMEOUT,
+            retry_on_timeout=True,
+        ),
+    )
+
+
+def get_embeddings() -> Embeddings:
+    """Shared Ollama embeddings instance, wrapped in the on-disk cache if enabled."""
+
+    def _create() -> Embeddings:
+        embeddings = OllamaEmbeddings(
+            model=settings.EMBEDDING_MODEL,
+            base_url=settings.OLLAMA_BASE_URL,
+            keep_alive=settings.EMBEDDING_KEEP_ALIVE,
+            client_kwargs=_ollama_client_kwargs(settings.EMBEDDING_TIMEOUT),
+        )
+        if not settings.EMBEDDING_CACHE_ENABLED:
+            return embeddings
+        return CachedEmbeddings(embeddings, get_embedding_cache())
+
+    return _get_or_create("embeddings", _create)
+
+
+def get_vector_store(index_name: str | None = None) -> ElasticsearchStore:
+    """Shared vector store for an index, built on the shared ES client and embeddings."""
+    index_name = index_name or settings.ES_INDEX_NAME
+    return _get_or_create(
+        f"vector_store:{index_name}",
+        lambda: ElasticsearchStore(
+            index_name=index_name,
+            embedding=get_embeddings(),
+            client=get_es_client(),
+        ),
+    )
+
+
+def get_local_index(name: str | None = None) -> LocalVectorIndex:
+    """Shared embedded vector index `name` (default ES_INDEX_NAME) under LOCAL_INDEX_DIR."""
+    name = name or settings.ES_INDEX_NAME
+    return _get_or_create(
+        f"local_index:{name}",
+        lambda: LocalVectorIndex(
+            Path(settings.LOCAL_INDEX_DIR) / name,
+            dtype=settings.LOCAL_INDEX_DTYPE,
+            nlist=settings.LOCAL_INDEX_NLIST,
+            nprobe=settings.LOCAL_INDEX_NPROBE,
+        ),
+    )
+
+
+def get_llm() -> ChatOllama:
+    """Shared ChatOllama instance with arch-aware settings."""
+
+    def _create() -> ChatOllama:
+        is_intel = platform.machine() == "x86_64"
+        return ChatOllama(
+            model=settings.LLM_MODEL,
+            base_url=settings.OLLAMA_BASE_URL,
+            temperature=0,
+            num_predict=256 if is_intel else 512,
+            keep_alive=settings.LLM_KEEP_ALIVE,
+            client_kwargs=_ollama_client_kwargs(120 if is_intel else 60),
+        )
+
+    return _get_or_create("llm", _create)
+
+
+@contextmanager
+def llm_slot():
+    """Hold one of the OLLAMA_MAX_CONCURRENCY LLM slots."""
+    with _llm_slots:
+        yield
+
+
+def _release_if_acquired(acquire: asyncio.Future) -> None:
+    if not acquire.cancelled() and acquire.exception() is None:
+        _llm_slots.release()
+
+
+@asynccontextmanager
+async def allm_slot():
+    """`llm_slot` for asyncio tasks: same pool, waited for in a worker thread so the loop isn't blocked."""
+    if not _llm_slots.acquire(blocking=False):
+        acquire = asyncio.ensure_future(asyncio.to_thread(_llm_slots.acquire))
+        try:
+            await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            acquire.add_done_callback(_release_if_acquired)  # the thread may still get the slot
+            raise
+    try:
+        yield
+    finally:
+        _llm_slots.release()
+
+
+def override_client(name: str, client: Any) -> None:
+    """Install a client under a registry key ("es", "embeddings", "llm", "vector_store:<index>",
+    "local_index:<index>").
+
+    Used by tests and benchmarks to swap in stand-in backends.
+    """
+    with _lock:
+        _clients[name] = client
+
+
+def reset_clients(*names: str) -> None:
+    """Drop cached clients (all, or those whose key starts with a given name) so they reconnect."""
+    with _lock:
+        for key in list(_clients):
+            if names and not any(key == n or key.startswith(f"{n}:") for n in names):
+                continue
+            client = _clients.pop(key)
+            if isinstance(client, Elasticsearch):
+                client.close()
+
+
+def check_health(reset: bool = False) -> dict[str, bool]:
+    """Ping Elasticsearch and Ollama; with reset=True, drop the clients of any backend that is down."""
+    status = {}
+    try:
+        status["elasticsearch"] = bool(get_es_client().ping())
+    except Exception:
+        status["elasticsearch"] = False
+    try:
+        httpx.get(f"{settings.OLLAMA_BASE_URL}/api/tags", timeout=5).raise_for_status()
+        status["ollama"] = True
+    except Exception:
+        status["ollama"] = False
+
+    if reset:
+        if not status["elasticsearch"]:
+            reset_clients("es", "vector_store")
+        if not status["ollama"]:
+            reset_clients("embeddings", "llm", "vector_store")
+    return status
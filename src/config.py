@@ -19,16 +19,148 @@ class Settings(BaseSettings):
 
     # Elasticsearch
     ELASTICSEARCH_URL: str = "http://localhost:9200"
-    ES_INDEX_NAME: str = "knowledge-base"
+    ES_INDEX_NAME: str = "knowledge-base"  # an alias over versioned indexes (src/ingest/index.py)
+    ES_POOL_SIZE: int = 10  # keep-alive connections per ES node
+    ES_REQUEST_TIMEOUT: float = 30.0
+
+    # Index layout (applied when an index is built)
+    ES_VECTOR_INDEX_TYPE: str = "int8_hnsw"  # hnsw (float32) | int8_hnsw | int4_hnsw | bbq_hnsw (ES 8.18+) | *_flat
+    ES_HNSW_M: int = 16  # graph degree; higher = better recall, more memory
+    ES_HNSW_EF_CONSTRUCTION: int = 100  # build-time candidates; higher = better graph, slower ingest
+    ES_NUMBER_OF_SHARDS: int = 1
+    ES_NUMBER_OF_REPLICAS: int = 0  # single-node docker-compose; restored after bulk loads
+    ES_REFRESH_INTERVAL: str = "1s"  # restored after bulk loads (refresh is off while loading)
+    ES_FORCE_MERGE: bool = True  # merge a freshly built index to one segment before it goes live
+
+    # Retrieval
+    RETRIEVAL_BACKEND: str = "elasticsearch"  # or "local": in-process vector index (src/local_index.py), dense only
+    RETRIEVAL_STRATEGY: str = "hybrid"  # "dense" (kNN), "bm25" (lexical) or "hybrid" (both, RRF-fused)
+    RETRIEVAL_K: int = 4
+    RETRIEVAL_NUM_CANDIDATES: int = 50  # HNSW candidates per shard; higher = better recall, slower
+    RRF_WINDOW_SIZE: int = 20  # hits taken from each leg before fusion
+    RRF_RANK_CONSTANT: int = 60
+
+    # Federated retrieval: search several ES indexes/aliases or "local:<name>" embedded indexes concurrently
+    RETRIEVAL_TARGETS: list[str] = []  # empty = ES_INDEX_NAME on RETRIEVAL_BACKEND only
+    RETRIEVAL_TARGET_TIMEOUT: float = 2.0  # seconds; a target slower than this is dropped from the answer
+    RETRIEVAL_TARGET_TIMEOUTS: dict[str, float] = {}  # per-target overrides, e.g. {"reports": 5.0}
+    RETRIEVAL_FEDERATION_WORKERS: int = 8
+
+    # Embedded vector index for RETRIEVAL_BACKEND=local
+    LOCAL_INDEX_DIR: str = str(_project_root / ".cache" / "local_index")
+    LOCAL_INDEX_DTYPE: str = "float32"  # or "int8" (4x smaller, slightly approximate scores)
+    LOCAL_INDEX_NLIST: int = 0  # IVF cells; 0 = exact brute-force search
+    LOCAL_INDEX_NPROBE: int = 8  # IVF cells scanned per query
+
+    # Grading: a hit is kept if either score clears its threshold; below GRADE_MIN_HITS → web search
+    GRADE_MIN_VECTOR_SCORE: float = 0.75  # ES cosine score, (1 + cos) / 2
+    GRADE_MIN_BM25_SCORE: float = 3.0
+    GRADE_MIN_HITS: int = 1
+
+    # Context packing for the KB prompt (src/agent/context.py)
+    CONTEXT_CANDIDATES: int = 8  # chunks retrieved for packing
+    CONTEXT_TOKEN_BUDGET: int = 600  # estimated prompt tokens spent on context
+    CONTEXT_MMR_LAMBDA: float = 0.7  # 1.0 = pure relevance, lower = more diverse
+
+    # Question routing: "semantic" (nearest example centroid, keyword fallback) or "keyword"
+    ROUTER_STRATEGY: str = "semantic"
+    ROUTER_EXAMPLES_PATH: str = str(Path(__file__).resolve().parent / "agent" / "route_examples.json")
+    ROUTER_MIN_SIMILARITY: float = 0.6  # below this the keyword rules decide
+    ROUTER_MIN_MARGIN: float = 0.03  # required lead over the second-best route
+
+    # Web search (src/tools/web_search.py)
+    WEB_SEARCH_BACKEND: str = "duckduckgo"  # "duckduckgo" or "local" (JSONL stand-in index)
+    WEB_SEARCH_LOCAL_INDEX: str = ""  # JSONL of {"title", "href", "body"} for the local backend
+    WEB_SEARCH_MAX_RESULTS: int = 3
+    WEB_SEARCH_TIMEOUT: float = 8.0  # hard deadline per search, retries included
+    WEB_SEARCH_RETRIES: int = 1
+    WEB_SEARCH_MAX_CONCURRENCY: int = 2
+    WEB_SEARCH_CACHE_ENABLED: bool = True
+    WEB_SEARCH_CACHE_TTL: float = 900.0  # seconds; results for current events go stale fast
+    WEB_SEARCH_CACHE_MAX_ENTRIES: int = 1000
+    WEB_SEARCH_CACHE_PATH: str = str(_project_root / ".cache" / "web_search.sqlite")
+
+    # Calculator (src/tools/calculator.py): arithmetic questions take the LLM-free `calculate` route
+    CALCULATOR_ROUTE_ENABLED: bool = True
+    CALC_MAX_NODES: int = 64  # AST nodes per expression
+    CALC_MAX_EXPONENT: int = 1000
+    CALC_MAX_DIGITS: int = 1000  # integer results must stay below 10**CALC_MAX_DIGITS
+    CALC_TIMEOUT_MS: float = 50.0
+
+    # Opt-in: start web search alongside KB retrieval in the async graph (cancelled if KB results pass
+    # grading). Off by default, since it sends every KB question to the web search provider.
+    SPECULATIVE_WEB_SEARCH: bool = False
 
     # Ollama
     OLLAMA_BASE_URL: str = "http://localhost:11434"
     LLM_MODEL: str = "llama3.2"
     EMBEDDING_MODEL: str = "nomic-embed-text"
+    EMBEDDING_TIMEOUT: float = 60.0
+    LLM_KEEP_ALIVE: int = 1800  # seconds Ollama keeps the model loaded after a request; -1 = forever
+    EMBEDDING_KEEP_ALIVE: int = 1800
+    WARMUP_ON_START: bool = True  # preload both models when the UI / batch runner starts
+    OLLAMA_POOL_SIZE: int = 10  # keep-alive connections to Ollama per client
+    OLLAMA_MAX_CONCURRENCY: int = 2  # in-flight LLM generations per process (sync and async); match OLLAMA_NUM_PARALLEL
+
+    # Embedding cache (on-disk, shared by ingestion and queries)
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_DIR: str = str(_project_root / ".cache" / "embeddings")
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 100_000  # ~300 MB of 768-d float32 vectors
 
     # Ingestion
     CHUNK_SIZE: int = 500
     CHUNK_OVERLAP: int = 50
+    INGEST_BATCH_SIZE: int = 50
+    INGEST_MIN_BATCH_SIZE: int = 8
+    INGEST_MAX_BATCH_SIZE: int = 200
+    INGEST_EMBED_CONCURRENCY: int = 2  # match OLLAMA_NUM_PARALLEL on the Ollama server
+    INGEST_WRITE_CONCURRENCY: int = 2
+    INGEST_MAX_RETRIES: int = 5
+    INGEST_RETRY_BACKOFF: float = 1.0  # seconds, doubled per retry
+    INGEST_LOAD_THREADS: int = 4  # text files read concurrently
+    INGEST_PDF_PROCESSES: int = 0  # PDF parser processes; 0 = one per CPU
+    INGEST_LOAD_WINDOW: int = 32  # files loading or waiting to be chunked at once (bounds memory)
+    DEDUP_ENABLED: bool = True  # collapse near-duplicate chunks (MinHash LSH, src/ingest/dedup.py)
+    DEDUP_THRESHOLD: float = 0.85  # estimated Jaccard similarity of word shingles
+    DEDUP_NUM_PERM: int = 128
+    DEDUP_BANDS: int = 32  # LSH bands; NUM_PERM / BANDS rows each
+    DEDUP_SHINGLE_SIZE: int = 5  # words per shingle
+    INGEST_MANIFEST_PATH: str = str(_project_root / ".cache" / "ingest_manifest.json")
+
+    # Answer cache (in front of run_agent)
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_MAX_ENTRIES: int = 256
+    ANSWER_CACHE_SIMILARITY: float = 0.95  # cosine threshold for near-duplicate questions
+    # Seconds to keep answers per route; 0 disables caching for that route
+    ANSWER_CACHE_ROUTE_TTLS: dict[str, float] = {"vectorstore": 3600, "direct": 86400, "websearch": 0}
+
+    # Conversation memory (src/agent/memory.py): per-session threads in a SQLite checkpointer
+    MEMORY_CHECKPOINT_PATH: str = str(_project_root / ".cache" / "checkpoints.sqlite")
+    MEMORY_WINDOW_TURNS: int = 4  # recent turns kept verbatim
+    MEMORY_TOKEN_BUDGET: int = 500  # estimated prompt tokens of history (summary + recent turns)
+    MEMORY_SUMMARY_TOKENS: int = 150  # running summary of older turns
+    MEMORY_REUSE_SIMILARITY: float = 0.8  # follow-up vs previous KB question cosine to reuse its hits
+
+    # Batch evaluation (python -m src.agent.batch)
+    BATCH_MAX_CONCURRENCY: int = 4
+
+    # Tracing (src/observability.py): per-span latency histograms + JSONL traces
+    TRACING_ENABLED: bool = False
+    TRACE_JSONL_PATH: str = str(_project_root / ".cache" / "traces.jsonl")  # empty = keep traces in memory only
+
+    # HTTP service (python -m src.server) and the UI's connection to it
+    SERVER_HOST: str = "127.0.0.1"
+    SERVER_PORT: int = 8000
+    SERVER_MAX_CONCURRENCY: int = 4  # questions processed at once (LLM calls are further capped)
+    SERVER_MAX_QUEUE: int = 16  # questions allowed to wait; beyond this → 429
+    SERVER_QUEUE_TIMEOUT: float = 60.0  # max seconds a question waits for a slot
+    SERVER_HEALTH_INTERVAL: float = 15.0  # background health refresh period
+    AGENT_SERVER_URL: str = "http://localhost:8000"
+
+    # MCP server (python -m src.mcp_server)
+    MCP_TRANSPORT: str = "stdio"  # stdio | sse | streamable-http
+    MCP_BATCH_WINDOW_MS: float = 5.0  # concurrent KB searches arriving within this window share one _msearch
+    MCP_BATCH_MAX_QUERIES: int = 16
 
     # Paths
     DATA_DIR: str = str(_project_root / "data")
@@ -0,0 +1,218 @@
+"""Embeddings with a persistent, content-addressed on-disk cache.
+
+Vectors live in a memory-mapped float32 file (one row per cached text); a small
+SQLite index maps sha256(model, text) to a row and tracks last use for LRU
+eviction. Both ingestion and query-time search use the cached embeddings from
+`src.clients.get_embeddings()`, so re-ingesting unchanged chunks or repeating a question skips the Ollama
+round-trip entirely.
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.config import settings
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Size-bounded LRU store of embedding vectors for one model.
+
+    Safe to share across threads; the SQLite index also serialises writers
+    across processes (e.g. the ingest CLI and the chat UI running together).
+    """
+
+    def __init__(self, directory: str | Path, model: str, max_entries: int = 100_000):
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model)
+        self.directory = Path(directory) / slug
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.model = model
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors_path = self.directory / "vectors.f32"
+        self._mmap: np.memmap | None = None
+        self._db = sqlite3.connect(
+            self.directory / "index.sqlite", check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER NOT NULL, last_used REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used);
+            CREATE TABLE IF NOT EXISTS free_slots (slot INTEGER PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            """
+        )
+        row = self._db.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        self.dim: int | None = row[0] if row else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    # ── vector file ──
+    def _rows(self) -> int:
+        if not self.dim or not self._vectors_path.exists():
+            return 0
+        return self._vectors_path.stat().st_size // (self.dim * 4)
+
+    def _view(self, min_rows: int) -> np.memmap:
+        """Memmap covering at least `min_rows` rows, growing the file (doubling) if needed."""
+        if self._mmap is not None and self._mmap.shape[0] >= min_rows:
+            return self._mmap
+        rows = self._rows()
+        if rows < min_rows:
+            rows = min(max(min_rows, rows * 2, 1024), max(self.max_entries, min_rows))
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(rows * self.dim * 4)
+        self._mmap = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(rows, self.dim))
+        return self._mmap
+
+    def _slots(self, keys: list[str]) -> dict[str, int]:
+        slots = {}
+        for i in range(0, len(keys), 500):
+            part = keys[i : i + 500]
+            marks = ",".join("?" * len(part))
+            slots.update(self._db.execute(f"SELECT key, slot FROM entries WHERE key IN ({marks})", part).fetchall())
+        return slots
+
+    # ── public API ──
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        """Return cached vectors for whichever keys are present, refreshing their LRU stamp."""
+        found: dict[str, list[float]] = {}
+        with self._lock:
+            if keys and self.dim is not None:
+                # Lookup and read under the write lock: another process can't evict and refill a slot in between
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    slots = self._slots(list(dict.fromkeys(keys)))
+                    if slots:
+                        view = self._view(max(slots.values()) + 1)
+                        found = {key: view[slot].tolist() for key, slot in slots.items()}
+                        now = time.time()
+                        self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, k) for k in slots])
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+        return found
+
+    def put_many(self, items: dict[str, list[float]]) -> None:
+        """Store vectors, evicting least-recently-used entries beyond `max_entries`."""
+        if not items:
+            return
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                if self.dim is None:
+                    self.dim = len(next(iter(items.values())))
+                    db.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('dim', ?)", (self.dim,))
+                existing = self._slots(list(items))
+                new = [(k, v) for k, v in items.items() if k not in existing][: self.max_entries]
+                count = db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                overflow = count + len(new) - self.max_entries
+                if overflow > 0:
+                    # Evict a little extra so we don't pay an eviction on every insert
+                    victims = db.execute(
+                        "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?",
+                        (overflow + self.max_entries // 10,),
+                    ).fetchall()
+                    db.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in victims])
+                    db.executemany("INSERT OR IGNORE INTO free_slots (slot) VALUES (?)", [(s,) for _, s in victims])
+
+                # Reuse evicted rows first, then append past the highest slot ever handed out
+                high = db.execute(
+                    "SELECT MAX(m) FROM (SELECT MAX(slot) AS m FROM entries UNION ALL SELECT MAX(slot) FROM free_slots)"
+                ).fetchone()[0]
+                high = -1 if high is None else high
+                free = [s for (s,) in db.execute("SELECT slot FROM free_slots ORDER BY slot LIMIT ?", (len(new),))]
+                db.executemany("DELETE FROM free_slots WHERE slot = ?", [(s,) for s in free])
+                slots = free + list(range(high + 1, high + 1 + len(new) - len(free)))
+
+                if slots:
+                    view = self._view(max(slots) + 1)
+                    for (_, vector), slot in zip(new, slots):
+                        view[slot] = vector
+                    view.flush()
+                now = time.time()
+                db.executemany(
+                    "INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                    [(key, slot, now) for (key, _), slot in zip(new, slots)],
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def stats(self) -> dict:
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses, "dim": self.dim}
+
+
+class CachedEmbeddings(Embeddings):
+    """Drop-in `Embeddings` wrapper: look up the cache first, embed only the misses."""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def _split(self, texts: list[str]) -> tuple[list[str], dict[str, list[float]], list[str]]:
+        keys = [cache_key(self.cache.model, t) for t in texts]
+        found = self.cache.get_many(keys)
+        # Identical texts within one call are embedded once
+        missing = list(dict.fromkeys(t for t, k in zip(texts, keys) if k not in found))
+        return keys, found, missing
+
+    def _merge(self, keys, found, missing, vectors) -> list[list[float]]:
+        # Round through float32 so a miss returns exactly what a later hit will
+        fresh = {
+            cache_key(self.cache.model, t): np.asarray(v, dtype=np.float32).tolist() for t, v in zip(missing, vectors)
+        }
+        self.cache.put_many(fresh)
+        found.update(fresh)
+        return [found[k] for k in keys]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys, found, missing = self._split(texts)
+        vectors = self.embeddings.embed_documents(missing) if missing else []
+        return self._merge(keys, found, missing, vectors)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys, found, missing = self._split(texts)
+        vectors = await self.embeddings.aembed_documents(missing) if missing else []
+        return self._merge(keys, found, missing, vectors)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+_caches: dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model: str | None = None) -> EmbeddingCache:
+    """Process-wide cache instance per model (shares one SQLite connection and memmap)."""
+    model = model or settings.EMBEDDING_MODEL
+    with _caches_lock:
+        if model not in _caches:
+            _caches[model] = EmbeddingCache(
+                settings.EMBEDDING_CACHE_DIR, model, max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES
+            )
+        return _caches[model]
+
@@ -0,0 +1,121 @@
+"""Near-duplicate chunk elimination with MinHash LSH.
+
+Each chunk is reduced to a MinHash signature over its word shingles
+(DEDUP_SHINGLE_SIZE words). Signatures are split into DEDUP_BANDS bands and
+bucketed, so only chunks sharing a band are compared; a candidate counts as a
+duplicate if the estimated Jaccard similarity (fraction of equal signature
+slots) reaches DEDUP_THRESHOLD.
+
+The first chunk of a cluster is canonical and gets indexed; later near-copies
+are not embedded or written. Instead the files they came from reference the
+canonical chunk's ID, and its `metadata.sources` lists every file it stands for.
+
+Deduplication spans one ingest run: a full rebuild deduplicates the whole
+corpus, an incremental run the files it re-ingests.
+"""
+
+import re
+import zlib
+from dataclasses import dataclass
+
+import numpy as np
+
+_PRIME = (1 << 31) - 1  # Mersenne prime for the universal hash family
+_WORD = re.compile(r"\w+")
+
+
+class MinHasher:
+    def __init__(self, num_perm: int, shingle_size: int, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.shingle_size = shingle_size
+        self.a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> np.ndarray:
+        """Hashes of the text's distinct word n-grams (the whole text if it is shorter than n words)."""
+        words = _WORD.findall(text.lower())
+        k = self.shingle_size
+        grams = {" ".join(words[i:i + k]) for i in range(max(len(words) - k + 1, 1))}
+        hashes = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+        return hashes % _PRIME
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = self.shingles(text)
+        # (a·h + b) mod p for every permutation × shingle; a, h < 2^31 so it fits in uint64
+        return ((np.outer(self.a, hashes) + self.b[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """LSH index of canonical chunk signatures."""
+
+    def __init__(self, threshold: float, num_perm: int, bands: int, shingle_size: int):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.threshold = threshold
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self._buckets: list[dict[bytes, list[int]]] = [{} for _ in range(bands)]
+        self._signatures: list[np.ndarray] = []
+        self._keys: list[str] = []
+
+    def _bands(self, signature: np.ndarray) -> list[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(len(self._buckets))]
+
+    def find_or_add(self, key: str, text: str) -> str | None:
+        """Return the key of the most similar indexed text at or above the threshold; else index `text` under `key`."""
+        signature = self.hasher.signature(text)
+        bands = self._bands(signature)
+        best, best_similarity, seen = None, self.threshold, set()
+        for band, bucket in zip(bands, self._buckets):
+            for i in bucket.get(band, ()):
+                if i in seen:
+                    continue
+                seen.add(i)
+                similarity = float(np.mean(self._signatures[i] == signature))
+                if similarity >= best_similarity:
+                    best, best_similarity = i, similarity
+        if best is not None:
+            return self._keys[best]
+        position = len(self._keys)
+        self._keys.append(key)
+        self._signatures.append(signature)
+        for band, bucket in zip(bands, self._buckets):
+            bucket.setdefault(band, []).append(position)
+        return None
+
+
+@dataclass
+class DedupStats:
+    chunks: int = 0
+    duplicates: int = 0
+    duplicate_chars: int = 0
+
+    def report(self, embed_seconds_per_chunk: float, vector_dims: int) -> str:
+        """Savings estimate: duplicate text plus one float32 vector per dropped chunk, and their embedding time."""
+        saved_bytes = self.duplicate_chars + self.duplicates * vector_dims * 4
+        share = self.duplicates / self.chunks if self.chunks else 0.0
+        return (f"{self.duplicates}/{self.chunks} chunks were near-duplicates ({share:.0%}): "
+                f"~{saved_bytes / 1e6:.1f} MB less index, ~{self.duplicates * embed_seconds_per_chunk:.1f}s embedding saved")
+
+
+class ChunkDeduplicator:
+    """Splits each file's chunks into canonical ones and near-copies of chunks seen earlier in the run."""
+
+    def __init__(self, threshold: float, num_perm: int, bands: int, shingle_size: int):
+        self.index = NearDuplicateIndex(threshold, num_perm, bands, shingle_size)
+        self.stats = DedupStats()
+
+    def split(self, chunks: list) -> tuple[list, list[tuple[object, str]]]:
+        """Returns (canonical chunks, [(duplicate chunk, canonical chunk_id)])."""
+        kept, duplicates = [], []
+        for chunk in chunks:
+            self.stats.chunks += 1
+            canonical = self.index.find_or_add(chunk.metadata["chunk_id"], chunk.page_content)
+            if canonical is None:
+                chunk.metadata["sources"] = [chunk.metadata.get("source", "unknown")]
+                kept.append(chunk)
+            else:
+                self.stats.duplicates += 1
+                self.stats.duplicate_chars += len(chunk.page_content)
+                duplicates.append((chunk, canonical))
+        return kept, duplicates
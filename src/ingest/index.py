@@ -0,0 +1,167 @@
+"""Elasticsearch index lifecycle for the knowledge base.
+
+ES_INDEX_NAME is an alias. The documents live in versioned indexes
+(`knowledge-base-20260117t093000123456`) created here with an explicit mapping:
+  - `vector`: dense_vector with ES_VECTOR_INDEX_TYPE (int8_hnsw by default,
+    4x smaller in heap than float32 HNSW; bbq_hnsw needs ES 8.18+ and 64+
+    dims) and HNSW graph parameters ES_HNSW_M / ES_HNSW_EF_CONSTRUCTION
+  - `text` for BM25 and keyword-typed metadata
+
+A full (re)build writes into a fresh index while the alias keeps serving the
+old one, then swaps the alias atomically and deletes the old index (blue/green),
+so re-indexing never slows down live queries. Incremental runs write into the
+live index in place.
+
+During bulk loads refresh is disabled (and replicas dropped for indexes that
+aren't live yet); both are restored afterwards, optionally followed by a
+force-merge to one segment.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from elasticsearch import Elasticsearch, NotFoundError
+
+from src.config import settings
+
+TEXT_FIELD = "text"
+VECTOR_FIELD = "vector"
+
+
+def index_mapping(dims: int) -> dict:
+    """Mapping for the chunk documents written by ElasticsearchStore."""
+    index_options: dict = {"type": settings.ES_VECTOR_INDEX_TYPE}
+    if settings.ES_VECTOR_INDEX_TYPE.endswith("hnsw"):
+        index_options.update(m=settings.ES_HNSW_M, ef_construction=settings.ES_HNSW_EF_CONSTRUCTION)
+    return {
+        "properties": {
+            TEXT_FIELD: {"type": "text"},
+            VECTOR_FIELD: {
+                "type": "dense_vector",
+                "dims": dims,
+                "index": True,
+                "similarity": "cosine",
+                "index_options": index_options,
+            },
+            "metadata": {
+                "properties": {
+                    "source": {"type": "keyword"},
+                    "sources": {"type": "keyword"},  # every file a deduplicated chunk stands for
+                    "chunk_id": {"type": "keyword"},
+                    "page": {"type": "integer"},
+                    "start_index": {"type": "integer"},
+                    "chunk_index": {"type": "integer"},
+                    "ingested_at": {"type": "date"},
+                },
+            },
+        },
+    }
+
+
+def new_index_name(alias: str) -> str:
+    return f"{alias}-{datetime.now(timezone.utc):%Y%m%dt%H%M%S%f}"
+
+
+def live_index(es: Elasticsearch, alias: str) -> str | None:
+    """The concrete index serving `alias`; `alias` itself for a pre-alias concrete index; None if neither exists."""
+    try:
+        indices = list(es.indices.get_alias(name=alias))
+    except NotFoundError:
+        indices = []
+    if indices:
+        return sorted(indices)[-1]
+    return alias if es.indices.exists(index=alias) else None
+
+
+def create_index(es: Elasticsearch, name: str, dims: int) -> None:
+    """Create a versioned index set up for bulk loading (no refresh, no replicas)."""
+    es.indices.create(
+        index=name,
+        mappings=index_mapping(dims),
+        settings={
+            "number_of_shards": settings.ES_NUMBER_OF_SHARDS,
+            "number_of_replicas": 0,
+            "refresh_interval": "-1",
+        },
+    )
+
+
+@contextmanager
+def bulk_load(es: Elasticsearch, name: str, live: bool, force_merge: bool = False):
+    """Disable refresh (and, unless `live`, replicas) while writing; restore, refresh and optionally merge after."""
+    bulk_settings = {"refresh_interval": "-1"}
+    if not live:
+        bulk_settings["number_of_replicas"] = 0
+    es.indices.put_settings(index=name, settings=bulk_settings)
+    try:
+        yield
+    finally:
+        es.indices.put_settings(
+            index=name,
+            settings={
+                "refresh_interval": settings.ES_REFRESH_INTERVAL,
+                "number_of_replicas": settings.ES_NUMBER_OF_REPLICAS,
+            },
+        )
+        es.indices.refresh(index=name)
+    if force_merge:
+        print(f"   Force-merging {name} to one segment")
+        es.indices.forcemerge(index=name, max_num_segments=1, wait_for_completion=True)
+
+
+def swap_alias(es: Elasticsearch, alias: str, index: str) -> list[str]:
+    """Point `alias` at `index` in one atomic step and delete the indexes it served before.
+
+    A concrete index named like the alias (from before aliases were used) is
+    removed in the same step. Returns the deleted index names.
+    """
+    try:
+        current = list(es.indices.get_alias(name=alias))
+    except NotFoundError:
+        current = []
+    old = [name for name in current if name != index]
+    actions = [{"remove": {"index": name, "alias": alias}} for name in old]
+    if not current and es.indices.exists(index=alias):
+        actions.append({"remove_index": {"index": alias}})
+    actions.append({"add": {"index": index, "alias": alias}})
+    es.indices.update_aliases(actions=actions)
+    for name in old:
+        es.indices.delete(index=name, ignore_unavailable=True)
+    return old
+
+
+_SOURCES_SCRIPT = """
+def m = ctx._source.metadata;
+if (m.sources == null) { m.sources = [m.source]; }
+for (s in params.add) { if (!m.sources.contains(s)) { m.sources.add(s); } }
+m.sources.removeAll(params.remove);
+"""
+
+
+def update_sources(
+    es: Elasticsearch, name: str, add: dict[str, list[str]], remove: dict[str, list[str]], batch_size: int = 500
+) -> int:
+    """Add and remove file names in the `metadata.sources` of deduplicated chunks. Returns the chunks updated."""
+    ids = sorted(set(add) | set(remove))
+    failed = 0
+    for start in range(0, len(ids), batch_size):
+        operations = []
+        for doc_id in ids[start:start + batch_size]:
+            operations.append({"update": {"_index": name, "_id": doc_id}})
+            operations.append({"script": {
+                "source": _SOURCES_SCRIPT,
+                "lang": "painless",
+                "params": {"add": add.get(doc_id, []), "remove": remove.get(doc_id, [])},
+            }})
+        response = es.bulk(operations=operations)
+        if response.get("errors"):
+            failed += sum(1 for item in response["items"] if item["update"].get("error"))
+    return len(ids) - failed
+
+
+def drop_stale_builds(es: Elasticsearch, alias: str, keep: set[str]) -> list[str]:
+    """Delete versioned indexes of `alias` left behind by abandoned builds."""
+    stale = [name for name in es.indices.get(index=f"{alias}-*") if name not in keep]
+    for name in stale:
+        es.indices.delete(index=name, ignore_unavailable=True)
+    return stale
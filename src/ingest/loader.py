@@ -3,133 +3,409 @@
 Reads files from data/, chunks them, generates embeddings via Ollama,
 and stores them in Elasticsearch.
 
+Ingestion is incremental: a manifest of per-file content hashes and chunk IDs
+(see src/ingest/manifest.py) means only new or changed files are embedded,
+chunks of removed files are deleted, and an interrupted run resumes from the
+last committed batch. Pass --full to rebuild from scratch into a new index,
+which replaces the live one behind the ES_INDEX_NAME alias only once complete
+(see src/ingest/index.py).
+
+With RETRIEVAL_BACKEND=local the chunks go to the embedded index
+(src/local_index.py) instead; --full builds it in a side directory that
+replaces the live one only once complete.
+
 Usage:
-    python -m src.ingest.loader
+    python -m src.ingest.loader [data_dir] [--full]
 """
 
-import sys
+import argparse
+import os
+import time
+from collections import deque
+from contextlib import closing, nullcontext
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Iterable, Iterator
 
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
+from langchain_community.document_loaders import TextLoader
 from langchain_community.document_loaders import PyPDFLoader
-from langchain_elasticsearch import ElasticsearchStore
-from langchain_ollama import OllamaEmbeddings
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 from src.config import settings
+from src.clients import get_embeddings, get_es_client, get_local_index, get_vector_store
+from src.ingest import index
+from src.ingest.dedup import ChunkDeduplicator
+from src.ingest.manifest import IngestManifest, chunk_id, file_sha256, recorded_index
+from src.ingest.pipeline import run_pipeline
+
+TEXT_SUFFIXES = {".txt", ".md", ".csv", ".rst"}
+PDF_SUFFIX = ".pdf"
 
 
-def get_embeddings() -> OllamaEmbeddings:
-    """Create the Ollama embeddings instance."""
-    return OllamaEmbeddings(
-        model=settings.EMBEDDING_MODEL,
-        base_url=settings.OLLAMA_BASE_URL,
+def discover_files(data_dir: str) -> list[Path]:
+    """List the ingestible files in the data directory (one directory scan)."""
+    data_path = Path(data_dir).resolve()
+    if not data_path.exists():
+        return []
+    return sorted(
+        path for path in data_path.iterdir()
+        if path.is_file() and (path.suffix in TEXT_SUFFIXES or path.suffix == PDF_SUFFIX)
     )
 
 
-def get_vector_store() -> ElasticsearchStore:
-    """Create the Elasticsearch vector store instance."""
-    return ElasticsearchStore(
-        index_name=settings.ES_INDEX_NAME,
-        embedding=get_embeddings(),
-        es_url=settings.ELASTICSEARCH_URL,
-    )
+def _load_text(path: str) -> list[Document]:
+    return TextLoader(path, encoding="utf-8", autodetect_encoding=True).load()
 
 
-def load_documents(data_dir: str) -> list:
-    """Load documents from the data directory (.txt, .md, .csv, .pdf files)."""
-    docs = []
-    data_path = Path(data_dir)
+def _load_pdf(path: str) -> list[Document]:
+    # Runs in a worker process: pypdf parsing is CPU-bound and holds the GIL
+    return PyPDFLoader(path).load()
 
-    if not data_path.exists():
-        print(f"  Data directory not found: {data_path}")
-        return docs
-
-    # Load text-based formats using TextLoader (no extra deps needed)
-    for pattern in ["*.txt", "*.md", "*.csv", "*.rst"]:
-        files = list(data_path.glob(pattern))
-        if files:
-            print(f"  Found {len(files)} {pattern} files")
-            loader = DirectoryLoader(
-                str(data_path),
-                glob=pattern,
-                loader_cls=TextLoader,
-                loader_kwargs={"encoding": "utf-8", "autodetect_encoding": True},
-                silent_errors=True,
-            )
-            loaded = loader.load()
-            docs.extend(loaded)
-            print(f"    Loaded {len(loaded)} files successfully")
-
-    # Load PDF files (requires pypdf)
-    pdf_files = list(data_path.glob("*.pdf"))
-    if pdf_files:
-        print(f"  Found {len(pdf_files)} *.pdf files")
-        loaded_count = 0
-        for pdf_file in pdf_files:
+
+@dataclass
+class LoadStats:
+    """Per-format counts and throughput of a load (formats keyed by suffix, e.g. "md", "pdf")."""
+
+    files: dict[str, int] = field(default_factory=dict)
+    failed: dict[str, int] = field(default_factory=dict)
+    seconds: dict[str, float] = field(default_factory=dict)  # from load start to the format's last file
+    started: float = field(default_factory=time.perf_counter)
+
+    def record(self, fmt: str, ok: bool) -> None:
+        counts = self.files if ok else self.failed
+        counts[fmt] = counts.get(fmt, 0) + 1
+        self.seconds[fmt] = time.perf_counter() - self.started
+
+    def files_per_sec(self, fmt: str) -> float:
+        return self.files.get(fmt, 0) / self.seconds[fmt] if self.seconds.get(fmt) else 0.0
+
+    def report(self) -> str:
+        return ", ".join(
+            f"{fmt}: {self.files.get(fmt, 0)} files ({self.files_per_sec(fmt):.1f} files/sec"
+            + (f", {self.failed[fmt]} failed)" if self.failed.get(fmt) else ")")
+            for fmt in sorted(self.seconds)
+        )
+
+
+def iter_files(files: Iterable[Path], stats: LoadStats | None = None) -> Iterator[tuple[Path, list[Document]]]:
+    """Load files concurrently, yielding (path, documents) per file in input order.
+
+    Text files are read on INGEST_LOAD_THREADS threads and PDFs parsed in a pool
+    of INGEST_PDF_PROCESSES processes. At most INGEST_LOAD_WINDOW files are in
+    flight or waiting to be consumed, which bounds memory however large the
+    corpus is. Files that fail to load are reported and skipped.
+    """
+    stats = stats if stats is not None else LoadStats()
+    threads = ThreadPoolExecutor(settings.INGEST_LOAD_THREADS, thread_name_prefix="load")
+    processes: ProcessPoolExecutor | None = None  # only started if there are PDFs
+    in_flight: deque[tuple[Path, Future]] = deque()
+    pdf_available = True
+    files = iter(files)
+    try:
+        while True:
+            while len(in_flight) < settings.INGEST_LOAD_WINDOW and (path := next(files, None)) is not None:
+                if path.suffix == PDF_SUFFIX:
+                    if not pdf_available:
+                        continue
+                    if processes is None:
+                        processes = ProcessPoolExecutor(settings.INGEST_PDF_PROCESSES or os.cpu_count())
+                    in_flight.append((path, processes.submit(_load_pdf, str(path))))
+                else:
+                    in_flight.append((path, threads.submit(_load_text, str(path))))
+            if not in_flight:
+                return
+
+            path, future = in_flight.popleft()
+            fmt = path.suffix.lstrip(".")
             try:
-                loader = PyPDFLoader(str(pdf_file))
-                pdf_docs = loader.load()
-                docs.extend(pdf_docs)
-                loaded_count += 1
+                docs = future.result()
             except ImportError:
-                print("    ERROR: pypdf not installed. Run: pip install pypdf")
-                break
+                if pdf_available:
+                    print("    ERROR: pypdf not installed. Run: pip install pypdf")
+                pdf_available = False
+                stats.record(fmt, ok=False)
+                continue
             except Exception as e:
-                print(f"    Warning: could not load {pdf_file.name}: {e}")
-        print(f"    Loaded {loaded_count} PDF files successfully")
+                print(f"    Warning: could not load {path.name}: {e}")
+                stats.record(fmt, ok=False)
+                continue
+            stats.record(fmt, ok=True)
+            yield path, docs
+    finally:
+        threads.shutdown(wait=True, cancel_futures=True)
+        if processes is not None:
+            processes.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_documents(data_dir: str, only: set[str] | None = None, stats: LoadStats | None = None) -> Iterator[Document]:
+    """Stream documents from the data directory (.txt, .md, .csv, .rst, .pdf files).
+
+    If `only` is given, just the files whose path is in it are loaded.
+    """
+    data_path = Path(data_dir).resolve()
+    if not data_path.exists():
+        print(f"  Data directory not found: {data_path}")
+        return
+    files = [f for f in discover_files(data_dir) if only is None or str(f) in only]
+    for _, docs in iter_files(files, stats):
+        yield from docs
+
 
+def load_documents(data_dir: str, only: set[str] | None = None) -> list:
+    """Load all documents from the data directory into a list (see `iter_documents`)."""
+    stats = LoadStats()
+    docs = list(iter_documents(data_dir, only, stats))
+    if stats.seconds:
+        print(f"  Loaded {stats.report()}")
     return docs
 
 
-def chunk_documents(docs: list) -> list:
-    """Split documents into chunks."""
-    splitter = RecursiveCharacterTextSplitter(
+def _splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
         chunk_size=settings.CHUNK_SIZE,
         chunk_overlap=settings.CHUNK_OVERLAP,
         length_function=len,
         add_start_index=True,
     )
-    chunks = splitter.split_documents(docs)
 
-    # Add metadata to each chunk
-    for i, chunk in enumerate(chunks):
-        chunk.metadata["chunk_index"] = i
-        chunk.metadata["ingested_at"] = datetime.now(timezone.utc).isoformat()
 
-    return chunks
+def iter_chunks(docs: Iterable[Document]) -> Iterator[Document]:
+    """Split a stream of documents into chunks, each with a deterministic `chunk_id` in its metadata.
+
+    Documents are split one at a time, so only the current document's chunks are held.
+    """
+    splitter = _splitter()
+    ingested_at = datetime.now(timezone.utc).isoformat()
+    per_source: dict[str, int] = {}
+    for doc in docs:
+        for chunk in splitter.split_documents([doc]):
+            source = chunk.metadata.get("source", "unknown")
+            chunk.metadata["chunk_index"] = per_source.get(source, 0)
+            per_source[source] = chunk.metadata["chunk_index"] + 1
+            chunk.metadata["ingested_at"] = ingested_at
+            chunk.metadata["chunk_id"] = chunk_id(
+                source,
+                chunk.page_content,
+                start_index=chunk.metadata.get("start_index"),
+                page=chunk.metadata.get("page"),
+            )
+            yield chunk
+
+
+def chunk_documents(docs: Iterable[Document]) -> list:
+    """Split documents into chunks, each with a deterministic `chunk_id` in its metadata."""
+    return list(iter_chunks(docs))
+
+
+def _embedding_dims() -> int:
+    """Vector size of the embedding model (the probe is answered from the embedding cache after the first run)."""
+    return len(get_embeddings().embed_query("dimension probe"))
+
 
+def _target_index(es, alias: str, full: bool) -> tuple[str, str | None]:
+    """Pick the index this run writes to: (target, live). A new versioned index is built unless
+    the live one can be updated in place; an interrupted build recorded in the manifest is resumed.
+    """
+    live = index.live_index(es, alias)
+    building = recorded_index(settings.INGEST_MANIFEST_PATH)
+    if not full:
+        if building and building != live and building.startswith(f"{alias}-") and es.indices.exists(index=building):
+            print(f"Resuming interrupted build of {building} ({alias} still serves {live or 'nothing'})")
+            return building, live
+        if live is not None and live != alias:
+            return live, live
 
-def ingest(data_dir: str | None = None) -> int:
-    """Run the full ingestion pipeline. Returns number of chunks ingested."""
+    target = index.new_index_name(alias)
+    reason = "full rebuild" if full else ("first build" if live is None else f"migrating {alias} behind an alias")
+    print(f"Building {target} ({reason}); {alias} keeps serving {live or 'nothing'} until it is ready")
+    index.drop_stale_builds(es, alias, keep={live} if live else set())
+    index.create_index(es, target, dims=_embedding_dims())
+    return target, live
+
+
+def _local_target(full: bool):
+    """The embedded index this run writes to and whether it is a rebuild. The live index is updated
+    in place unless `full` or the manifest tracks another one; an interrupted build is resumed.
+    """
+    store = get_local_index()
+    store.refresh()
+    building = recorded_index(settings.INGEST_MANIFEST_PATH)
+    if not full:
+        if building == store.name:
+            return store, False
+        resumed = store.resume_build(building)
+        if resumed is not None:
+            print(f"Resuming interrupted build of {resumed.name} ({store.name} still serves)")
+            return resumed, True
+    build = store.new_build()
+    print(f"Building {build.name} ({'full rebuild' if full else 'first build'}); {store.name} keeps serving until it is ready")
+    return build, True
+
+
+def ingest(data_dir: str | None = None, full: bool = False) -> int:
+    """Run the ingestion pipeline. Returns number of chunks written in this run.
+
+    Only files that are new, changed, or left incomplete by an interrupted run
+    are chunked and embedded; the manifest is saved after every batch. With
+    `full` (or on first run) everything is written to a new versioned index
+    that replaces the live one behind ES_INDEX_NAME once complete.
+    """
     data_dir = data_dir or settings.DATA_DIR
+    alias = settings.ES_INDEX_NAME
+    local = settings.RETRIEVAL_BACKEND == "local"
+    if local:
+        es = None
+        vector_store, rebuild = _local_target(full)
+        target = vector_store.name
+    else:
+        es = get_es_client()
+        target, live = _target_index(es, alias, full)
+        rebuild = target != live
+        vector_store = get_vector_store(target)
+    manifest = IngestManifest.load(settings.INGEST_MANIFEST_PATH, target)
+
+    print(f"Scanning documents in: {data_dir}")
+    files = discover_files(data_dir)
+    hashes = {str(path): file_sha256(path) for path in files}
+    pending = {src for src, sha in hashes.items() if not manifest.is_current(src, sha)}
+    removed = [src for src in manifest.files if src not in hashes]
+    print(f"   {len(hashes)} files: {len(pending)} new/changed, {len(removed)} removed, "
+          f"{len(hashes) - len(pending)} unchanged")
+
+    changed = bool(removed) or rebuild
+    # Deduplicated chunks are shared between files: only delete chunks no remaining
+    # file references, and keep `metadata.sources` of the shared ones in sync
+    source_additions: dict[str, list[str]] = {}
+    source_removals: dict[str, list[str]] = {}
+    dropped = {src: manifest.remove_file(src) for src in removed}
+    shared = manifest.shared_ids({i for ids in dropped.values() for i in ids})
+    stale_ids = []
+    for src, ids in dropped.items():
+        for i in ids:
+            if i in shared:
+                source_removals.setdefault(i, []).append(src)
+            else:
+                stale_ids.append(i)
+    if stale_ids:
+        print(f"Deleting {len(stale_ids)} chunks of removed files")
+        vector_store.delete(ids=stale_ids)
+    manifest.save()
+
+    # Files are loaded, chunked and diffed against the manifest one at a time as
+    # the pipeline pulls batches, so memory holds a window of files, not the corpus
+    loaded: list[str] = []
+    load_stats = LoadStats()
+    dedup = ChunkDeduplicator(
+        settings.DEDUP_THRESHOLD, settings.DEDUP_NUM_PERM, settings.DEDUP_BANDS, settings.DEDUP_SHINGLE_SIZE
+    ) if settings.DEDUP_ENABLED else None
+    written: set[str] = set()  # chunk IDs known to be in the index
+    waiting: dict[str, list[str]] = {}  # canonical chunk ID -> files whose duplicates wait for it to be written
+
+    def _chunks_to_write() -> Iterator[Document]:
+        nonlocal changed
+        for path, docs in iter_files([path for path in files if str(path) in pending], load_stats):
+            src = str(path)
+            file_chunks = chunk_documents(docs)
+            duplicates = []
+            if dedup is not None:
+                file_chunks, duplicates = dedup.split(file_chunks)
+            new_ids = [c.metadata["chunk_id"] for c in file_chunks] + [canonical for _, canonical in duplicates]
+            committed = manifest.committed_ids(src)
+            stale = committed - set(new_ids)
+            if stale:
+                still_shared = manifest.shared_ids(stale, exclude=src)
+                for i in still_shared:
+                    source_removals.setdefault(i, []).append(src)
+                if stale - still_shared:
+                    vector_store.delete(ids=list(stale - still_shared))
+                changed = True
+            manifest.start_file(src, hashes[src], [i for i in new_ids if i in committed])
+            if stale:
+                manifest.save()
+            loaded.append(src)
+            written.update(committed)
+            for _, canonical in duplicates:
+                source_additions.setdefault(canonical, []).append(src)
+                if canonical in written:
+                    manifest.commit_chunks(src, [canonical])
+                else:
+                    waiting.setdefault(canonical, []).append(src)
+            yield from (c for c in file_chunks if c.metadata["chunk_id"] not in committed)
+
+    # Embed and bulk-write concurrently; each committed batch is checkpointed
+    # so an interrupted run resumes from here
+    def _commit(batch: list) -> None:
+        for chunk in batch:
+            cid = chunk.metadata["chunk_id"]
+            manifest.commit_chunks(chunk.metadata["source"], [cid])
+            written.add(cid)
+            for src in waiting.pop(cid, []):
+                manifest.commit_chunks(src, [cid])
+        manifest.save()
 
-    print(f"Loading documents from: {data_dir}")
-    docs = load_documents(data_dir)
-    if not docs:
-        print("  No documents found. Add .txt or .md files to the data/ folder.")
-        return 0
+    def _update_sources() -> None:
+        if source_additions or source_removals:
+            if local:
+                updated = vector_store.update_sources(source_additions, source_removals)
+            else:
+                updated = index.update_sources(es, target, source_additions, source_removals)
+            failed = len(set(source_additions) | set(source_removals)) - updated
+            if failed:
+                print(f"   Warning: {failed} shared chunks could not update their source list")
+            source_additions.clear()
+            source_removals.clear()
 
-    print(f"Chunking {len(docs)} documents (size={settings.CHUNK_SIZE}, overlap={settings.CHUNK_OVERLAP})")
-    chunks = chunk_documents(docs)
-    print(f"   Created {len(chunks)} chunks")
+    total = 0
+    if pending or rebuild:
+        print(f"Loading, chunking (size={settings.CHUNK_SIZE}, overlap={settings.CHUNK_OVERLAP}) and "
+              f"embedding {len(pending)} documents into {'' if local else 'Elasticsearch '}index: {target}")
+        # Refresh (and, for a new index, replicas) stay off until the load is done
+        loading = nullcontext() if local else index.bulk_load(
+            es, target, live=not rebuild, force_merge=rebuild and settings.ES_FORCE_MERGE
+        )
+        with loading:
+            with closing(_chunks_to_write()) as chunks:
+                stats = run_pipeline(chunks, get_embeddings(), vector_store, on_committed=_commit)
+            _update_sources()
+        total = stats.chunks
+        if load_stats.seconds:
+            print(f"   Loaded {load_stats.report()}")
+        if dedup is not None and dedup.stats.duplicates:
+            per_chunk = stats.embed_seconds / stats.chunks if stats.chunks else 0.0
+            print(f"   Dedup: {dedup.stats.report(per_chunk, _embedding_dims())}")
+        if total:
+            print(f"   {stats.chunks} chunks in {stats.elapsed:.1f}s ({stats.chunks_per_sec:.1f} chunks/sec, "
+                  f"embed {stats.embed_seconds:.1f}s, write {stats.write_seconds:.1f}s, {stats.retries} retries)")
+            changed = True
 
-    print(f"Embedding and storing in Elasticsearch index: {settings.ES_INDEX_NAME}")
-    vector_store = get_vector_store()
+    _update_sources()  # removals of files when nothing else needed loading
+    for src in loaded:
+        manifest.complete_file(src)
+    if changed:
+        manifest.generation += 1
+    manifest.save()
 
-    # Ingest in batches to avoid timeout on large document sets
-    batch_size = 50
-    total = len(chunks)
-    for i in range(0, total, batch_size):
-        batch = chunks[i : i + batch_size]
-        vector_store.add_documents(batch)
-        print(f"   Ingested {min(i + batch_size, total)}/{total} chunks...")
+    if local:
+        if settings.LOCAL_INDEX_NLIST and (rebuild or not vector_store.trained):
+            vector_store.train()
+            print(f"   Trained {settings.LOCAL_INDEX_NLIST} IVF cells over {len(vector_store)} chunks")
+        if rebuild:
+            replaced = vector_store.publish()
+            print(f"   {vector_store.name} is now live" + (f" (deleted {', '.join(replaced)})" if replaced else ""))
+    elif rebuild:
+        replaced = index.swap_alias(es, alias, target)
+        print(f"   {alias} now serves {target}" + (f" (deleted {', '.join(replaced)})" if replaced else ""))
 
-    print(f"Ingested {total} chunks successfully!")
+    print(f"Ingested {total} chunks successfully! (generation {manifest.generation})")
     return total
 
 
 if __name__ == "__main__":
-    data_dir = sys.argv[1] if len(sys.argv) > 1 else None
-    ingest(data_dir)
+    parser = argparse.ArgumentParser(description="Ingest documents into Elasticsearch")
+    parser.add_argument("data_dir", nargs="?", default=None)
+    parser.add_argument("--full", action="store_true", help="rebuild everything into a new index, then swap it in")
+    args = parser.parse_args()
+    ingest(args.data_dir, full=args.full)
@@ -0,0 +1,170 @@
+"""Ingestion manifest — tracks what has already been embedded and indexed.
+
+The manifest is a small JSON file mapping each source file to its content hash
+and the deterministic IDs of the chunks written for it. `ingest()` uses it to
+embed only new or changed files, delete chunks of removed files, and resume an
+interrupted run from the last committed batch.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+MANIFEST_VERSION = 1
+
+_generation_cache: dict[str, tuple[int, int]] = {}
+
+
+def file_sha256(path: str | Path) -> str:
+    """Hash a file's raw bytes (streamed, so large PDFs don't load into memory)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(source: str, text: str, start_index: int | None = None, page: int | None = None) -> str:
+    """Deterministic chunk ID so re-ingesting the same content overwrites, not duplicates."""
+    key = f"{source}\x00{page if page is not None else ''}\x00{start_index if start_index is not None else ''}\x00{text}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def current_generation(path: str | Path) -> int:
+    """The manifest's ingest generation, re-read only when the file changes (0 if missing)."""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+    cached = _generation_cache.get(str(path))
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        generation = int(json.loads(Path(path).read_text(encoding="utf-8")).get("generation", 0))
+    except (OSError, ValueError):
+        return cached[1] if cached else 0
+    _generation_cache[str(path)] = (mtime, generation)
+    return generation
+
+
+def recorded_index(path: str | Path) -> str | None:
+    """The index a manifest file describes (None if it is missing or unreadable)."""
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8")).get("index")
+    except (OSError, ValueError):
+        return None
+
+
+class IngestManifest:
+    """JSON-backed record of ingested files, saved atomically after every batch.
+
+    Layout:
+        {"version": 1, "index": "knowledge-base-20260117t093000123456", "generation": 3,
+         "files": {"/abs/path.md": {"sha256": "...", "chunk_ids": [...], "complete": true}}}
+
+    `generation` increases whenever the indexed content changes, so caches keyed
+    on the knowledge base can tell when they are stale.
+    """
+
+    def __init__(self, path: str | Path, index_name: str):
+        self.path = Path(path)
+        self.index_name = index_name
+        self.generation = 0
+        self.files: dict[str, dict] = {}
+        self._refs: dict[str, set[str]] | None = None  # chunk ID -> files listing it, built on first use
+
+    @classmethod
+    def load(cls, path: str | Path, index_name: str) -> "IngestManifest":
+        """Load the manifest, starting fresh if it is missing, corrupt or for another index."""
+        manifest = cls(path, index_name)
+        try:
+            data = json.loads(manifest.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return manifest
+        if data.get("version") != MANIFEST_VERSION or data.get("index") != index_name:
+            # Keep the generation moving forward so downstream caches still invalidate
+            manifest.generation = int(data.get("generation", 0)) + 1
+            return manifest
+        manifest.generation = int(data.get("generation", 0))
+        manifest.files = data.get("files", {})
+        return manifest
+
+    def save(self) -> None:
+        """Write atomically (tmp file + rename) so a crash never leaves a torn manifest."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        payload = {
+            "version": MANIFEST_VERSION,
+            "index": self.index_name,
+            "generation": self.generation,
+            "files": self.files,
+        }
+        tmp.write_text(json.dumps(payload, indent=1), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def reset(self) -> None:
+        """Forget every file (e.g. the index was dropped) and bump the generation."""
+        self.files = {}
+        self._refs = None
+        self.generation += 1
+
+    def is_current(self, source: str, sha256: str) -> bool:
+        """True if the file was fully ingested with exactly this content."""
+        entry = self.files.get(source)
+        return bool(entry and entry.get("complete") and entry.get("sha256") == sha256)
+
+    def committed_ids(self, source: str) -> set[str]:
+        """Chunk IDs already written to the index for this file."""
+        entry = self.files.get(source)
+        return set(entry.get("chunk_ids", [])) if entry else set()
+
+    def _references(self) -> dict[str, set[str]]:
+        if self._refs is None:
+            self._refs = {}
+            for source, entry in self.files.items():
+                for i in entry.get("chunk_ids", []):
+                    self._refs.setdefault(i, set()).add(source)
+        return self._refs
+
+    def _link(self, source: str, ids) -> None:
+        if self._refs is not None:
+            for i in ids:
+                self._refs.setdefault(i, set()).add(source)
+
+    def _unlink(self, source: str) -> None:
+        if self._refs is not None and source in self.files:
+            for i in self.files[source].get("chunk_ids", []):
+                sources = self._refs.get(i)
+                if sources is not None:
+                    sources.discard(source)
+                    if not sources:
+                        del self._refs[i]
+
+    def shared_ids(self, ids, exclude: str | None = None) -> set[str]:
+        """Those of `ids` listed by a file other than `exclude` (deduplicated chunks are shared between files)."""
+        refs = self._references()
+        return {i for i in ids if refs.get(i, set()) - {exclude}}
+
+    def start_file(self, source: str, sha256: str, kept_ids: list[str]) -> None:
+        """Mark a file as in progress with the chunk IDs that survive from earlier runs."""
+        self._unlink(source)
+        self.files[source] = {"sha256": sha256, "chunk_ids": list(kept_ids), "complete": False}
+        self._link(source, kept_ids)
+
+    def commit_chunks(self, source: str, ids: list[str]) -> None:
+        """Record chunk IDs that were successfully written."""
+        entry = self.files[source]
+        known = set(entry["chunk_ids"])
+        new = [i for i in dict.fromkeys(ids) if i not in known]
+        entry["chunk_ids"].extend(new)
+        self._link(source, new)
+
+    def complete_file(self, source: str) -> None:
+        self.files[source]["complete"] = True
+
+    def remove_file(self, source: str) -> list[str]:
+        """Drop a file from the manifest and return the chunk IDs to delete."""
+        self._unlink(source)
+        entry = self.files.pop(source, None)
+        return list(entry.get("chunk_ids", [])) if entry else []
@@ -0,0 +1,188 @@
+"""Concurrent embed → bulk-write pipeline used by `ingest()`.
+
+Batches are embedded against Ollama with bounded concurrency while earlier
+batches are bulk-written to Elasticsearch, so neither backend sits idle.
+Batch size adapts: it grows while both sides keep up and halves on 429s and
+timeouts, which are retried with exponential backoff.
+"""
+
+import itertools
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Iterable
+
+import httpx
+from elasticsearch import ApiError, ConnectionError as ESConnectionError, ConnectionTimeout
+from elasticsearch.helpers import BulkIndexError
+from ollama import ResponseError
+
+from src.config import settings
+
+_RETRYABLE_STATUS = {429, 502, 503, 504}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """True for backpressure (429/503) and timeouts from Ollama or Elasticsearch."""
+    if isinstance(exc, (ConnectionTimeout, ESConnectionError, httpx.TimeoutException, httpx.ConnectError)):
+        return True
+    if isinstance(exc, ApiError):
+        return exc.meta.status in _RETRYABLE_STATUS
+    if isinstance(exc, ResponseError):
+        return exc.status_code in _RETRYABLE_STATUS
+    if isinstance(exc, BulkIndexError):
+        statuses = {next(iter(e.values()), {}).get("status") for e in exc.errors}
+        return bool(statuses) and statuses <= _RETRYABLE_STATUS
+    return False
+
+
+class AdaptiveBatchSize:
+    """Additive-increase / multiplicative-decrease batch size, shared across workers."""
+
+    def __init__(self, initial: int, minimum: int, maximum: int, step: int = 10):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.value = min(max(initial, self.minimum), self.maximum)
+        self.step = step
+        self._lock = threading.Lock()
+
+    def grow(self) -> None:
+        with self._lock:
+            self.value = min(self.maximum, self.value + self.step)
+
+    def shrink(self) -> None:
+        with self._lock:
+            self.value = max(self.minimum, self.value // 2)
+
+
+@dataclass
+class PipelineStats:
+    chunks: int = 0
+    batches: int = 0
+    retries: int = 0
+    embed_seconds: float = 0.0
+    write_seconds: float = 0.0
+    elapsed: float = 0.0
+    batch_sizes: list[int] = field(default_factory=list)
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.elapsed if self.elapsed else 0.0
+
+
+def _with_retry(fn: Callable, batch_size: AdaptiveBatchSize, stats: PipelineStats, lock: threading.Lock):
+    """Call fn, retrying retryable errors with exponential backoff and shrinking the batch size."""
+    delay = settings.INGEST_RETRY_BACKOFF
+    for attempt in range(settings.INGEST_MAX_RETRIES + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == settings.INGEST_MAX_RETRIES or not is_retryable(e):
+                raise
+            batch_size.shrink()
+            with lock:
+                stats.retries += 1
+            print(f"   Retrying after {type(e).__name__} (attempt {attempt + 1}, backoff {delay:.1f}s)")
+            time.sleep(delay)
+            delay *= 2
+
+
+def run_pipeline(chunks: Iterable, embeddings, vector_store, on_committed: Callable[[list], None]) -> PipelineStats:
+    """Embed and index `chunks` concurrently; `on_committed(batch)` runs on the caller's thread.
+
+    `chunks` may be a lazy iterator: batches are pulled from it (on the caller's
+    thread) only as the embedders have room, so it is never materialized. At
+    most INGEST_EMBED_CONCURRENCY embed requests and INGEST_WRITE_CONCURRENCY
+    bulk requests are in flight, which also bounds how many embedded batches
+    are held in memory at once.
+    """
+    stats = PipelineStats()
+    stats_lock = threading.Lock()
+    index_lock = threading.Lock()
+    index_ready = threading.Event()
+    batch_size = AdaptiveBatchSize(
+        settings.INGEST_BATCH_SIZE, settings.INGEST_MIN_BATCH_SIZE, settings.INGEST_MAX_BATCH_SIZE
+    )
+
+    def embed(batch: list) -> tuple[list, list]:
+        start = time.perf_counter()
+        vectors = _with_retry(
+            lambda: embeddings.embed_documents([c.page_content for c in batch]), batch_size, stats, stats_lock
+        )
+        with stats_lock:
+            stats.embed_seconds += time.perf_counter() - start
+        return batch, vectors
+
+    def write(batch: list, vectors: list) -> list:
+        start = time.perf_counter()
+
+        def _bulk(create: bool):
+            return vector_store.add_embeddings(
+                list(zip([c.page_content for c in batch], vectors)),
+                metadatas=[c.metadata for c in batch],
+                ids=[c.metadata["chunk_id"] for c in batch],
+                refresh_indices=False,
+                create_index_if_not_exists=create,
+                bulk_kwargs={"max_retries": settings.INGEST_MAX_RETRIES},
+            )
+
+        written = False
+        if not index_ready.is_set():
+            # The first writer creates the index; the others wait rather than race it
+            with index_lock:
+                if not index_ready.is_set():
+                    _with_retry(lambda: _bulk(True), batch_size, stats, stats_lock)
+                    index_ready.set()
+                    written = True
+        if not written:
+            _with_retry(lambda: _bulk(False), batch_size, stats, stats_lock)
+        with stats_lock:
+            stats.write_seconds += time.perf_counter() - start
+        return batch
+
+    started = time.perf_counter()
+    total = len(chunks) if hasattr(chunks, "__len__") else None
+    pending = iter(chunks)
+    exhausted = False
+    embed_pool = ThreadPoolExecutor(settings.INGEST_EMBED_CONCURRENCY, thread_name_prefix="embed")
+    write_pool = ThreadPoolExecutor(settings.INGEST_WRITE_CONCURRENCY, thread_name_prefix="bulk")
+    embedding, writing = set(), set()
+    try:
+        while not exhausted or embedding or writing:
+            # Keep the embedder saturated, but don't run ahead of the writers
+            while (
+                not exhausted
+                and len(embedding) < settings.INGEST_EMBED_CONCURRENCY
+                and len(writing) <= settings.INGEST_WRITE_CONCURRENCY
+            ):
+                batch = list(itertools.islice(pending, batch_size.value))
+                if len(batch) < batch_size.value:
+                    exhausted = True
+                if batch:
+                    embedding.add(embed_pool.submit(embed, batch))
+            if not embedding and not writing:
+                break
+
+            done, _ = wait(embedding | writing, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in embedding:
+                    embedding.discard(future)
+                    writing.add(write_pool.submit(write, *future.result()))
+                else:
+                    writing.discard(future)
+                    batch = future.result()
+                    on_committed(batch)
+                    batch_size.grow()
+                    stats.chunks += len(batch)
+                    stats.batches += 1
+                    stats.batch_sizes.append(len(batch))
+                    elapsed = time.perf_counter() - started
+                    print(f"   Ingested {stats.chunks}{f'/{total}' if total is not None else ''} chunks "
+                          f"({stats.chunks / elapsed:.1f} chunks/sec, batch size {batch_size.value})")
+    finally:
+        embed_pool.shutdown(wait=True, cancel_futures=True)
+        write_pool.shutdown(wait=True, cancel_futures=True)
+        stats.elapsed = time.perf_counter() - started
+
+    return stats
@@ -0,0 +1,371 @@
+"""Embedded vector index: an in-process alternative to Elasticsearch for kNN.
+
+Chunk vectors are L2-normalized and kept in a memory-mapped matrix (float32,
+or int8 at a quarter of the size), with text and metadata in a SQLite side
+table. A query is a vectorized dot product over every row (brute force) or,
+once trained with LOCAL_INDEX_NLIST > 0 cells, over the rows of the
+LOCAL_INDEX_NPROBE k-means cells nearest to it (IVF). No HTTP round-trip, no JVM.
+
+Scores use Elasticsearch's cosine scale, (1 + cos) / 2, so hits grade and pack
+exactly like ES kNN hits. The index implements the `add_embeddings` / `delete`
+part of the vector store API that `ingest()` writes through. Select it with
+RETRIEVAL_BACKEND=local; it serves dense retrieval only (BM25 and hybrid need
+Elasticsearch).
+
+Several processes can share an index (the server reads while `ingest` writes).
+Every write bumps a `generation` in the meta table, and readers reload their row
+map and memmaps when it moves. Full rebuilds go to a side directory
+(`new_build()`) that `publish()` makes live by atomically renaming a CURRENT
+file over the old one, so readers switch over without ever seeing a half-built
+index.
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+SEARCH_BLOCK_ROWS = 65_536  # rows scored per block, bounding the temporary float32 copy for int8
+CURRENT_FILE = "CURRENT"  # names the live build directory; absent = files directly in the index directory
+_DATA_FILES = ("chunks.sqlite", "chunks.sqlite-wal", "chunks.sqlite-shm",
+               "vectors.f32", "vectors.i8", "cells.i32", "centroids.npy")
+
+
+class LocalVectorIndex:
+    """Memory-mapped vectors plus a SQLite table of chunk ID, row, text and metadata."""
+
+    def __init__(self, directory: str | Path, dtype: str = "float32", nlist: int = 0, nprobe: int = 8,
+                 build: str | None = None):
+        """Open the live build under `directory`, or the side directory `build` if given (as ingest does)."""
+        if dtype not in ("float32", "int8"):
+            raise ValueError(f"Unknown local index dtype: {dtype}")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dtype = dtype
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self._pinned = build
+        self._lock = threading.RLock()
+        self._db: sqlite3.Connection | None = None
+        self._open(build or self._current())
+
+    def _current(self) -> str:
+        try:
+            return (self.directory / CURRENT_FILE).read_text(encoding="utf-8").strip() or "."
+        except FileNotFoundError:
+            return "."
+
+    def _open(self, build: str) -> None:
+        if self._db is not None:
+            self._db.close()
+        self._build = build
+        self._path = self.directory / build
+        self._path.mkdir(exist_ok=True)
+        self.name = f"local:{self._path}"
+        self._db = sqlite3.connect(self._path / "chunks.sqlite", check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, row INTEGER NOT NULL UNIQUE, text TEXT NOT NULL, metadata TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS free_rows (row INTEGER PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """
+        )
+        self._db.execute("BEGIN")
+        try:
+            self._reload()
+        finally:
+            self._db.execute("COMMIT")
+        stored = self._db.execute("SELECT value FROM meta WHERE name = 'dtype'").fetchone()
+        if stored and stored[0] != self.dtype:
+            raise ValueError(f"{self._path} holds {stored[0]} vectors; rebuild it (ingest --full) to use {self.dtype}")
+
+    def _reload(self) -> None:
+        """Re-read the row map, dimension and IVF centroids (inside a transaction); memmaps remap on next use."""
+        meta = dict(self._db.execute("SELECT name, value FROM meta").fetchall())
+        self._generation = meta.get("generation")
+        self.dim: int | None = int(meta["dim"]) if "dim" in meta else None
+        self._mmap: np.memmap | None = None
+        self._cells: np.memmap | None = None
+        self._live = np.zeros(0, dtype=bool)
+        if self.dim:
+            # Vector files are grown before the rows that need them commit, so they cover every row read here
+            rows = [r for (r,) in self._db.execute("SELECT row FROM chunks")]
+            self._live = np.zeros(self._rows(), dtype=bool)
+            self._live[rows] = True
+        centroids = self._path / "centroids.npy"
+        self._centroids: np.ndarray | None = np.load(centroids) if centroids.exists() else None
+
+    def _sync(self) -> None:
+        """Reload if another instance committed since we last looked (call inside a transaction)."""
+        row = self._db.execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()
+        if (row[0] if row else None) != self._generation:
+            self._reload()
+
+    def _bump(self) -> None:
+        row = self._db.execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()
+        self._generation = str(int(row[0]) + 1 if row else 1)
+        self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('generation', ?)", (self._generation,))
+
+    def refresh(self) -> None:
+        """Catch up with other processes: switch to a newly published build, reload after their writes."""
+        with self._lock:
+            current = self._current()
+            if self._pinned is None and current != self._build:
+                self._open(current)
+                return
+            self._db.execute("BEGIN")
+            try:
+                self._sync()
+            finally:
+                self._db.execute("COMMIT")
+
+    def __len__(self) -> int:
+        self.refresh()
+        return int(self._live.sum())
+
+    @property
+    def trained(self) -> bool:
+        return self._centroids is not None
+
+    # ── vector files ──
+    @property
+    def _vectors_path(self) -> Path:
+        return self._path / ("vectors.i8" if self.dtype == "int8" else "vectors.f32")
+
+    def _row_bytes(self) -> int:
+        return self.dim * (1 if self.dtype == "int8" else 4)
+
+    def _rows(self) -> int:
+        if not self.dim or not self._vectors_path.exists():
+            return 0
+        return self._vectors_path.stat().st_size // self._row_bytes()
+
+    def _view(self, min_rows: int = 0) -> np.memmap:
+        """Memmap covering at least `min_rows` rows, growing the files (doubling) if needed."""
+        if self._mmap is not None and self._mmap.shape[0] >= min_rows:
+            return self._mmap
+        rows = self._rows()
+        if rows < min_rows:
+            rows = max(min_rows, rows * 2, 1024)
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(rows * self._row_bytes())
+            with open(self._path / "cells.i32", "ab") as f:
+                f.truncate(rows * 4)
+        if rows > len(self._live):  # the files may also have been grown by another instance
+            self._live = np.concatenate([self._live, np.zeros(rows - len(self._live), dtype=bool)])
+        dtype = np.int8 if self.dtype == "int8" else np.float32
+        self._mmap = np.memmap(self._vectors_path, dtype=dtype, mode="r+", shape=(rows, self.dim))
+        self._cells = np.memmap(self._path / "cells.i32", dtype=np.int32, mode="r+", shape=(rows,))
+        return self._mmap
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+        if self.dtype == "int8":
+            return np.clip(np.round(vectors * 127), -127, 127).astype(np.int8)
+        return vectors.astype(np.float32)
+
+    def _decode(self, rows: np.ndarray) -> np.ndarray:
+        return rows.astype(np.float32) / 127 if self.dtype == "int8" else rows
+
+    def _nearest_cells(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    # ── vector store API used by ingest() ──
+    def add_embeddings(self, text_embeddings, metadatas=None, ids=None, **kwargs) -> list[str]:
+        """Insert or overwrite chunks by ID (extra vector store keyword arguments are ignored)."""
+        texts = [text for text, _ in text_embeddings]
+        vectors = np.asarray([vector for _, vector in text_embeddings], dtype=np.float32)
+        metadatas = metadatas or [{} for _ in texts]
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                self._sync()
+                if self.dim is None:
+                    self.dim = vectors.shape[1]
+                    db.executemany("INSERT INTO meta (name, value) VALUES (?, ?)",
+                                   [("dim", str(self.dim)), ("dtype", self.dtype)])
+                existing = dict(self._select("SELECT id, row FROM chunks WHERE id IN ({})", ids))
+                free = [r for (r,) in db.execute("SELECT row FROM free_rows ORDER BY row LIMIT ?", (len(ids),))]
+                high = db.execute("SELECT MAX(m) FROM (SELECT MAX(row) AS m FROM chunks UNION ALL SELECT MAX(row) FROM free_rows)").fetchone()[0]
+                next_row = -1 if high is None else high
+                rows = []
+                for doc_id in ids:
+                    if doc_id in existing:
+                        rows.append(existing[doc_id])
+                    elif free:
+                        rows.append(free.pop(0))
+                    else:
+                        next_row += 1
+                        rows.append(next_row)
+                db.executemany("DELETE FROM free_rows WHERE row = ?", [(r,) for r in rows])
+                db.executemany(
+                    "INSERT OR REPLACE INTO chunks (id, row, text, metadata) VALUES (?, ?, ?, ?)",
+                    [(i, r, t, json.dumps(m)) for i, r, t, m in zip(ids, rows, texts, metadatas)],
+                )
+                view = self._view(max(rows) + 1)
+                encoded = self._encode(vectors)
+                view[rows] = encoded
+                self._cells[rows] = self._nearest_cells(self._decode(encoded)) if self._centroids is not None else -1
+                view.flush()
+                self._cells.flush()
+                self._live[rows] = True
+                self._bump()
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return list(ids)
+
+    def delete(self, ids: list[str]) -> None:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._sync()
+                rows = [r for _, r in self._select("SELECT id, row FROM chunks WHERE id IN ({})", ids)]
+                self._db.executemany("DELETE FROM chunks WHERE row = ?", [(r,) for r in rows])
+                self._db.executemany("INSERT OR IGNORE INTO free_rows (row) VALUES (?)", [(r,) for r in rows])
+                self._bump()
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._live[rows] = False
+
+    def update_sources(self, add: dict[str, list[str]], remove: dict[str, list[str]]) -> int:
+        """Same `metadata.sources` maintenance as index.update_sources for deduplicated chunks. Returns the chunks updated."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                updates = []
+                for doc_id, raw in self._select("SELECT id, metadata FROM chunks WHERE id IN ({})", sorted(set(add) | set(remove))):
+                    metadata = json.loads(raw)
+                    sources = metadata.setdefault("sources", [metadata.get("source")])
+                    sources.extend(s for s in add.get(doc_id, []) if s not in sources)
+                    metadata["sources"] = [s for s in sources if s not in remove.get(doc_id, [])]
+                    updates.append((json.dumps(metadata), doc_id))
+                self._db.executemany("UPDATE chunks SET metadata = ? WHERE id = ?", updates)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return len(updates)
+
+    # ── side-directory rebuilds ──
+    def new_build(self) -> "LocalVectorIndex":
+        """An empty index in a fresh side directory; this one keeps serving until `publish()` swaps it in."""
+        self.drop_stale_builds()
+        build = f"build-{datetime.now(timezone.utc):%Y%m%dt%H%M%S%f}"
+        return LocalVectorIndex(self.directory, self.dtype, self.nlist, self.nprobe, build=build)
+
+    def resume_build(self, name: str | None) -> "LocalVectorIndex | None":
+        """The unpublished build whose `name` a manifest recorded, if it still exists."""
+        build = (name or "").removeprefix(f"local:{self.directory}{os.sep}")
+        if not build.startswith("build-") or build == self._build or not (self.directory / build / "chunks.sqlite").exists():
+            return None
+        return LocalVectorIndex(self.directory, self.dtype, self.nlist, self.nprobe, build=build)
+
+    def publish(self) -> list[str]:
+        """Make this build live (atomic rename of CURRENT) and delete the builds it replaces."""
+        tmp = self.directory / f"{CURRENT_FILE}.tmp"
+        tmp.write_text(self._build, encoding="utf-8")
+        os.replace(tmp, self.directory / CURRENT_FILE)
+        for name in _DATA_FILES:  # an index from before side-directory builds kept its files at the top level
+            (self.directory / name).unlink(missing_ok=True)
+        return self.drop_stale_builds()
+
+    def drop_stale_builds(self) -> list[str]:
+        """Delete build directories other than the live one and this one; readers still mapping them keep
+        their open files until they refresh."""
+        keep = {self._current(), self._build}
+        stale = [path for path in self.directory.glob("build-*") if path.name not in keep]
+        for path in stale:
+            shutil.rmtree(path, ignore_errors=True)
+        return [path.name for path in stale]
+
+    # ── IVF ──
+    def train(self, iterations: int = 10, sample: int = 50_000, seed: int = 0) -> None:
+        """Cluster the vectors into `nlist` cells (spherical k-means) and assign every row to one."""
+        with self._lock:
+            self.refresh()
+            live = np.flatnonzero(self._live)
+            if not self.nlist or len(live) < self.nlist:
+                return
+            view = self._view()
+            rng = np.random.default_rng(seed)
+            points = self._decode(view[np.sort(rng.choice(live, min(sample, len(live)), replace=False))])
+            centroids = points[rng.choice(len(points), self.nlist, replace=False)].copy()
+            for _ in range(iterations):
+                assignment = np.argmax(points @ centroids.T, axis=1)
+                for cell in range(self.nlist):
+                    members = points[assignment == cell]
+                    if len(members):
+                        centroids[cell] = members.sum(axis=0)
+                centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-12
+            self._centroids = centroids.astype(np.float32)
+            for start in range(0, len(view), SEARCH_BLOCK_ROWS):
+                self._cells[start:start + SEARCH_BLOCK_ROWS] = self._nearest_cells(
+                    self._decode(view[start:start + SEARCH_BLOCK_ROWS])
+                )
+            self._cells.flush()
+            with open(self._path / "centroids.npy.tmp", "wb") as f:
+                np.save(f, self._centroids)
+            os.replace(self._path / "centroids.npy.tmp", self._path / "centroids.npy")
+            self._db.execute("BEGIN IMMEDIATE")
+            self._bump()
+            self._db.execute("COMMIT")
+
+    # ── search ──
+    def search(self, queries: list[list[float]], k: int) -> list[list[dict]]:
+        """Top-k chunks per query vector: [{"id", "text", "metadata", "score"}], score = (1 + cos) / 2."""
+        query_matrix = np.asarray(queries, dtype=np.float32)
+        query_matrix /= np.linalg.norm(query_matrix, axis=1, keepdims=True) + 1e-12
+        with self._lock:
+            self.refresh()
+            if not self._live.any():
+                return [[] for _ in queries]
+            view = self._view()
+            candidates = [np.flatnonzero(self._live)] * len(queries)
+            if self._centroids is not None:
+                cells = np.argsort(-(query_matrix @ self._centroids.T), axis=1)[:, : self.nprobe]
+                candidates = [rows[np.isin(self._cells[rows], probe)] for rows, probe in zip(candidates, cells)]
+
+            results = []
+            for query, rows in zip(query_matrix, candidates):
+                scores = np.concatenate([
+                    self._decode(view[rows[i:i + SEARCH_BLOCK_ROWS]]) @ query
+                    for i in range(0, len(rows), SEARCH_BLOCK_ROWS)
+                ]) if len(rows) else np.zeros(0, dtype=np.float32)
+                top = np.argsort(-scores)[:k] if len(scores) <= k else np.argpartition(-scores, k)[:k]
+                top = top[np.argsort(-scores[top])]
+                results.append([(int(rows[i]), float(scores[i])) for i in top])
+
+            by_row = dict(
+                (row, (doc_id, text, metadata)) for doc_id, row, text, metadata in self._select(
+                    "SELECT id, row, text, metadata FROM chunks WHERE row IN ({})",
+                    sorted({row for hits in results for row, _ in hits}),
+                )
+            )
+        # A row another process deleted after this snapshot has no chunk any more: drop it
+        return [
+            [{"id": by_row[row][0], "text": by_row[row][1], "metadata": json.loads(by_row[row][2]),
+              "score": (1 + cos) / 2} for row, cos in hits if row in by_row]
+            for hits in results
+        ]
+
+    def _select(self, sql: str, values: list) -> list[tuple]:
+        rows = []
+        for i in range(0, len(values), 500):
+            part = values[i:i + 500]
+            rows.extend(self._db.execute(sql.format(",".join("?" * len(part))), part).fetchall())
+        return rows
+
+    def stats(self) -> dict:
+        return {"chunks": len(self), "dim": self.dim, "dtype": self.dtype,
+                "ivf_cells": len(self._centroids) if self.trained else 0}
@@ -0,0 +1,153 @@
+"""MCP server exposing the agent's tools.
+
+Usage: python -m src.mcp_server   (requires the mcp extra: pip install -e ".[mcp]")
+
+Tools: search_knowledge_base, web_search, calculator and run_agent (the full
+graph). One persistent process shares the pooled ES/Ollama clients and caches
+across calls, and serves concurrent calls on one event loop:
+  - KB searches arriving within MCP_BATCH_WINDOW_MS are coalesced into one
+    embedding call and one _msearch request (see SearchBatcher)
+  - web searches keep their own concurrency cap and deadline
+  - LLM generations inside run_agent hold an OLLAMA_MAX_CONCURRENCY slot
+
+Transport is MCP_TRANSPORT (stdio by default, for Claude Desktop / Cursor).
+"""
+
+import asyncio
+import sys
+from collections import defaultdict
+
+try:
+    from mcp.server.fastmcp import FastMCP
+except ImportError:  # mcp >= 2 renamed FastMCP to MCPServer
+    from mcp.server.mcpserver import MCPServer as FastMCP
+
+from src.agent.graph import arun_agent
+from src.config import settings
+from src.observability import count
+from src.tools.calculator import calculator as calculator_tool
+from src.tools.elastic_search import SearchHit, format_hits, search_hits_batch
+from src.tools.web_search import web_search as web_search_tool
+from src.warmup import warmup
+
+
+class _StdioLog:
+    """sys.stdout for the stdio transport: progress prints go to stderr, the raw buffer stays the MCP wire."""
+
+    def __init__(self, stdout):
+        self.buffer = stdout.buffer
+
+    def write(self, text: str) -> int:
+        return sys.stderr.write(text)
+
+    def flush(self) -> None:
+        sys.stderr.flush()
+
+
+class SearchBatcher:
+    """Coalesces concurrent KB searches into one `search_hits_batch` call per `window` seconds.
+
+    A batch is flushed when its window closes or it reaches `max_queries`,
+    whichever comes first; searches with different `k` go out as separate batches.
+    """
+
+    def __init__(self, window: float, max_queries: int, search=search_hits_batch):
+        self.window = window
+        self.max_queries = max_queries
+        self._search = search
+        self._pending: list[tuple[str, int | None, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()  # the loop only keeps weak references to running tasks
+
+    async def search(self, query: str, k: int | None = None) -> tuple[list[SearchHit], dict]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, k, future))
+        if len(self._pending) >= self.max_queries:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        by_k: dict[int | None, list] = defaultdict(list)
+        for query, k, future in batch:
+            by_k[k].append((query, future))
+        for k, items in by_k.items():
+            task = asyncio.ensure_future(self._run(k, items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, k: int | None, items: list[tuple[str, asyncio.Future]]) -> None:
+        """Search the batch and resolve every caller's future, whether the search succeeds, fails or is cancelled."""
+        count("agent_mcp_kb_batches_total")
+        count("agent_mcp_kb_batched_queries_total", len(items))
+        error: Exception | None = None
+        try:
+            results = await asyncio.to_thread(self._search, [query for query, _ in items], k)
+            print(f"[mcp] {len(items)} KB search(es) in one _msearch")
+            for (_, future), result in zip(items, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            error = e
+        finally:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(error or RuntimeError("KB search batch ended without a result"))
+
+
+mcp = FastMCP(
+    "elastic-agent-local",
+    instructions="Local knowledge base search (Elasticsearch), web search, a calculator, and the full RAG agent.",
+)
+_batcher = SearchBatcher(settings.MCP_BATCH_WINDOW_MS / 1000, settings.MCP_BATCH_MAX_QUERIES)
+
+
+@mcp.tool()
+async def search_knowledge_base(query: str, k: int | None = None) -> str:
+    """Search the local Elasticsearch knowledge base for relevant document chunks.
+    Use for questions about Elasticsearch, search, vectors, AI agents, RAG,
+    LangChain, LangGraph, or MCP. `k` optionally overrides the number of chunks.
+    """
+    try:
+        hits, _ = await _batcher.search(query, k)
+    except Exception as e:
+        return f"Knowledge base search error: {str(e)}"
+    if not hits:
+        return "No relevant documents found in the knowledge base."
+    return format_hits(hits)
+
+
+@mcp.tool()
+async def web_search(query: str) -> str:
+    """Search the web (DuckDuckGo) for current events or topics outside the knowledge base."""
+    return await asyncio.to_thread(web_search_tool.invoke, {"query": query})
+
+
+@mcp.tool()
+def calculator(expression: str) -> str:
+    """Evaluate a mathematical expression. Supports: +, -, *, /, **, %, //."""
+    return calculator_tool.invoke({"expression": expression})
+
+
+@mcp.tool()
+async def run_agent(question: str, session_id: str | None = None) -> str:
+    """Answer a question with the full agent: routing, KB retrieval with grading,
+    web search fallback and LLM generation. Slower than the individual tools.
+    Pass the same `session_id` across calls to ask follow-up questions.
+    """
+    result = await arun_agent(question, session_id=session_id)
+    return result.get("generation") or "I couldn't generate a response."
+
+
+if __name__ == "__main__":
+    if settings.MCP_TRANSPORT == "stdio":
+        sys.stdout = _StdioLog(sys.stdout)
+    if settings.WARMUP_ON_START:
+        warmup()
+    mcp.run(transport=settings.MCP_TRANSPORT)
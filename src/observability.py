@@ -0,0 +1,244 @@
+"""Tracing and latency metrics for the agent.
+
+Graph nodes, tool calls, embedding, Elasticsearch and LLM calls run inside
+timed spans. Spans nest (via contextvars, so across asyncio tasks too) into
+one trace per question and carry attributes such as route, doc count, context
+chars, token counts and Ollama's eval durations.
+
+Every finished span feeds an in-process latency histogram, exported in
+Prometheus text format by `metrics_text()`. Finished traces are kept in
+`recent_traces` and, if TRACE_JSONL_PATH is set, appended there as one JSON
+line per trace.
+
+Off unless TRACING_ENABLED: `span()` then returns a shared no-op object and
+`traced()` wrappers call straight through, so the cost is one settings lookup.
+
+Usage:
+    with span("es.search", strategy="hybrid") as s:
+        ...
+        s.set(hits=len(hits))
+"""
+
+import asyncio
+import functools
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable
+
+from src.config import settings
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_ids = itertools.count(1)
+_current: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+_histograms: dict[str, list[float]] = {}  # span name -> bucket counts + [+Inf count, sum]
+_counters: dict[tuple[str, tuple], float] = {}
+recent_traces: deque[dict] = deque(maxlen=100)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attributes) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """A timed operation; the outermost span in a context is the trace root."""
+
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+        self.span_id = next(_ids)
+        self.parent: Span | None = None
+        self.root: Span = self
+        self.children: list[dict] = []  # finished spans of this trace (root only)
+        self.error: str | None = None
+        self.start = self.duration = 0.0
+        self._token = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.parent = _current.get()
+        if self.parent is not None:
+            self.root = self.parent.root
+        self._token = _current.set(self)
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.error = "cancelled" if exc_type is asyncio.CancelledError else f"{exc_type.__name__}: {exc}"
+        try:
+            _current.reset(self._token)
+        except ValueError:  # exited from another context (e.g. an abandoned generator)
+            pass
+        _observe(self.name, self.duration)
+        if self.root is self:
+            _finish_trace(self)
+        else:
+            with _lock:
+                self.root.children.append(self._record())
+        return False
+
+    def _record(self) -> dict:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "offset_ms": round((self.start - self.root.start) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def span(name: str, **attributes) -> Span | _NoopSpan:
+    """Context manager timing `name`; a no-op when tracing is disabled."""
+    if not settings.TRACING_ENABLED:
+        return _NOOP
+    return Span(name, attributes)
+
+
+def traced(name: str, attributes: Callable[[Any], dict] | None = None):
+    """Decorator running a (sync or async) function inside a span.
+
+    `attributes(result)` adds attributes derived from the return value.
+    """
+
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not settings.TRACING_ENABLED:
+                    return await fn(*args, **kwargs)
+                with Span(name, {}) as s:
+                    result = await fn(*args, **kwargs)
+                    if attributes:
+                        s.set(**attributes(result))
+                    return result
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not settings.TRACING_ENABLED:
+                return fn(*args, **kwargs)
+            with Span(name, {}) as s:
+                result = fn(*args, **kwargs)
+                if attributes:
+                    s.set(**attributes(result))
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def observe(name: str, seconds: float) -> None:
+    """Record a latency under `name` without a span (no-op when tracing is disabled)."""
+    if settings.TRACING_ENABLED:
+        _observe(name, seconds)
+
+
+def count(name: str, value: float = 1, **labels) -> None:
+    """Add to a Prometheus counter (no-op when tracing is disabled)."""
+    if not settings.TRACING_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def _observe(name: str, seconds: float) -> None:
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = [0.0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+        histogram[-2] += 1
+        histogram[-1] += seconds
+
+
+def _finish_trace(root: Span) -> None:
+    trace = {
+        "trace_id": root.span_id,
+        "name": root.name,
+        "start": root.wall_start,
+        "duration_ms": round(root.duration * 1000, 3),
+        "attributes": root.attributes,
+        "error": root.error,
+        "spans": sorted(root.children, key=lambda s: s["offset_ms"]),
+    }
+    with _lock:
+        recent_traces.append(trace)
+        if settings.TRACE_JSONL_PATH:
+            path = Path(settings.TRACE_JSONL_PATH)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(trace, default=str) + "\n")
+
+
+def _labels(pairs) -> str:
+    def escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+
+
+def metrics_text() -> str:
+    """All histograms and counters in Prometheus text exposition format."""
+    with _lock:
+        histograms = {name: list(values) for name, values in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = [
+        "# HELP agent_span_duration_seconds Duration of traced spans (graph nodes, tools, backend calls).",
+        "# TYPE agent_span_duration_seconds histogram",
+    ]
+    for name, values in sorted(histograms.items()):
+        for bound, bucket in zip(BUCKETS, values):
+            lines.append(f"agent_span_duration_seconds_bucket{_labels([('span', name), ('le', bound)])} {bucket:g}")
+        lines.append(f"agent_span_duration_seconds_bucket{_labels([('span', name), ('le', '+Inf')])} {values[-2]:g}")
+        lines.append(f"agent_span_duration_seconds_sum{_labels([('span', name)])} {values[-1]:.6f}")
+        lines.append(f"agent_span_duration_seconds_count{_labels([('span', name)])} {values[-2]:g}")
+
+    for metric in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE {metric} counter")
+        for (name, labels), value in sorted(counters.items()):
+            if name == metric:
+                lines.append(f"{name}{_labels(labels) if labels else ''} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path: str | Path) -> None:
+    """Write `metrics_text()` to a file (e.g. for the node_exporter textfile collector)."""
+    Path(path).write_text(metrics_text(), encoding="utf-8")
+
+
+def reset_metrics() -> None:
+    """Clear histograms, counters and buffered traces."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        recent_traces.clear()
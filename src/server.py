@@ -0,0 +1,238 @@
+"""HTTP (ASGI) service around the agent graph.
+
+Usage: python -m src.server   (requires the server extra: pip install -e ".[server]")
+
+One long-lived process keeps the pooled ES/Ollama clients warm and serves:
+  POST /ask           {"question": ..., "use_cache": optional, "session_id": optional} → final result as JSON
+  POST /ask/stream    same body → NDJSON events from stream_agent (tokens, then the result)
+  GET  /health        backend status, refreshed in the background (never pings per request)
+  GET  /metrics       Prometheus text from src.observability
+
+Requests pass through a bounded admission queue: at most SERVER_MAX_CONCURRENCY
+run at once and SERVER_MAX_QUEUE wait. Beyond that, or after waiting
+SERVER_QUEUE_TIMEOUT, the service answers 429 with a Retry-After estimated from
+recent request latency, so callers back off instead of piling onto Ollama.
+"""
+
+import asyncio
+import contextlib
+import json
+import math
+import time
+
+from starlette.applications import Starlette
+from starlette.concurrency import iterate_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from src.agent.graph import arun_agent, stream_agent
+from src.clients import check_health, get_es_client, get_local_index
+from src.config import settings
+from src.observability import metrics_text
+from src.warmup import warmup
+
+# Result fields returned to clients (state also holds LangChain messages and raw hits)
+RESULT_FIELDS = ("route", "generation", "documents", "web_results", "context_stats", "cache_hit", "timings")
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionQueue:
+    """Bounded concurrency plus a bounded wait queue, with a latency-based retry hint."""
+
+    def __init__(self, max_concurrency: int, max_queue: int, timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.avg_seconds = 5.0  # EWMA of request duration, seeded with a typical answer time
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free for a new request."""
+        return max(1, math.ceil(self.avg_seconds * (self.waiting + 1) / self.max_concurrency))
+
+    async def acquire(self) -> float:
+        """Take a slot (waiting in the queue if needed); returns the start time for `release`."""
+        if self.in_flight >= self.max_concurrency and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull(self.retry_after())
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise QueueFull(self.retry_after()) from None
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return time.perf_counter()
+
+    def release(self, started: float) -> None:
+        self.in_flight -= 1
+        self._slots.release()
+        self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * (time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "avg_seconds": round(self.avg_seconds, 3),
+        }
+
+
+def _health_snapshot() -> dict:
+    status = check_health(reset=True)
+    documents = None
+    if settings.RETRIEVAL_BACKEND == "local":
+        documents = len(get_local_index())
+    elif status["elasticsearch"]:
+        with contextlib.suppress(Exception):
+            documents = get_es_client().count(index=settings.ES_INDEX_NAME).get("count", 0)
+    return {**status, "backend": settings.RETRIEVAL_BACKEND, "documents": documents, "checked_at": time.time()}
+
+
+async def _refresh_health(app: Starlette) -> None:
+    while True:
+        app.state.health = await asyncio.to_thread(_health_snapshot)
+        await asyncio.sleep(settings.SERVER_HEALTH_INTERVAL)
+
+
+@contextlib.asynccontextmanager
+async def _lifespan(app: Starlette):
+    app.state.queue = AdmissionQueue(
+        settings.SERVER_MAX_CONCURRENCY, settings.SERVER_MAX_QUEUE, settings.SERVER_QUEUE_TIMEOUT
+    )
+    app.state.health = {"elasticsearch": None, "ollama": None, "backend": settings.RETRIEVAL_BACKEND, "documents": None, "checked_at": None}
+    app.state.warmup = await asyncio.to_thread(warmup) if settings.WARMUP_ON_START else None
+    refresher = asyncio.create_task(_refresh_health(app))
+    try:
+        yield
+    finally:
+        refresher.cancel()
+
+
+class _AdmittedStream(StreamingResponse):
+    """Streaming response that frees its admission slot however it ends.
+
+    The body generator alone can't do it: if the client disconnects before
+    Starlette starts iterating it, its `finally` never runs. A BackgroundTask is
+    skipped too when sending fails with ClientDisconnect.
+    """
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+
+def _public(result: dict) -> dict:
+    return {key: result[key] for key in RESULT_FIELDS if key in result}
+
+
+def _busy(e: QueueFull) -> JSONResponse:
+    return JSONResponse(
+        {"error": "busy", "retry_after": e.retry_after},
+        status_code=429,
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+async def _question(request: Request) -> tuple[str, bool | None, str | None]:
+    """(question, use_cache, session_id); a session_id makes the question a turn of that conversation."""
+    body = await request.json()
+    if not isinstance(body, dict):
+        raise ValueError("request body must be a JSON object")
+    question = body.get("question")
+    question = question.strip() if isinstance(question, str) else ""
+    if not question:
+        raise ValueError("'question' is required")
+    session_id = body.get("session_id")
+    if session_id is not None and (not isinstance(session_id, str) or not session_id.strip()):
+        raise ValueError("'session_id' must be a non-empty string")
+    return question, body.get("use_cache"), session_id
+
+
+async def ask(request: Request) -> Response:
+    try:
+        question, use_cache, session_id = await _question(request)
+    except (ValueError, json.JSONDecodeError) as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    queue: AdmissionQueue = request.app.state.queue
+    try:
+        started = await queue.acquire()
+    except QueueFull as e:
+        return _busy(e)
+    try:
+        result = await arun_agent(question, use_cache=use_cache, session_id=session_id)
+    finally:
+        queue.release(started)
+    return JSONResponse(json.loads(json.dumps(_public(result), default=str)))
+
+
+async def ask_stream(request: Request) -> Response:
+    try:
+        question, use_cache, session_id = await _question(request)
+    except (ValueError, json.JSONDecodeError) as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    queue: AdmissionQueue = request.app.state.queue
+    try:
+        started = await queue.acquire()
+    except QueueFull as e:
+        return _busy(e)
+
+    async def _events():
+        async for event in iterate_in_threadpool(stream_agent(question, use_cache=use_cache, session_id=session_id)):
+            if event["type"] == "result":
+                event = {"type": "result", "result": _public(event["result"])}
+            yield json.dumps(event, default=str) + "\n"
+
+    return _AdmittedStream(_events(), lambda: queue.release(started), media_type="application/x-ndjson")
+
+
+async def health(request: Request) -> Response:
+    snapshot = {**request.app.state.health, "queue": request.app.state.queue.stats(), "warmup": request.app.state.warmup}
+    # the embedded index serves retrieval without Elasticsearch
+    healthy = (snapshot["elasticsearch"] or settings.RETRIEVAL_BACKEND == "local") and snapshot["ollama"]
+    return JSONResponse(snapshot, status_code=200 if healthy else 503)
+
+
+async def metrics(request: Request) -> Response:
+    return PlainTextResponse(metrics_text(), media_type="text/plain; version=0.0.4")
+
+
+def create_app() -> Starlette:
+    return Starlette(
+        routes=[
+            Route("/ask", ask, methods=["POST"]),
+            Route("/ask/stream", ask_stream, methods=["POST"]),
+            Route("/health", health),
+            Route("/metrics", metrics),
+        ],
+        lifespan=_lifespan,
+    )
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # One worker: the pooled clients, caches and admission queue are per process
+    uvicorn.run(app, host=settings.SERVER_HOST, port=settings.SERVER_PORT)
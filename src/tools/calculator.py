@@ -1,7 +1,21 @@
-"""Calculator tool for evaluating mathematical expressions safely."""
+"""Calculator tool for evaluating mathematical expressions safely.
+
+`evaluate` walks the AST of +, -, *, /, **, %, // over numeric constants and
+bounds its cost: at most CALC_MAX_NODES nodes, exponents up to
+CALC_MAX_EXPONENT, results below 10**CALC_MAX_DIGITS (checked before a power
+is computed) and CALC_TIMEOUT_MS of wall-clock time, so `9**9**9` is rejected
+instead of pinning a core.
+
+`arithmetic_expression` recognizes plain arithmetic questions ("what is 15% of
+2400?") for the graph's `calculate` route, which answers without an LLM call.
+"""
 import ast
+import math
 import operator
+import re
+import time
 from langchain_core.tools import tool
+from src.config import settings
 
 _SAFE_OPS = {
     ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
@@ -9,29 +23,127 @@ _SAFE_OPS = {
     ast.FloorDiv: operator.floordiv, ast.USub: operator.neg, ast.UAdd: operator.pos,
 }
 
-def _safe_eval(node):
-    if isinstance(node, ast.Expression): return _safe_eval(node.body)
+_MAX_CHARS = 1000  # parsing is linear, but don't build a huge AST just to count its nodes
+
+
+class CalculationLimitError(ValueError):
+    """The expression exceeds one of the evaluator's cost limits."""
+
+
+def _check_magnitude(value):
+    if isinstance(value, complex):  # e.g. (-8) ** 0.5
+        raise ValueError("result is not a real number")
+    if isinstance(value, int) and value.bit_length() > settings.CALC_MAX_DIGITS * math.log2(10):
+        raise CalculationLimitError(f"result exceeds 10**{settings.CALC_MAX_DIGITS}")
+    if isinstance(value, float) and not math.isfinite(value):
+        raise OverflowError("result is too large")
+    return value
+
+
+def _power(base, exponent):
+    if abs(exponent) > settings.CALC_MAX_EXPONENT:
+        raise CalculationLimitError(f"exponent {exponent} exceeds {settings.CALC_MAX_EXPONENT}")
+    # Predict the size of the result before computing it
+    if abs(base) > 1 and exponent > 0 and exponent * math.log10(abs(base)) > settings.CALC_MAX_DIGITS:
+        raise CalculationLimitError(f"result exceeds 10**{settings.CALC_MAX_DIGITS}")
+    try:
+        return operator.pow(base, exponent)
+    except OverflowError:
+        raise OverflowError("result is too large") from None
+
+
+def _safe_eval(node, deadline: float):
+    if time.perf_counter() > deadline: raise CalculationLimitError(f"took longer than {settings.CALC_TIMEOUT_MS}ms")
+    if isinstance(node, ast.Expression): return _safe_eval(node.body, deadline)
     elif isinstance(node, ast.Constant):
-        if isinstance(node.value, (int, float)): return node.value
+        if isinstance(node.value, (int, float)) and not isinstance(node.value, bool): return _check_magnitude(node.value)
         raise ValueError(f"Unsupported constant: {node.value}")
     elif isinstance(node, ast.BinOp):
         op = _SAFE_OPS.get(type(node.op))
         if op is None: raise ValueError(f"Unsupported operator: {type(node.op).__name__}")
-        return op(_safe_eval(node.left), _safe_eval(node.right))
+        left, right = _safe_eval(node.left, deadline), _safe_eval(node.right, deadline)
+        return _check_magnitude(_power(left, right) if op is operator.pow else op(left, right))
     elif isinstance(node, ast.UnaryOp):
         op = _SAFE_OPS.get(type(node.op))
         if op is None: raise ValueError(f"Unsupported operator: {type(node.op).__name__}")
-        return op(_safe_eval(node.operand))
+        return op(_safe_eval(node.operand, deadline))
     else: raise ValueError(f"Unsupported expression: {type(node).__name__}")
 
+
+def evaluate(expression: str) -> int | float:
+    """Evaluate an arithmetic expression within the CALC_* cost limits.
+
+    Raises ValueError (CalculationLimitError for exceeded limits), SyntaxError,
+    ZeroDivisionError or OverflowError.
+    """
+    if len(expression) > _MAX_CHARS:
+        raise CalculationLimitError(f"expression longer than {_MAX_CHARS} characters")
+    tree = ast.parse(expression.strip(), mode="eval")
+    nodes = sum(1 for _ in ast.walk(tree))
+    if nodes > settings.CALC_MAX_NODES:
+        raise CalculationLimitError(f"expression has {nodes} nodes (limit {settings.CALC_MAX_NODES})")
+    return _safe_eval(tree, time.perf_counter() + settings.CALC_TIMEOUT_MS / 1000)
+
+
+def format_result(value: int | float) -> str:
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return f"{value:.12g}" if isinstance(value, float) else str(value)
+
+
+_NUMBER = r"\d+(?:\.\d+)?"
+_PREFIX = re.compile(r"^(?:please\s+)?(?:what\s+is|what's|whats|calculate|compute|evaluate|how\s+much\s+is|solve)\s+", re.I)
+_PERCENT_OF = re.compile(rf"({_NUMBER})\s*(?:%|percent)\s+of\s+", re.I)
+_WORD_OPS = [
+    (re.compile(r"\bmultiplied\s+by\b|\btimes\b", re.I), "*"),
+    (re.compile(r"\bdivided\s+by\b|\bover\b", re.I), "/"),
+    (re.compile(r"\bto\s+the\s+power\s+of\b", re.I), "**"),
+    (re.compile(r"\bplus\b", re.I), "+"),
+    (re.compile(r"\bminus\b", re.I), "-"),
+    (re.compile(r"\bmod(?:ulo)?\b", re.I), "%"),
+    (re.compile(rf"(?<=\d)\s*[x×]\s*(?={_NUMBER})"), "*"),
+    (re.compile(r"÷"), "/"),
+    (re.compile(r"\^"), "**"),
+]
+_DATE = re.compile(r"\b\d{4}-\d{1,2}-\d{1,2}\b")  # 2024-1-5 is a date, not 2018
+_HYPHENATED = re.compile(r"^\d+(?:-\d+)+$")  # 555-1234: a phone or part number unless asked "what is ..."
+_ARITHMETIC = re.compile(r"^[\d\s.+\-*/%()]+$")
+_OPERATOR = re.compile(r"\d\s*(?:\*\*|[+\-*/%])\s*[\d(]|[\d)]\s*(?:\*\*|[+\-*/%])\s*\(")
+
+
+def arithmetic_expression(question: str) -> str | None:
+    """The Python expression a plain arithmetic question asks for, or None if it is anything else."""
+    if len(question) > _MAX_CHARS:  # runs on every question, so it gets the same cap as `evaluate`
+        return None
+    question = question.strip()
+    text = _PREFIX.sub("", question).rstrip(" ?=.!")
+    if _DATE.search(text) or (text == question.rstrip(" ?=.!") and _HYPHENATED.match(text)):
+        return None
+    text = re.sub(r"(?<=\d),(?=\d{3}\b)", "", text)  # thousands separators
+    text = _PERCENT_OF.sub(r"\1 / 100 * ", text)
+    for pattern, symbol in _WORD_OPS:
+        text = pattern.sub(f" {symbol} ", text)
+    text = text.strip()
+    if not _ARITHMETIC.match(text) or not _OPERATOR.search(text):
+        return None
+    try:
+        ast.parse(text, mode="eval")  # e.g. leading zeros like 01 don't parse
+    except (SyntaxError, RecursionError, MemoryError, ValueError):
+        return None
+    return re.sub(r"\s+", " ", text)
+
+
+def evaluate_to_text(expression: str) -> str:
+    """"<expression> = <result>", or the reason it could not be evaluated."""
+    try:
+        return f"{expression} = {format_result(evaluate(expression))}"
+    except (ValueError, SyntaxError, TypeError, ZeroDivisionError, OverflowError) as e:
+        return f"Error evaluating '{expression}': {e}"
+
+
 @tool
 def calculator(expression: str) -> str:
     """Evaluate a mathematical expression and return the result.
     Supports: +, -, *, /, **, %, //. Examples: '2 + 2', '(15 * 3.5) / 7'
     """
-    try:
-        tree = ast.parse(expression.strip(), mode="eval")
-        result = _safe_eval(tree)
-        return f"{expression} = {result}"
-    except (ValueError, SyntaxError, TypeError, ZeroDivisionError) as e:
-        return f"Error evaluating '{expression}': {e}"
+    return evaluate_to_text(expression)
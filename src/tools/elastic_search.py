@@ -1,41 +1,357 @@
-"""Elasticsearch knowledge base search tool."""
+"""Elasticsearch knowledge base search tool.
+
+Three retrieval strategies, selected by RETRIEVAL_STRATEGY:
+  - "dense":  kNN over the chunk embeddings
+  - "bm25":   lexical match on the chunk text
+  - "hybrid": both in one _msearch round-trip, fused with reciprocal rank
+              fusion (RRF) so exact identifiers (table names, env vars) that
+              dense search misses still surface
+
+With RETRIEVAL_BACKEND=local, kNN runs against the embedded in-process index
+(src/local_index.py) instead and returns the same hits; it has no BM25, so
+hybrid degrades to dense there.
+
+With RETRIEVAL_TARGETS set, every query fans out to those ES indexes/aliases
+and "local:<name>" embedded indexes in parallel, each under its own deadline.
+Hits are merged on a shared relevance scale (`shared_score`), and targets
+that fail or time out are dropped instead of holding up the answer.
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
 from langchain_core.tools import tool
-from langchain_elasticsearch import ElasticsearchStore
-from langchain_ollama import OllamaEmbeddings
+from src.clients import get_embeddings, get_es_client, get_local_index
 from src.config import settings
+from src.observability import count, span
+
+TEXT_FIELD = "text"
+VECTOR_FIELD = "vector"
+
+
+@dataclass
+class SearchHit:
+    """One retrieved chunk. `score` is the fused score for hybrid, else the raw ES score (`shared_score` when federated)."""
+
+    id: str
+    text: str
+    source: str
+    score: float
+    metadata: dict = field(default_factory=dict)
+    vector_score: float | None = None  # ES cosine score, (1 + cos) / 2
+    bm25_score: float | None = None
+
+
+def _knn_body(vector: list[float], size: int) -> dict:
+    return {
+        "knn": {
+            "field": VECTOR_FIELD,
+            "query_vector": vector,
+            "k": size,
+            "num_candidates": max(settings.RETRIEVAL_NUM_CANDIDATES, size),
+        },
+        "size": size,
+        "_source": [TEXT_FIELD, "metadata"],
+    }
+
+
+def _bm25_body(query: str, size: int) -> dict:
+    return {"query": {"match": {TEXT_FIELD: query}}, "size": size, "_source": [TEXT_FIELD, "metadata"]}
+
+
+def _to_hits(response: dict, score_attr: str) -> list[SearchHit]:
+    hits = []
+    for raw in response["hits"]["hits"]:
+        source = raw.get("_source", {})
+        metadata = source.get("metadata", {})
+        hit = SearchHit(
+            id=raw["_id"],
+            text=source.get(TEXT_FIELD, ""),
+            source=metadata.get("source", "unknown"),
+            score=raw["_score"],
+            metadata=metadata,
+        )
+        setattr(hit, score_attr, raw["_score"])
+        hits.append(hit)
+    return hits
 
 
-def _get_store() -> ElasticsearchStore:
-    """Create ES vector store instance."""
-    embeddings = OllamaEmbeddings(
-        model=settings.EMBEDDING_MODEL,
-        base_url=settings.OLLAMA_BASE_URL,
-    )
-    return ElasticsearchStore(
-        index_name=settings.ES_INDEX_NAME,
-        embedding=embeddings,
-        es_url=settings.ELASTICSEARCH_URL,
-    )
+def rrf_fuse(rankings: list[list[SearchHit]], k: int, rank_constant: int = 60) -> list[SearchHit]:
+    """Reciprocal rank fusion: score(d) = sum over rankings of 1 / (rank_constant + rank)."""
+    fused: dict[str, SearchHit] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, 1):
+            merged = fused.get(hit.id)
+            if merged is None:
+                merged = fused[hit.id] = SearchHit(hit.id, hit.text, hit.source, 0.0, hit.metadata)
+            merged.score += 1.0 / (rank_constant + rank)
+            merged.vector_score = merged.vector_score if hit.vector_score is None else hit.vector_score
+            merged.bm25_score = merged.bm25_score if hit.bm25_score is None else hit.bm25_score
+    return sorted(fused.values(), key=lambda h: h.score, reverse=True)[:k]
+
+
+def _local_search(queries: list[str], k: int, strategy: str) -> list[tuple[list[SearchHit], dict]]:
+    """Dense search against the embedded index (hybrid runs as its dense leg); shared timings, like `search_hits_batch`."""
+    if strategy == "bm25":
+        raise ValueError("RETRIEVAL_BACKEND=local has no BM25 index; use the dense strategy")
+    timings: dict[str, float] = {}
+    started = time.perf_counter()
+    with span("embed.query", model=settings.EMBEDDING_MODEL, batch=len(queries)):
+        embeddings = get_embeddings()
+        vectors = [embeddings.embed_query(queries[0])] if len(queries) == 1 else embeddings.embed_documents(queries)
+    timings["embed_ms"] = (time.perf_counter() - started) * 1000
+
+    t0 = time.perf_counter()
+    with span("local.knn", k=k, queries=len(queries)):
+        results = get_local_index().search(vectors, k)
+    timings["search_ms"] = (time.perf_counter() - t0) * 1000
+    timings["total_ms"] = (time.perf_counter() - started) * 1000
+    return [(_local_hits(rows), dict(timings)) for rows in results]
+
+
+def _local_hits(rows: list[dict]) -> list[SearchHit]:
+    return [SearchHit(r["id"], r["text"], r["metadata"].get("source", "unknown"), r["score"], r["metadata"],
+                      vector_score=r["score"]) for r in rows]
+
+
+def search_hits(query: str, k: int | None = None, strategy: str | None = None) -> tuple[list[SearchHit], dict]:
+    """Run the configured retrieval strategy. Returns (hits, per-stage timings in ms)."""
+    k = k or settings.RETRIEVAL_K
+    strategy = strategy or settings.RETRIEVAL_STRATEGY
+    if settings.RETRIEVAL_TARGETS:
+        return federated_search([query], k, strategy)[0]
+    if settings.RETRIEVAL_BACKEND == "local":
+        return _local_search([query], k, strategy)[0]
+    if strategy not in ("dense", "bm25", "hybrid"):
+        raise ValueError(f"Unknown retrieval strategy: {strategy}")
+    index = settings.ES_INDEX_NAME
+    timings: dict[str, float] = {}
+    started = time.perf_counter()
+
+    vector = None
+    if strategy in ("dense", "hybrid"):
+        t0 = time.perf_counter()
+        with span("embed.query", model=settings.EMBEDDING_MODEL):
+            vector = get_embeddings().embed_query(query)
+        timings["embed_ms"] = (time.perf_counter() - t0) * 1000
+
+    with span("es.msearch", index=index, strategy=strategy, k=k):
+        hits = _msearch_hits(get_es_client(), index, [query], [vector], k, strategy, timings)[0]
+    timings["total_ms"] = (time.perf_counter() - started) * 1000
+    return hits, timings
+
+
+def search_hits_batch(
+    queries: list[str], k: int | None = None, strategy: str | None = None
+) -> list[tuple[list[SearchHit], dict]]:
+    """`search_hits` for several queries at once: one embedding call and one _msearch round-trip.
+
+    Returns one (hits, timings) pair per query; the embed/search timings are those of the shared calls.
+    """
+    k = k or settings.RETRIEVAL_K
+    strategy = strategy or settings.RETRIEVAL_STRATEGY
+    if strategy not in ("dense", "bm25", "hybrid"):
+        raise ValueError(f"Unknown retrieval strategy: {strategy}")
+    if settings.RETRIEVAL_TARGETS:
+        return federated_search(queries, k, strategy)
+    if settings.RETRIEVAL_BACKEND == "local":
+        return _local_search(queries, k, strategy)
+    index = settings.ES_INDEX_NAME
+    timings: dict[str, float] = {}
+    started = time.perf_counter()
+
+    vectors: list = [None] * len(queries)
+    if strategy in ("dense", "hybrid"):
+        t0 = time.perf_counter()
+        with span("embed.query", model=settings.EMBEDDING_MODEL, batch=len(queries)):
+            vectors = get_embeddings().embed_documents(queries)
+        timings["embed_ms"] = (time.perf_counter() - t0) * 1000
 
+    with span("es.msearch", index=index, queries=len(queries), strategy=strategy):
+        per_query = _msearch_hits(get_es_client(), index, queries, vectors, k, strategy, timings)
+    timings["total_ms"] = (time.perf_counter() - started) * 1000
+    return [(hits, dict(timings)) for hits in per_query]
 
-@tool
-def search_knowledge_base(query: str) -> str:
+
+def _msearch_hits(
+    es, index: str, queries: list[str], vectors: list, k: int, strategy: str, timings: dict | None = None
+) -> list[list[SearchHit]]:
+    """One _msearch round-trip for every query's leg(s) on `index`; hybrid legs are RRF-fused.
+
+    Records "search_ms" and, for hybrid, "fuse_ms" in `timings` if given.
+    """
+    t0 = time.perf_counter()
+    size = max(settings.RRF_WINDOW_SIZE, k) if strategy == "hybrid" else k
+    searches = []
+    for query, vector in zip(queries, vectors):
+        if strategy in ("dense", "hybrid"):
+            searches += [{}, _knn_body(vector, size)]
+        if strategy in ("bm25", "hybrid"):
+            searches += [{}, _bm25_body(query, size)]
+    responses = es.msearch(index=index, searches=searches)["responses"]
+    if timings is not None:
+        timings["search_ms"] = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    per_query = 2 if strategy == "hybrid" else 1
+    results = []
+    for i in range(len(queries)):
+        group = responses[i * per_query:(i + 1) * per_query]
+        error = next((r["error"] for r in group if "error" in r), None)
+        if error is not None:
+            raise RuntimeError(error.get("reason", error))
+        if strategy == "hybrid":
+            hits = rrf_fuse(
+                [_to_hits(group[0], "vector_score"), _to_hits(group[1], "bm25_score")],
+                k,
+                settings.RRF_RANK_CONSTANT,
+            )
+        else:
+            hits = _to_hits(group[0], "vector_score" if strategy == "dense" else "bm25_score")
+        results.append(hits)
+    if timings is not None and strategy == "hybrid":
+        timings["fuse_ms"] = (time.perf_counter() - t0) * 1000
+    return results
+
+
+_executor = ThreadPoolExecutor(max_workers=settings.RETRIEVAL_FEDERATION_WORKERS, thread_name_prefix="kb-search")
+
+
+def _target_timeout(target: str) -> float:
+    return settings.RETRIEVAL_TARGET_TIMEOUTS.get(target, settings.RETRIEVAL_TARGET_TIMEOUT)
+
+
+def _search_target(
+    target: str, queries: list[str], vectors: list, k: int, strategy: str, deadline: float
+) -> list[list[SearchHit]]:
+    """Hits per query from one target: "local:<name>" is an embedded index, anything else an ES index or alias."""
+    remaining = deadline - time.perf_counter()
+    if remaining <= 0:  # waited in the pool past its deadline; already dropped
+        raise TimeoutError(f"{target} was not started before its deadline")
+    backend, _, name = target.rpartition(":")
+    if backend == "local":
+        if strategy == "bm25":
+            raise ValueError("local targets have no BM25 index")
+        return [_local_hits(rows) for rows in get_local_index(name).search(vectors, k)]
+    if backend:
+        raise ValueError(f"Unknown retrieval target: {target}")
+    # No retries: a dropped target must not keep holding a pool worker
+    es = get_es_client().options(request_timeout=remaining, max_retries=0, retry_on_timeout=False)
+    return _msearch_hits(es, name, queries, vectors, k, strategy)
+
+
+def shared_score(hit: SearchHit) -> float:
+    """Relevance on one scale for every index: the (1 + cos) / 2 kNN score as is, BM25 saturated into [0, 1).
+
+    BM25 maps through b / (b + c), with c chosen so a hit just clearing
+    GRADE_MIN_BM25_SCORE scores GRADE_MIN_VECTOR_SCORE. Hybrid hits take the
+    better of their two legs, so a weak hit from a small index can't outrank a
+    strong one from a large index.
+    """
+    scores = []
+    if hit.vector_score is not None:
+        scores.append(hit.vector_score)
+    if hit.bm25_score is not None:
+        threshold, target = settings.GRADE_MIN_BM25_SCORE, settings.GRADE_MIN_VECTOR_SCORE
+        scores.append(hit.bm25_score / (hit.bm25_score + threshold * (1 - target) / target))
+    return max(scores, default=0.0)
+
+
+def federated_search(queries: list[str], k: int, strategy: str) -> list[tuple[list[SearchHit], dict]]:
+    """Scatter the queries to every RETRIEVAL_TARGETS entry concurrently and merge the hits by `shared_score`.
+
+    A target that errors or misses its deadline (RETRIEVAL_TARGET_TIMEOUTS, else
+    RETRIEVAL_TARGET_TIMEOUT) is dropped rather than waited for. Timings include
+    "<target>_ms" for every target, up to the drop for dropped ones.
+    """
+    targets = settings.RETRIEVAL_TARGETS
+    timings: dict[str, float] = {}
+    started = time.perf_counter()
+
+    vectors: list = [None] * len(queries)
+    if strategy in ("dense", "hybrid"):
+        t0 = time.perf_counter()
+        with span("embed.query", model=settings.EMBEDDING_MODEL, batch=len(queries)):
+            embeddings = get_embeddings()
+            vectors = [embeddings.embed_query(queries[0])] if len(queries) == 1 else embeddings.embed_documents(queries)
+        timings["embed_ms"] = (time.perf_counter() - t0) * 1000
+
+    def _run(target):
+        hits = _search_target(target, queries, vectors, k, strategy, deadlines[target])
+        return hits, time.perf_counter()
+
+    t0 = time.perf_counter()
+    with span("search.federated", targets=len(targets), strategy=strategy) as s:
+        deadlines = {target: t0 + _target_timeout(target) for target in targets}
+        pending = {_executor.submit(_run, target): target for target in targets}
+        results: dict[str, list[list[SearchHit]]] = {}
+        status: dict[str, str] = {}
+        while pending:
+            wait(pending, timeout=max(min(deadlines[t] for t in pending.values()) - time.perf_counter(), 0),
+                 return_when=FIRST_COMPLETED)
+            for future, target in list(pending.items()):
+                if future.done():
+                    del pending[future]
+                    try:
+                        results[target], finished = future.result()
+                        timings[f"{target}_ms"] = (finished - t0) * 1000
+                        status[target] = "ok"
+                    except Exception as e:
+                        timings[f"{target}_ms"] = (time.perf_counter() - t0) * 1000
+                        status[target] = f"error: {e}"
+                elif time.perf_counter() >= deadlines[target]:
+                    del pending[future]
+                    future.cancel()
+                    timings[f"{target}_ms"] = (time.perf_counter() - t0) * 1000
+                    status[target] = "timeout"
+        dropped = [t for t in targets if status[t] != "ok"]
+        s.set(dropped=len(dropped))
+    timings["search_ms"] = (time.perf_counter() - t0) * 1000
+    for target in targets:
+        count("agent_retrieval_target_requests_total", target=target, status=status[target].split(":")[0])
+    if dropped:
+        print("[federated_search] dropped " + ", ".join(
+            f"{t} ({status[t]} after {timings[f'{t}_ms']:.0f}ms)" for t in dropped))
+
+    t0 = time.perf_counter()
+    merged = []
+    for i in range(len(queries)):
+        best: dict[str, SearchHit] = {}
+        for target in targets:
+            for hit in results.get(target, [[]] * len(queries))[i]:
+                hit.score = shared_score(hit)
+                hit.metadata = {**hit.metadata, "index": target}
+                if hit.id not in best or hit.score > best[hit.id].score:
+                    best[hit.id] = hit
+        merged.append(sorted(best.values(), key=lambda h: h.score, reverse=True)[:k])
+    timings["fuse_ms"] = (time.perf_counter() - t0) * 1000
+    timings["total_ms"] = (time.perf_counter() - started) * 1000
+    return [(hits, dict(timings)) for hits in merged]
+
+
+def format_hits(hits: list[SearchHit]) -> str:
+    formatted = [f"[Doc {i}] (source: {hit.source})\n{hit.text}" for i, hit in enumerate(hits, 1)]
+    return "\n\n---\n\n".join(formatted)
+
+
+@tool(response_format="content_and_artifact")
+def search_knowledge_base(query: str, k: int | None = None) -> tuple[str, dict]:
     """Search the local Elasticsearch knowledge base for relevant documents.
     Use this tool for questions about Elasticsearch, search, vectors,
     AI agents, RAG, LangChain, LangGraph, or MCP.
+    `k` optionally overrides the number of chunks returned.
     """
     try:
-        store = _get_store()
-        results = store.similarity_search(query, k=4)
-
-        if not results:
-            return "No relevant documents found in the knowledge base."
+        with span("tool.search_knowledge_base", strategy=settings.RETRIEVAL_STRATEGY) as s:
+            hits, timings = search_hits(query, k=k)
+            s.set(hits=len(hits), context_chars=sum(len(h.text) for h in hits))
+        stages = ", ".join(f"{name[:-3]} {ms:.0f}ms" for name, ms in timings.items())
+        print(f"[search_knowledge_base] {settings.RETRIEVAL_STRATEGY}: {len(hits)} hits ({stages})")
+        artifact = {"hits": hits, "timings": timings}
 
-        formatted = []
-        for i, doc in enumerate(results, 1):
-            source = doc.metadata.get("source", "unknown")
-            formatted.append(f"[Doc {i}] (source: {source})\n{doc.page_content}")
+        if not hits:
+            return "No relevant documents found in the knowledge base.", artifact
 
-        return "\n\n---\n\n".join(formatted)
+        return format_hits(hits), artifact
     except Exception as e:
-        return f"Knowledge base search error: {str(e)}"
+        return f"Knowledge base search error: {str(e)}", {"hits": [], "timings": {}}
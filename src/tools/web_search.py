@@ -1,6 +1,260 @@
-"""Web search fallback tool using DuckDuckGo (free, no API key)."""
+"""Web search fallback tool: DuckDuckGo (free, no API key) or a local stand-in index.
+
+Searches go through a pluggable backend (WEB_SEARCH_BACKEND):
+  - "duckduckgo": live DuckDuckGo results, one reused session per worker thread
+  - "local":      a JSONL file of {"title", "href", "body"} records scored by
+                  term overlap, for tests and air-gapped deployments
+
+Every search is bounded: at most WEB_SEARCH_MAX_CONCURRENCY run at once, each
+question gets a hard WEB_SEARCH_TIMEOUT deadline (results gathered so far are
+returned if it passes), and transient failures are retried while time remains.
+Complete results are kept in a TTL-bounded SQLite cache keyed by the
+normalized query, so repeated questions skip the network entirely.
+
+A caller that may abandon a search (the speculative retrieve node) sets
+`cancel_event` for it: once the event is set the search stops waiting, takes
+no slot and makes no retry, and stops reading results. A backend request
+already in flight cannot be interrupted and holds its slot until it returns
+(at most WEB_SEARCH_TIMEOUT).
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Iterable, Protocol
+
 from langchain_core.tools import tool
 
+from src.config import settings
+from src.observability import span
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase and collapse whitespace and trailing punctuation."""
+    return re.sub(r"\s+", " ", query.lower()).strip().rstrip("?!. ")
+
+
+class WebSearchBackend(Protocol):
+    """Anything that yields {"title", "href", "body"} results for a query."""
+
+    name: str
+
+    def search(self, query: str, max_results: int, timeout: float) -> Iterable[dict]: ...
+
+
+class DuckDuckGoBackend:
+    name = "duckduckgo"
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def search(self, query: str, max_results: int, timeout: float) -> Iterable[dict]:
+        from duckduckgo_search import DDGS
+
+        seconds = max(int(timeout), 1)
+        if getattr(self._local, "timeout", None) != seconds:
+            self._local.session, self._local.timeout = DDGS(timeout=seconds), seconds
+        return self._local.session.text(query, max_results=max_results)
+
+
+class LocalIndexBackend:
+    """Term-overlap search over a JSONL file of {"title", "href", "body"} records."""
+
+    name = "local"
+
+    def __init__(self, path: str | Path):
+        if not path or not Path(path).exists():
+            raise ValueError(f"Local web search index not found: {path!r} (set WEB_SEARCH_LOCAL_INDEX)")
+        with open(path, encoding="utf-8") as f:
+            self.records = [json.loads(line) for line in f if line.strip()]
+        self._terms = [set(_WORD.findall(f"{r.get('title', '')} {r.get('body', '')}".lower())) for r in self.records]
+
+    def search(self, query: str, max_results: int, timeout: float) -> Iterable[dict]:
+        terms = set(_WORD.findall(query.lower()))
+        scored = [(len(terms & doc), i) for i, doc in enumerate(self._terms)]
+        scored = sorted((s for s in scored if s[0]), reverse=True)[:max_results]
+        return [self.records[i] for _, i in scored]
+
+
+class WebSearchCache:
+    """TTL- and size-bounded SQLite cache of search results."""
+
+    def __init__(self, path: str | Path, ttl: float, max_entries: int = 1000):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, results TEXT NOT NULL, expires_at REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS results_expires_at ON results(expires_at);
+            """
+        )
+
+    @staticmethod
+    def key(backend: str, query: str, max_results: int) -> str:
+        return hashlib.sha256(f"{backend}\x00{max_results}\x00{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> list[dict] | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT results FROM results WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, results: list[dict]) -> None:
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            now = time.time()
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, results, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(results), now + self.ttl),
+            )
+            self._db.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._db.execute("COMMIT")
+
+
+_lock = threading.Lock()
+_backend: WebSearchBackend | None = None
+_cache: WebSearchCache | None = None
+_slots = threading.BoundedSemaphore(settings.WEB_SEARCH_MAX_CONCURRENCY)
+_executor = ThreadPoolExecutor(max_workers=settings.WEB_SEARCH_MAX_CONCURRENCY, thread_name_prefix="web-search")
+_CANCEL_POLL = 0.05  # seconds between checks of cancel_event while waiting
+cancel_event: ContextVar[threading.Event | None] = ContextVar("web_search_cancel_event", default=None)
+
+
+def get_web_backend() -> WebSearchBackend:
+    """The configured backend, created once per process."""
+    global _backend
+    with _lock:
+        if _backend is None:
+            if settings.WEB_SEARCH_BACKEND == "duckduckgo":
+                _backend = DuckDuckGoBackend()
+            elif settings.WEB_SEARCH_BACKEND == "local":
+                _backend = LocalIndexBackend(settings.WEB_SEARCH_LOCAL_INDEX)
+            else:
+                raise ValueError(f"Unknown web search backend: {settings.WEB_SEARCH_BACKEND}")
+        return _backend
+
+
+def set_web_backend(backend: WebSearchBackend | None) -> None:
+    """Install a backend (e.g. a stand-in in tests); None reverts to WEB_SEARCH_BACKEND."""
+    global _backend
+    with _lock:
+        _backend = backend
+
+
+def _get_cache() -> WebSearchCache | None:
+    global _cache
+    if not settings.WEB_SEARCH_CACHE_ENABLED:
+        return None
+    with _lock:
+        if _cache is None:
+            _cache = WebSearchCache(
+                settings.WEB_SEARCH_CACHE_PATH, settings.WEB_SEARCH_CACHE_TTL, settings.WEB_SEARCH_CACHE_MAX_ENTRIES
+            )
+        return _cache
+
+
+def _acquire_slot(deadline: float, cancelled: threading.Event) -> bool:
+    """Take a concurrency slot unless the deadline passes or the search is cancelled first."""
+    while (remaining := deadline - time.monotonic()) > 0 and not cancelled.is_set():
+        if _slots.acquire(timeout=min(remaining, _CANCEL_POLL)):
+            if not cancelled.is_set():
+                return True
+            _slots.release()
+    return False
+
+
+def search_web(query: str, max_results: int | None = None, timeout: float | None = None) -> tuple[list[dict], dict]:
+    """Search with caching, bounded concurrency, retries and a hard deadline.
+
+    Returns (results, info); info has "cached", "partial", "attempts" and
+    "error" (the last error if no attempt succeeded, "cancelled" if abandoned).
+    """
+    max_results = max_results or settings.WEB_SEARCH_MAX_RESULTS
+    timeout = timeout or settings.WEB_SEARCH_TIMEOUT
+    deadline = time.monotonic() + timeout
+    backend = get_web_backend()
+    cache = _get_cache()
+    key = WebSearchCache.key(backend.name, query, max_results)
+    info = {"cached": False, "partial": False, "attempts": 0, "error": None}
+    cancelled = cancel_event.get() or threading.Event()
+
+    if cache and (cached := cache.get(key)) is not None:
+        info["cached"] = True
+        return cached, info
+
+    results: list[dict] = []
+    for attempt in range(settings.WEB_SEARCH_RETRIES + 1):
+        if not _acquire_slot(deadline, cancelled):
+            info["error"] = "cancelled" if cancelled.is_set() else (info["error"] or f"timed out after {timeout:g}s")
+            break
+        info["attempts"] += 1
+        results = []  # filled by the worker as the backend yields, so a timeout keeps what arrived
+
+        def _run(results=results):
+            try:
+                for result in backend.search(query, max_results, max(deadline - time.monotonic(), 0.1)):
+                    results.append(result)
+                    if len(results) >= max_results or cancelled.is_set():
+                        break
+            finally:
+                _slots.release()
+
+        future = _executor.submit(_run)
+        try:
+            while True:
+                try:
+                    future.result(timeout=min(max(deadline - time.monotonic(), 0), _CANCEL_POLL))
+                    break
+                except TimeoutError:
+                    if cancelled.is_set() or time.monotonic() >= deadline:
+                        raise
+            info["error"] = None
+            break
+        except TimeoutError:
+            info["partial"] = True
+            info["error"] = "cancelled" if cancelled.is_set() else f"timed out after {timeout:g}s"
+            break
+        except ImportError:
+            raise
+        except Exception as e:
+            info["error"] = f"{type(e).__name__}: {e}"
+            if time.monotonic() < deadline and attempt < settings.WEB_SEARCH_RETRIES and not cancelled.is_set():
+                time.sleep(min(0.5 * (attempt + 1), max(deadline - time.monotonic(), 0)))
+
+    results = list(results)
+    if cache and results and not info["partial"] and not info["error"] and not cancelled.is_set():
+        cache.put(key, results)
+    return results, info
+
+
+def format_results(results: list[dict]) -> str:
+    formatted = []
+    for i, r in enumerate(results, 1):
+        title = r.get("title", "No title")
+        href = r.get("href", "N/A")
+        body = r.get("body", "No snippet")
+        formatted.append(f"[Result {i}] {title}\nURL: {href}\nSnippet: {body}")
+    return "\n\n---\n\n".join(formatted)
+
 
 @tool
 def web_search(query: str) -> str:
@@ -9,22 +263,18 @@ def web_search(query: str) -> str:
     or when the user asks about current events or recent news.
     """
     try:
-        from duckduckgo_search import DDGS
-        with DDGS() as ddgs:
-            results = list(ddgs.text(query, max_results=3))
+        with span("tool.web_search", backend=settings.WEB_SEARCH_BACKEND) as s:
+            results, info = search_web(query)
+            s.set(results=len(results), **info)
 
         if not results:
+            if info["error"]:
+                return f"Web search error for '{query}': {info['error']}"
             return f"Web search for '{query}' returned no results. Try a different query."
 
-        formatted = []
-        for i, r in enumerate(results, 1):
-            title = r.get("title", "No title")
-            href = r.get("href", "N/A")
-            body = r.get("body", "No snippet")
-            formatted.append(f"[Result {i}] {title}\nURL: {href}\nSnippet: {body}")
-
-        output = "\n\n---\n\n".join(formatted)
-        print(f"[web_search] Found {len(results)} results for: {query}")
+        output = format_results(results)
+        source = "cache" if info["cached"] else ("partial, " + info["error"] if info["partial"] else "live")
+        print(f"[web_search] Found {len(results)} results ({source}) for: {query}")
         return output
 
     except ImportError:
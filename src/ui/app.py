@@ -1,12 +1,18 @@
 """Streamlit chat interface for the local AI agent.
 
+A thin client of the agent service (python -m src.server): questions, status
+and warmup all live in that one long-lived process, so Streamlit reruns only
+make a single cheap /health call.
+
 Run with: streamlit run src/ui/app.py
 """
 
+import json
+import uuid
+
+import httpx
 import streamlit as st
-from elasticsearch import Elasticsearch
 
-from src.agent.graph import run_agent
 from src.config import settings
 
 # ── Page config ──
@@ -19,6 +25,24 @@ st.set_page_config(
 st.title("Local AI Agent")
 st.caption("Elasticsearch + Ollama + LangGraph — $0 cost")
 
+
+def _stream_answer(question: str, result: dict):
+    """Yield answer tokens from the service; the final result is written into `result`."""
+    body = {"question": question, "session_id": st.session_state.session_id}
+    with httpx.stream("POST", f"{settings.AGENT_SERVER_URL}/ask/stream", json=body, timeout=None) as resp:
+        if resp.status_code == 429:
+            raise RuntimeError(f"The agent is busy — try again in {resp.headers.get('Retry-After', 'a few')}s.")
+        resp.raise_for_status()
+        for line in resp.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event["type"] == "token":
+                yield event["content"]
+            else:
+                result.update(event["result"])
+
+
 # ── Sidebar ──
 with st.sidebar:
     st.header("Configuration")
@@ -26,52 +50,62 @@ with st.sidebar:
     st.text(f"Embeddings: {settings.EMBEDDING_MODEL}")
     st.text(f"ES Index: {settings.ES_INDEX_NAME}")
 
-    # Connection status
+    # Connection status (cached and refreshed in the background by the service)
     st.divider()
     st.subheader("Status")
 
     try:
-        es = Elasticsearch(settings.ELASTICSEARCH_URL)
-        if es.ping():
+        health = httpx.get(f"{settings.AGENT_SERVER_URL}/health", timeout=5).json()
+    except Exception:
+        health = None
+        st.error(f"Agent service: Not reachable at {settings.AGENT_SERVER_URL} — run `python -m src.server`")
+
+    if health is not None:
+        if health.get("backend") == "local":
+            st.success("Retrieval: embedded local index")
+            st.text(f"Documents: {health['documents'] or 0} chunks")
+        elif health["elasticsearch"]:
             st.success("Elasticsearch: Connected")
-            try:
-                count = es.count(index=settings.ES_INDEX_NAME).get("count", 0)
-                st.text(f"Documents: {count} chunks")
-            except Exception:
+            if health["documents"] is not None:
+                st.text(f"Documents: {health['documents']} chunks")
+            else:
                 st.warning("No index yet — run ingestion")
+        elif health["elasticsearch"] is None:
+            st.info("Elasticsearch: Checking...")
         else:
             st.error("Elasticsearch: Not reachable")
-    except Exception:
-        st.error("Elasticsearch: Not reachable")
 
-    try:
-        import requests
-        resp = requests.get(f"{settings.OLLAMA_BASE_URL}/api/tags", timeout=5)
-        if resp.status_code == 200:
-            models = [m["name"] for m in resp.json().get("models", [])]
+        if health["ollama"]:
             st.success("Ollama: Connected")
-            if models:
-                st.caption(f"Models: {', '.join(models[:5])}")
+        elif health["ollama"] is None:
+            st.info("Ollama: Checking...")
         else:
             st.error("Ollama: Not reachable")
-    except Exception:
-        st.error("Ollama: Not reachable")
+
+        queue = health["queue"]
+        st.caption(f"Queue: {queue['in_flight']} running, {queue['waiting']} waiting")
+        for name, report in (health.get("warmup") or {}).items():
+            if report["ok"]:
+                st.caption(f"Warmup {name}: {report['seconds']:.1f}s ({'cold' if report['cold'] else 'warm'})")
 
     st.divider()
     if st.button("Clear Chat"):
         st.session_state.messages = []
+        st.session_state.session_id = uuid.uuid4().hex  # the service keeps history per session
         st.rerun()
 
 # ── Chat history ──
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 
 # Display chat history
 for msg in st.session_state.messages:
     with st.chat_message(msg["role"]):
         st.markdown(msg["content"])
         if msg.get("route"):
-            icons = {"vectorstore": "🟢", "websearch": "🌐", "direct": "🔵"}
+            icons = {"vectorstore": "🟢", "websearch": "🌐", "direct": "🔵", "calculate": "🧮"}
             icon = icons.get(msg["route"], "⚪")
             st.caption(f"{icon} Route: {msg['route']}")
 
@@ -82,22 +116,25 @@ if prompt := st.chat_input("Ask me anything..."):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # Run agent
+    # Run agent, rendering tokens as they arrive
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            try:
-                result = run_agent(prompt)
-                response = result.get("generation", "I couldn't generate a response.")
-                route = result.get("route", "unknown")
-            except Exception as e:
-                response = f"Error: {str(e)}"
-                route = "error"
-                result = {}
-
-        st.markdown(response)
-        icons = {"vectorstore": "🟢", "websearch": "🌐", "direct": "🔵"}
+        result = {}
+
+        try:
+            response = st.write_stream(_stream_answer(prompt, result)) or result.get("generation") or "I couldn't generate a response."
+            route = result.get("route", "unknown")
+        except Exception as e:
+            response = f"Error: {str(e)}"
+            route = "error"
+            st.markdown(response)
+
+        icons = {"vectorstore": "🟢", "websearch": "🌐", "direct": "🔵", "calculate": "🧮"}
         icon = icons.get(route, "⚪")
-        st.caption(f"{icon} Route: {route}")
+        timings = result.get("timings", {})
+        if timings:
+            st.caption(f"{icon} Route: {route} · first token {timings['ttft_s']:.1f}s · total {timings['total_s']:.1f}s")
+        else:
+            st.caption(f"{icon} Route: {route}")
 
         # Show web search debug info
         web_results = result.get("web_results", [])
@@ -0,0 +1,75 @@
+"""Preload the Ollama models so the first question doesn't pay the model load.
+
+Usage: python -m src.warmup
+
+Loads the embedding model and the LLM in parallel with their configured
+keep-alive (LLM_KEEP_ALIVE / EMBEDDING_KEEP_ALIVE), and primes the LLM's KV
+cache with the static KB system prompt so the first KB answer only prefills
+the context and question. The report separates the cold load (Ollama's
+load_duration) from the total request time.
+"""
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from src.agent.nodes import COLD_LOAD_MS, KB_SYSTEM
+from src.config import settings
+
+WARMUP_TIMEOUT = 300.0  # a cold load of a multi-GB model on CPU can take minutes
+
+
+def _post(path: str, payload: dict) -> dict:
+    started = time.perf_counter()
+    try:
+        response = httpx.post(f"{settings.OLLAMA_BASE_URL}{path}", json=payload, timeout=WARMUP_TIMEOUT)
+        response.raise_for_status()
+        body = response.json()
+    except Exception as e:
+        return {"ok": False, "seconds": round(time.perf_counter() - started, 3), "error": f"{type(e).__name__}: {e}"}
+    load_ms = (body.get("load_duration") or 0) / 1e6
+    return {
+        "ok": True,
+        "seconds": round(time.perf_counter() - started, 3),
+        "load_ms": round(load_ms, 1),
+        "cold": load_ms >= COLD_LOAD_MS,
+    }
+
+
+def warmup_embeddings() -> dict:
+    return _post("/api/embed", {
+        "model": settings.EMBEDDING_MODEL,
+        "input": "warmup",
+        "keep_alive": settings.EMBEDDING_KEEP_ALIVE,
+    })
+
+
+def warmup_llm() -> dict:
+    return _post("/api/chat", {
+        "model": settings.LLM_MODEL,
+        "messages": [{"role": "system", "content": KB_SYSTEM}, {"role": "user", "content": "ping"}],
+        "stream": False,
+        "keep_alive": settings.LLM_KEEP_ALIVE,
+        "options": {"num_predict": 1, "temperature": 0},
+    })
+
+
+def warmup() -> dict:
+    """Load both models concurrently; returns {"embeddings": report, "llm": report}."""
+    print("--- WARMUP: loading Ollama models ---")
+    with ThreadPoolExecutor(2) as pool:
+        embeddings, llm = pool.submit(warmup_embeddings), pool.submit(warmup_llm)
+        report = {"embeddings": embeddings.result(), "llm": llm.result()}
+    for name, result in report.items():
+        if result["ok"]:
+            state = f"cold, load {result['load_ms']:.0f}ms" if result["cold"] else "already loaded"
+            print(f"   {name}: {result['seconds']:.2f}s ({state})")
+        else:
+            print(f"   {name}: failed — {result['error']}")
+    return report
+
+
+if __name__ == "__main__":
+    print(json.dumps(warmup(), indent=2))
@@ -3,7 +3,7 @@
 # start.sh — One-command startup for Elastic Agent Local
 #
 # Starts Docker (ES + Kibana), Ollama, pulls models, installs Python deps,
-# ingests documents, and launches the Streamlit chat UI.
+# ingests documents, starts the agent service and launches the Streamlit chat UI.
 #
 # Usage:
 #   Apple Silicon Mac:  bash start.sh
@@ -65,7 +65,7 @@ if [ ! -d .venv ]; then
     python3 -m venv .venv
 fi
 source .venv/bin/activate
-pip install -e "." --quiet
+pip install -e ".[server]" --quiet
 echo "  ✓ Python dependencies installed"
 
 # ── [6/7] Ingest documents ──
@@ -82,13 +82,21 @@ else
     python -m src.ingest.loader
 fi
 
-# ── [7/7] Launch UI ──
-echo "[7/7] Launching Streamlit UI..."
+# ── [7/7] Agent service + UI ──
+echo "[7/7] Starting agent service and Streamlit UI..."
+python -m src.server &
+SERVER_PID=$!
+trap 'kill $SERVER_PID 2>/dev/null' EXIT
+until curl -s -o /dev/null http://localhost:8000/health; do
+    sleep 2
+done
+echo "  ✓ Agent service is running (models warmed up)"
 echo ""
 echo "==========================================="
 echo "  ✅ All systems go!"
 echo "  📊 Kibana:      http://localhost:5601"
 echo "  🔍 Elasticsearch: http://localhost:9200"
+echo "  🤖 Agent API:   http://localhost:8000"
 echo "  💬 Chat UI:     http://localhost:8501"
 echo "==========================================="
 echo ""
@@ -0,0 +1,29 @@
+"""Keep tests off the developer's Ollama and out of the repo's .cache directory."""
+import importlib
+
+import pytest
+
+from src import clients, embeddings
+from src.agent import graph, memory
+from src.config import settings
+
+web_search = importlib.import_module("src.tools.web_search")  # the package re-exports the tool under this name
+
+
+@pytest.fixture(autouse=True)
+def _isolated(monkeypatch, tmp_path):
+    # Keyword routing never embeds; tests of the semantic router pass it a stub `embed_documents`
+    monkeypatch.setattr(settings, "ROUTER_STRATEGY", "keyword")
+    monkeypatch.setattr(settings, "EMBEDDING_CACHE_DIR", str(tmp_path / "embeddings"))
+    monkeypatch.setattr(settings, "MEMORY_CHECKPOINT_PATH", str(tmp_path / "checkpoints.sqlite"))
+    monkeypatch.setattr(settings, "WEB_SEARCH_CACHE_PATH", str(tmp_path / "web_search.sqlite"))
+    monkeypatch.setattr(settings, "INGEST_MANIFEST_PATH", str(tmp_path / "ingest_manifest.json"))
+    monkeypatch.setattr(settings, "LOCAL_INDEX_DIR", str(tmp_path / "local_index"))
+    # Drop singletons opened on the old paths
+    monkeypatch.setattr(clients, "_clients", {})
+    monkeypatch.setattr(embeddings, "_caches", {})
+    monkeypatch.setattr(memory, "_checkpointer", None)
+    monkeypatch.setattr(web_search, "_cache", None)
+    graph._session_graph.cache_clear()
+    yield
+    graph._session_graph.cache_clear()
@@ -1,2 +1,335 @@
 """Integration tests for the full agent graph."""
-# TODO: Phase 8 — Implement agent integration tests
+import asyncio
+import time
+from itertools import repeat
+
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from src.agent import graph, memory, nodes
+from src.agent.cache import AnswerCache
+from src.agent.context import assemble_context, merge_overlapping
+from src.agent.router import SemanticRouter, load_examples
+from src.tools.elastic_search import SearchHit
+from src.tools.web_search import cancel_event
+from src.agent.batch import run_agent_batch
+from src.agent.graph import build_graph, run_agent, stream_agent
+from src import observability
+
+
+def _fake_llm(text: str = "Hi there, how can I help?"):
+    return GenericFakeChatModel(messages=repeat(AIMessage(content=text)))
+
+
+def _fake_embed(text: str) -> list[float]:
+    # "RRF" questions point one way, everything else another
+    return [1.0, 0.0] if "rrf" in text.lower() else [0.0, 1.0]
+
+
+def _answer(route: str = "vectorstore") -> dict:
+    return {"question": "q", "generation": "an answer", "route": route, "documents": ["doc"]}
+
+
+def test_answer_cache_exact_and_semantic_hits():
+    generation = [1]
+    cache = AnswerCache(route_ttls={"vectorstore": 60}, embed=_fake_embed, generation=lambda: generation[0])
+    assert cache.lookup("What is RRF?") is None
+    assert cache.store("What is RRF?", _answer())
+
+    assert cache.lookup("  what is rrf ")["cache_hit"] == "exact"
+    assert cache.lookup("Explain RRF to me")["cache_hit"] == "semantic"
+    assert cache.lookup("How do I configure Kibana?") is None
+
+    generation[0] = 2  # re-ingest invalidates everything
+    assert cache.lookup("What is RRF?") is None
+
+
+def test_answer_cache_route_policy_and_bounds():
+    cache = AnswerCache(max_entries=2, route_ttls={"vectorstore": 60, "websearch": 0}, embed=_fake_embed, generation=lambda: 0)
+    assert not cache.store("latest news", _answer("websearch"))
+    assert not cache.store("empty", {**_answer(), "generation": ""})
+
+    for q in ("one", "two", "three"):
+        cache.store(q, _answer())
+    assert len(cache) == 2
+    assert cache.lookup("three")["cache_hit"] == "exact"
+
+
+def test_answer_cache_ttl_expiry():
+    cache = AnswerCache(route_ttls={"direct": 1e-9}, embed=_fake_embed, generation=lambda: 0)
+    cache.store("hello", _answer("direct"))
+    assert cache.lookup("hello") is None
+
+
+def test_kb_prompt_system_prefix_is_request_independent():
+    for prompt in (nodes.KB_PROMPT, nodes.WEB_PROMPT):
+        a = prompt.format_messages(context="doc one", question="q1")
+        b = prompt.format_messages(context="another doc", question="q2")
+        assert a[0].content == b[0].content and "doc" not in a[0].content
+
+
+def test_stream_agent_yields_tokens_then_result(monkeypatch):
+    monkeypatch.setattr(nodes, "get_llm", _fake_llm)
+    events = list(stream_agent("hello there", use_cache=False))
+
+    tokens = [e["content"] for e in events if e["type"] == "token"]
+    assert len(tokens) > 1 and all(e["node"] == "direct_response" for e in events[:-1])
+    result = events[-1]["result"]
+    assert "".join(tokens) == result["generation"] == "Hi there, how can I help?"
+    assert result["route"] == "direct"
+    assert 0 <= result["timings"]["ttft_s"] <= result["timings"]["total_s"]
+
+
+def test_arithmetic_takes_calculate_route_without_llm(monkeypatch):
+    monkeypatch.setattr(nodes, "get_llm", lambda: 1 / 0)
+    monkeypatch.setattr(nodes, "semantic_router", None)  # routed before the semantic router
+    result = run_agent("What is 15% of 2400?", use_cache=True)
+    assert result["route"] == "calculate" and result["generation"] == "15 / 100 * 2400 = 360"
+
+    oversized = "1" + "+1" * 5000  # deeper than the parser's recursion limit
+    assert not graph._use_cache(oversized, False) and nodes.route_question({"question": oversized})["route"] != "calculate"
+
+    events = list(stream_agent("what is 9**9**9", use_cache=True))
+    assert events[0]["type"] == "token" and "exceeds" in events[0]["content"]
+    assert events[-1]["result"]["route"] == "calculate"
+
+
+class SlowTool:
+    """Stand-in for a LangChain tool whose async call takes `delay` seconds."""
+
+    def __init__(self, result: str, delay: float, hits: list | None = None):
+        self.result, self.delay, self.hits = result, delay, hits or []
+        self.started = self.cancelled = 0
+
+    async def ainvoke(self, query):
+        self.started += 1
+        self.cancel_event = cancel_event.get()
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if isinstance(query, dict):  # tool call, answered like a content_and_artifact tool
+            return ToolMessage(content=self.result, artifact={"hits": self.hits}, tool_call_id=query["id"])
+        return self.result
+
+
+def _run_async_graph(monkeypatch, kb_result: str, question="What is Elasticsearch RRF?", hits=None, agent_graph=None):
+    kb, web = SlowTool(kb_result, 0.2, hits), SlowTool("[Result 1] RRF\nURL: https://example.com", 0.2)
+    monkeypatch.setattr(nodes, "search_knowledge_base", kb)
+    monkeypatch.setattr(nodes, "web_search", web)
+    monkeypatch.setattr(nodes, "get_llm", _fake_llm)
+    agent_graph = agent_graph or build_graph(use_async=True, speculative=True)
+    started = time.perf_counter()
+    result = asyncio.run(agent_graph.ainvoke({"question": question, "messages": []}))
+    return result, kb, web, time.perf_counter() - started
+
+
+def test_speculative_web_search_overlaps_kb_miss(monkeypatch):
+    result, kb, web, elapsed = _run_async_graph(monkeypatch, kb_result="")
+    assert result["route"] == "websearch" and result["web_results"]
+    assert web.started == 1  # reused, not searched twice
+    assert elapsed < 0.35  # max(KB, web), not KB + web
+
+
+def test_speculative_web_search_cancelled_on_kb_hit(monkeypatch):
+    hits = [SearchHit("1", "RRF fuses rankings. " * 5, "a.md", 0.03, vector_score=0.9)]
+    result, kb, web, _ = _run_async_graph(monkeypatch, kb_result="[Doc 1] (source: a.md)\n" + "RRF fuses rankings. " * 5, hits=hits)
+    assert result["route"] == "vectorstore"
+    assert web.cancelled == 1 and web.cancel_event.is_set()  # the search thread is told too, not just the task
+
+
+def test_default_async_graph_never_searches_web_on_kb_hit(monkeypatch):
+    hits = [SearchHit("1", "RRF fuses rankings. " * 5, "a.md", 0.03, vector_score=0.9)]
+    result, kb, web, _ = _run_async_graph(monkeypatch, kb_result="[Doc 1] (source: a.md)\n" + "RRF fuses rankings. " * 5,
+                                          hits=hits, agent_graph=graph.async_agent_graph)
+    assert result["route"] == "vectorstore"
+    assert web.started == 0  # speculative web search is opt-in
+
+
+def test_batch_keeps_order_and_reports_errors(monkeypatch):
+    monkeypatch.setattr(nodes, "get_llm", _fake_llm)
+    monkeypatch.setattr(nodes, "web_search", SlowTool("[Result 1] news", 0.01))
+    questions = ["hello", {"id": 7, "question": "latest news on ES"}, "hi again"]
+
+    records, summary = run_agent_batch(questions, max_concurrency=2)
+    assert [r["question"] for r in records] == ["hello", "latest news on ES", "hi again"]
+    assert records[1]["id"] == 7 and records[1]["route"] == "websearch"
+    assert summary["questions"] == 3 and summary["errors"] == 0
+    assert summary["routes"] == {"direct": 2, "websearch": 1}
+
+    monkeypatch.setattr(nodes, "get_llm", lambda: (_ for _ in ()).throw(RuntimeError("ollama down")))
+    records, summary = run_agent_batch(["hello"])
+    assert records[0]["error"] == "RuntimeError: ollama down" and summary["errors"] == 1
+
+
+def test_tracing_records_nested_spans_and_metrics(monkeypatch, tmp_path):
+    monkeypatch.setattr(observability.settings, "TRACING_ENABLED", True)
+    monkeypatch.setattr(observability.settings, "TRACE_JSONL_PATH", str(tmp_path / "traces.jsonl"))
+    monkeypatch.setattr(nodes, "get_llm", _fake_llm)
+    observability.reset_metrics()
+
+    run_agent("hello", use_cache=False)
+    _run_async_graph(monkeypatch, kb_result="")
+
+    sync_trace = observability.recent_traces[0]
+    assert sync_trace["name"] == "agent.run" and sync_trace["attributes"]["route"] == "direct"
+    spans = {s["name"]: s for s in sync_trace["spans"]}
+    assert spans["llm.generate"]["parent_id"] == spans["node.direct_response"]["span_id"]
+    assert spans["node.direct_response"]["attributes"]["generation_chars"] == len("Hi there, how can I help?")
+
+    async_trace = observability.recent_traces[1]  # graph.ainvoke without arun_agent: first node is the root
+    assert async_trace["name"] == "node.route_question"
+    retrieve = observability.recent_traces[2]
+    assert retrieve["name"] == "node.retrieve" and retrieve["attributes"]["web_results"] == 1
+    assert len((tmp_path / "traces.jsonl").read_text().splitlines()) == len(observability.recent_traces)
+
+    metrics = observability.metrics_text()
+    assert 'agent_span_duration_seconds_count{span="node.direct_response"} 1' in metrics
+    assert 'agent_span_duration_seconds_bucket{span="agent.run",le="+Inf"} 1' in metrics
+
+
+def test_tracing_disabled_is_a_no_op(monkeypatch):
+    monkeypatch.setattr(observability.settings, "TRACING_ENABLED", False)
+    observability.reset_metrics()
+    with observability.span("anything") as s:
+        s.set(ignored=True)
+    assert not observability.recent_traces and "span=" not in observability.metrics_text()
+
+
+def _bag_of_words(texts: list[str]) -> list[list[float]]:
+    vocab = ["hello", "hiya", "thanks", "news", "today", "weather", "booking", "room", "rls", "policy"]
+    return [[float(w in t.lower()) for w in vocab] + [0.01] for t in texts]
+
+
+def test_semantic_router_nearest_centroid_and_fallback(monkeypatch):
+    examples = {
+        "direct": ["hello", "hiya", "thanks"],
+        "websearch": ["news today", "weather today"],
+        "vectorstore": ["booking room", "rls policy"],
+    }
+    router = SemanticRouter(examples, min_similarity=0.5, embed_documents=_bag_of_words)
+    assert router.classify("hiya friend")[0] == "direct"
+    assert router.classify("who won? news from today")[0] == "websearch"
+    assert router.classify("which RLS policy covers the booking room table")[0] == "vectorstore"
+    assert router.classify("zzz")[0] is None  # not confident
+
+    monkeypatch.setattr(nodes, "semantic_router", router)
+    monkeypatch.setattr(nodes.settings, "ROUTER_STRATEGY", "semantic")
+    assert nodes.route_question({"question": "hiya"})["route"] == "direct"
+    assert nodes.route_question({"question": "who won the final"})["route"] == "websearch"  # keyword fallback
+
+    broken = SemanticRouter(examples, embed_documents=lambda texts: 1 / 0)
+    assert broken.classify("hello") == (None, 0.0)
+
+
+def test_route_examples_cover_every_route():
+    examples = load_examples(nodes.settings.ROUTER_EXAMPLES_PATH)
+    assert set(examples) == {"direct", "websearch", "vectorstore"}
+    assert all(len(questions) >= 5 for questions in examples.values())
+
+
+def _hit(id, text, source="a.md", start=None, score=1.0):
+    return {"id": id, "text": text, "source": source, "score": score,
+            "metadata": {} if start is None else {"start_index": start}}
+
+
+def test_context_merges_overlaps_and_respects_budget():
+    text = " ".join(f"word{i}" for i in range(60))
+    chunks = [_hit("1", text[0:120], start=0, score=0.9), _hit("2", text[100:220], start=100, score=0.8),
+              _hit("3", text[0:120], source="b.md", score=0.5)]
+    merged = merge_overlapping(chunks)
+    assert any(p["text"] == text[0:220] and p["score"] == 0.9 for p in merged)
+
+    context, stats = assemble_context(chunks, token_budget=1000)
+    assert context.count(text[100:120]) == 1  # overlap stitched once, b.md's exact duplicate dropped
+    assert stats["tokens_saved"] > 0 and stats["passages"] == 1
+
+    context, stats = assemble_context(chunks, token_budget=30)
+    assert stats["packed"] == 1 and stats["context_tokens"] <= 35  # oversized best passage is truncated
+
+
+def test_context_mmr_prefers_diverse_passages():
+    dup = "hybrid search fuses bm25 and knn rankings with rrf"
+    hits = [_hit("1", dup, "a.md", score=0.9), _hit("2", dup + " again", "b.md", score=0.89),
+            _hit("3", "ingestion embeds chunks in batches", "c.md", score=0.8)]
+    context, stats = assemble_context(hits, token_budget=40)
+    assert stats["packed"] == 2 and "c.md" in context and "b.md" not in context
+
+
+def test_pack_context_node_replaces_documents(monkeypatch):
+    hits = [SearchHit("1", "RRF fuses rankings. " * 10, "a.md", 0.9, {"start_index": 0}, vector_score=0.9),
+            SearchHit("2", "RRF fuses rankings. " * 10, "a.md", 0.8, {"start_index": 150}, bm25_score=7.5)]
+    kb = SlowTool("[Doc 1] (source: a.md)\n" + "RRF fuses rankings. " * 20, 0, hits=hits)
+    monkeypatch.setattr(nodes, "search_knowledge_base", kb)
+    monkeypatch.setattr(nodes, "web_search", SlowTool("[Result 1] RRF", 0))
+    monkeypatch.setattr(nodes, "get_llm", _fake_llm)
+    graph = build_graph(use_async=True)
+    result = asyncio.run(graph.ainvoke({"question": "What is Elasticsearch RRF?", "messages": []}))
+    assert result["route"] == "vectorstore" and len(result["hits"]) == 2
+    assert result["context_stats"]["passages"] == 1 and result["context_stats"]["tokens_saved"] > 0
+    assert result["documents"][0].startswith("[Doc 1] (source: a.md)")
+
+
+def test_grading_drops_low_scores_and_falls_back_to_web(monkeypatch):
+    monkeypatch.setattr(nodes.settings, "GRADE_MIN_VECTOR_SCORE", 0.8)
+    monkeypatch.setattr(nodes.settings, "GRADE_MIN_BM25_SCORE", 5.0)
+    hits = [
+        {"id": "1", "text": "exact identifier match", "source": "a.md", "score": 0.03, "vector_score": 0.6, "bm25_score": 9.0},
+        {"id": "2", "text": "close in meaning", "source": "b.md", "score": 0.02, "vector_score": 0.85, "bm25_score": None},
+        {"id": "3", "text": "noise", "source": "c.md", "score": 0.01, "vector_score": 0.7, "bm25_score": 1.0},
+    ]
+    update = nodes.grade_documents({"documents": ["raw"], "hits": hits})
+    assert update["route"] == "vectorstore" and [h["id"] for h in update["hits"]] == ["1", "2"]
+    assert "c.md" not in update["documents"][0]
+
+    update = nodes.grade_documents({"documents": ["No relevant documents found in the knowledge base."], "hits": []})
+    assert update == {"documents": [], "hits": [], "route": "websearch"}
+
+    monkeypatch.setattr(nodes.settings, "GRADE_MIN_HITS", 3)
+    assert nodes.grade_documents({"documents": ["raw"], "hits": hits})["route"] == "websearch"
+
+
+def test_memory_compaction_keeps_window_within_budget():
+    messages = []
+    for i in range(5):
+        messages += [HumanMessage(f"question {i}?", id=f"q{i}"), AIMessage(f"Answer {i}. More detail.", id=f"a{i}")]
+    removed, summary = memory.compact(messages, "", window_turns=2, token_budget=1000, summary_tokens=1000)
+    assert removed == ["q0", "a0", "q1", "a1", "q2", "a2"]
+    assert summary.splitlines() == [f"- question {i}? → Answer {i}." for i in range(3)]
+
+    removed, summary = memory.compact(messages, "- older turn", window_turns=5, token_budget=30, summary_tokens=12)
+    assert removed[:2] == ["q0", "a0"] and "q4" not in removed  # the latest turn always stays
+    assert "older turn" not in summary and memory.estimate_tokens(summary) <= 12
+
+
+def test_session_follow_ups_see_history_and_reuse_hits(monkeypatch):
+    monkeypatch.setattr(nodes.settings, "MEMORY_WINDOW_TURNS", 2)
+    searches, prompts = [], []
+
+    def fake_search(call):
+        searches.append(call["args"]["query"])
+        hits = [SearchHit("d1", "RRF fuses rankings", "rrf.md", 0.9, vector_score=0.9)]
+        return ToolMessage(content="[Doc 1] RRF", artifact={"hits": hits}, tool_call_id=call["id"])
+
+    def fake_llm(chain, inputs):
+        prompts.append(inputs)
+        return AIMessage(content=f"Answer about {inputs['question']}")
+
+    monkeypatch.setattr(nodes, "search_knowledge_base", type("Tool", (), {"invoke": staticmethod(fake_search)}))
+    monkeypatch.setattr(nodes, "_stream_llm", fake_llm)
+    monkeypatch.setattr(nodes, "topic_similarity", lambda q, previous: 0.9 if "rrf" in q.lower() else 0.1)
+
+    run_agent("What is RRF?", use_cache=False, session_id="s1")
+    result = run_agent("How does RRF rank ties?", use_cache=False, session_id="s1")
+    assert searches == ["What is RRF?"] and result["route"] == "vectorstore"  # follow-up reused the hits
+    assert "User: What is RRF?" in prompts[-1]["history"]
+    assert run_agent("What is RRF?", use_cache=False)["generation"] and prompts[-1]["history"] == ""  # no session
+
+    run_agent("How are bookings cancelled?", use_cache=False, session_id="s1")
+    assert len(searches) == 3  # new topic searches again (the sessionless call searched too)
+
+    monkeypatch.setattr(memory, "_checkpointer", None)  # reopen from disk
+    graph._session_graph.cache_clear()
+    state = graph._session_graph(False).get_state(memory.thread_config("s1")).values
+    assert len(state["messages"]) == 4 and state["summary"].startswith("- What is RRF?")
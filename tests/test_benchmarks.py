@@ -0,0 +1,21 @@
+"""Tests for the offline benchmark harness (benchmarks/run.py with the stand-ins in benchmarks/fakes.py)."""
+from benchmarks import run
+from src import clients
+from src.agent import nodes
+from src.config import settings
+
+
+def test_benchmark_suite_runs_offline(tmp_path):
+    web_search, answer_cache = nodes.web_search, settings.ANSWER_CACHE_ENABLED
+    report = run.main([
+        "--output", str(tmp_path / "bench.json"), "--queries", "3", "--rounds", "1",
+        "--embed-ms", "0", "--embed-per-text-ms", "0", "--es-ms", "0", "--write-ms", "0", "--web-ms", "0",
+    ])
+    results = report["results"]
+    assert results["ingest"]["chunks"] == results["chunk_documents"]["chunks"]
+    assert set(results["search_knowledge_base"]) == {"dense", "bm25", "hybrid"}
+    assert (tmp_path / "bench.json").exists()
+    assert run.compare(report, report) == []
+    # the stand-ins are uninstalled afterwards
+    assert nodes.web_search is web_search and settings.ANSWER_CACHE_ENABLED == answer_cache
+    assert not clients._clients
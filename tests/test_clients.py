@@ -0,0 +1,69 @@
+"""Tests for the process-wide client registry (no backends required)."""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src import clients
+
+
+def test_clients_are_created_once_per_process():
+    clients.reset_clients()
+    with ThreadPoolExecutor(8) as pool:
+        instances = list(pool.map(lambda _: clients.get_llm(), range(32)))
+    assert all(llm is instances[0] for llm in instances)
+    assert clients.get_vector_store() is clients.get_vector_store()
+    assert clients.get_vector_store().embedding is clients.get_embeddings()
+
+
+def test_reset_reconnects_only_named_clients():
+    clients.reset_clients()
+    llm, es = clients.get_llm(), clients.get_es_client()
+    clients.reset_clients("llm")
+    assert clients.get_llm() is not llm
+    assert clients.get_es_client() is es
+
+
+def test_llm_timeout_reaches_http_client():
+    clients.reset_clients("llm")
+    assert clients.get_llm()._client._client.timeout.read is not None
+
+
+def test_sync_and_async_llm_callers_share_one_limit(monkeypatch):
+    monkeypatch.setattr(clients, "_llm_slots", threading.BoundedSemaphore(2))
+    active, peak, lock = [0], [0], threading.Lock()
+
+    def _enter():
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+
+    def _leave():
+        with lock:
+            active[0] -= 1
+
+    def sync_call():
+        with clients.llm_slot():
+            _enter()
+            time.sleep(0.05)
+            _leave()
+
+    async def async_call():
+        async with clients.allm_slot():
+            _enter()
+            await asyncio.sleep(0.05)
+            _leave()
+
+    async def scenario():
+        waiter = asyncio.create_task(async_call())
+        await asyncio.sleep(0.01)
+        waiter.cancel()  # a caller cancelled while queued must not keep a slot
+        await asyncio.gather(async_call(), async_call(), async_call(), return_exceptions=True)
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        calls = [pool.submit(sync_call) for _ in range(3)]
+        asyncio.run(scenario())
+        for call in calls:
+            call.result()
+    assert peak[0] == 2
+    assert clients._llm_slots.acquire(blocking=False) and clients._llm_slots.acquire(blocking=False)
@@ -0,0 +1,74 @@
+"""Tests for the on-disk embedding cache."""
+import threading
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.embeddings import CachedEmbeddings, EmbeddingCache
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    calls: int = 0
+    texts: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        return super().embed_documents(texts)
+
+
+def test_cache_hits_skip_the_model(tmp_path):
+    inner = CountingEmbeddings(size=16)
+    cached = CachedEmbeddings(inner, EmbeddingCache(tmp_path, "fake"))
+
+    first = cached.embed_documents(["alpha", "beta", "alpha"])
+    assert inner.texts == 2  # duplicates within a call are embedded once
+    assert cached.embed_documents(["beta", "alpha"]) == [first[1], first[0]]
+    assert cached.embed_query("alpha") == first[0]
+    assert inner.calls == 1
+
+
+def test_cache_persists_across_instances(tmp_path):
+    vector = CachedEmbeddings(DeterministicFakeEmbedding(size=16), EmbeddingCache(tmp_path, "fake")).embed_query("q")
+
+    inner = CountingEmbeddings(size=16)
+    reopened = CachedEmbeddings(inner, EmbeddingCache(tmp_path, "fake"))
+    assert reopened.embed_query("q") == vector
+    assert inner.calls == 0
+
+
+def test_lru_eviction_bounds_size(tmp_path):
+    cache = EmbeddingCache(tmp_path, "fake", max_entries=10)
+    cached = CachedEmbeddings(DeterministicFakeEmbedding(size=4), cache)
+    for i in range(25):
+        cached.embed_query(f"text {i}")
+    assert len(cache) <= 10
+
+    # Recent entries survive and still map to their own vectors after slot reuse
+    expected = DeterministicFakeEmbedding(size=4).embed_query("text 24")
+    inner = CountingEmbeddings(size=4)
+    cached.embeddings = inner
+    assert cached.embed_query("text 24") == pytest.approx(expected, abs=1e-6)
+    assert inner.calls == 0
+
+
+def test_read_is_not_torn_by_a_concurrent_eviction(tmp_path):
+    # Two instances = two SQLite connections, like the ingest CLI and the server sharing the cache
+    writer = EmbeddingCache(tmp_path, "fake", max_entries=2)
+    writer.put_many({"old": [1.0] * 4})
+    reader = EmbeddingCache(tmp_path, "fake", max_entries=2)
+    view, threads = reader._view, []
+
+    def _view_after_eviction(min_rows):
+        # Between the reader's slot lookup and its vector read, another connection evicts "old" and reuses its slot
+        thread = threading.Thread(target=writer.put_many, args=({"a": [2.0] * 4, "b": [3.0] * 4, "c": [4.0] * 4},))
+        thread.start()
+        thread.join(0.3)
+        threads.append(thread)
+        return view(min_rows)
+
+    reader._view = _view_after_eviction
+    assert reader.get_many(["old"]) == {"old": [1.0] * 4}
+    threads[0].join()
+    reader._view = view
+    assert "old" not in reader.get_many(["old", "a", "b", "c"])
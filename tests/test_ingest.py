@@ -0,0 +1,305 @@
+"""Tests for the ingestion pipeline (no Elasticsearch or Ollama required)."""
+import fnmatch
+import importlib
+import json
+import sqlite3
+
+import numpy as np
+import pytest
+from elasticsearch import ConnectionTimeout, NotFoundError
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.config import settings
+from src.ingest import loader
+from src.ingest.manifest import IngestManifest
+from src.local_index import LocalVectorIndex
+
+
+class _FakeIndices:
+    def __init__(self, cluster):
+        self.cluster = cluster
+
+    def exists(self, index):
+        return index in self.cluster.indices_docs or index in self.cluster.aliases
+
+    def get(self, index):
+        return {name: {} for name in self.cluster.indices_docs if fnmatch.fnmatch(name, index)}
+
+    def get_alias(self, name):
+        if name not in self.cluster.aliases:
+            raise NotFoundError("alias_not_found", meta=None, body={})
+        return {self.cluster.aliases[name]: {"aliases": {name: {}}}}
+
+    def create(self, index, mappings, settings):
+        self.cluster.indices_docs[index] = {}
+        self.cluster.mappings[index] = mappings
+        self.cluster.settings[index] = dict(settings)
+
+    def put_settings(self, index, settings):
+        self.cluster.settings[index].update(settings)
+
+    def update_aliases(self, actions):
+        for action in actions:
+            if "add" in action:
+                self.cluster.aliases[action["add"]["alias"]] = action["add"]["index"]
+            elif "remove_index" in action:
+                self.cluster.indices_docs.pop(action["remove_index"]["index"])
+
+    def delete(self, index, ignore_unavailable=False):
+        self.cluster.indices_docs.pop(index, None)
+
+    def refresh(self, index):
+        pass
+
+    def forcemerge(self, index, **kwargs):
+        self.cluster.merged.append(index)
+
+
+class FakeCluster:
+    """Indices and aliases in memory; writes can fail after N batches (crash) or time out (retry)."""
+
+    def __init__(self, fail_after: int | None = None, timeouts: int = 0):
+        self.indices_docs: dict[str, dict[str, str]] = {}
+        self.aliases: dict[str, str] = {}
+        self.mappings: dict[str, dict] = {}
+        self.settings: dict[str, dict] = {}
+        self.merged: list[str] = []
+        self.sources: dict[str, list[str]] = {}  # chunk ID -> metadata.sources
+        self.batches = 0
+        self.fail_after = fail_after
+        self.timeouts = timeouts
+        self.indices = _FakeIndices(self)
+
+    def bulk(self, operations):
+        for action, body in zip(operations[::2], operations[1::2]):
+            sources = self.sources[action["update"]["_id"]]
+            params = body["script"]["params"]
+            sources.extend(s for s in params["add"] if s not in sources)
+            sources[:] = [s for s in sources if s not in params["remove"]]
+        return {"errors": False, "items": []}
+
+    @property
+    def docs(self) -> dict[str, str]:
+        """Documents served by the ES_INDEX_NAME alias."""
+        return self.indices_docs.get(self.aliases.get(settings.ES_INDEX_NAME), {})
+
+    def store(self, index_name):
+        return FakeVectorStore(self, index_name)
+
+
+class FakeVectorStore:
+    def __init__(self, cluster: FakeCluster, index_name: str):
+        self.cluster = cluster
+        self.index_name = index_name
+
+    def add_embeddings(self, text_embeddings, metadatas, ids, **kwargs):
+        cluster = self.cluster
+        if cluster.timeouts:
+            cluster.timeouts -= 1
+            raise ConnectionTimeout("simulated timeout")
+        if cluster.fail_after is not None and cluster.batches >= cluster.fail_after:
+            raise RuntimeError("simulated interruption")
+        cluster.batches += 1
+        for (text, _), metadata, doc_id in zip(text_embeddings, metadatas, ids):
+            cluster.indices_docs[self.index_name][doc_id] = text
+            cluster.sources[doc_id] = list(metadata.get("sources", []))
+
+    def delete(self, ids):
+        for doc_id in ids:
+            self.cluster.indices_docs[self.index_name].pop(doc_id, None)
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    data = tmp_path / "data"
+    data.mkdir()
+    for name in ("a", "b", "c"):
+        (data / f"{name}.md").write_text(f"# {name}\n\n" + "".join(f"{name} paragraph {i}. " for i in range(2000)))
+    monkeypatch.setattr(settings, "INGEST_MANIFEST_PATH", str(tmp_path / "manifest.json"))
+    monkeypatch.setattr(settings, "INGEST_RETRY_BACKOFF", 0.0)
+    monkeypatch.setattr(loader, "get_embeddings", lambda: DeterministicFakeEmbedding(size=8))
+    return data
+
+
+def _use_cluster(monkeypatch, cluster):
+    monkeypatch.setattr(loader, "get_es_client", lambda: cluster)
+    monkeypatch.setattr(loader, "get_vector_store", cluster.store)
+    return cluster
+
+
+def test_reingest_is_idempotent(corpus, monkeypatch):
+    store = _use_cluster(monkeypatch, FakeCluster())
+    first = loader.ingest(str(corpus))
+    assert first == len(store.docs) > 0
+
+    assert loader.ingest(str(corpus)) == 0
+    assert len(store.docs) == first
+
+
+def test_changed_and_removed_files(corpus, monkeypatch):
+    store = _use_cluster(monkeypatch, FakeCluster())
+    loader.ingest(str(corpus))
+
+    (corpus / "a.md").write_text("# a\n\nrewritten")
+    (corpus / "b.md").unlink()
+    written = loader.ingest(str(corpus))
+
+    assert written == 1
+    assert "rewritten" in "".join(store.docs.values())
+    assert not any("b paragraph" in text for text in store.docs.values())
+    assert any("c paragraph" in text for text in store.docs.values())
+
+
+def test_interrupted_run_resumes(corpus, monkeypatch):
+    total = len(loader.chunk_documents(loader.load_documents(str(corpus))))
+    cluster = _use_cluster(monkeypatch, FakeCluster(fail_after=1))
+    with pytest.raises(RuntimeError):
+        loader.ingest(str(corpus))
+    manifest = json.loads(open(settings.INGEST_MANIFEST_PATH).read())
+    committed = sum(len(f["chunk_ids"]) for f in manifest["files"].values())
+    assert 0 < committed < total
+
+    cluster.fail_after = None
+    assert loader.ingest(str(corpus)) == total - committed
+    assert len(cluster.docs) == total
+
+
+def test_timeouts_are_retried(corpus, monkeypatch):
+    store = _use_cluster(monkeypatch, FakeCluster(timeouts=2))
+    total = loader.ingest(str(corpus))
+    assert len(store.docs) == total
+
+
+def test_loader_streams_files_in_order_with_per_format_stats(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_LOAD_WINDOW", 2)
+    for i in range(5):
+        (tmp_path / f"{i}.{'md' if i % 2 else 'txt'}").write_text(f"document {i}")
+    (tmp_path / "notes.json").write_text("{}")  # not an ingestible format
+
+    stats = loader.LoadStats()
+    files = loader.discover_files(str(tmp_path))
+    assert [f.name for f in files] == ["0.txt", "1.md", "2.txt", "3.md", "4.txt"]
+
+    stream = loader.iter_documents(str(tmp_path), stats=stats)
+    assert next(stream).page_content == "document 0"  # yielded before the rest are loaded
+    docs = [d.page_content for d in stream]
+    assert docs == ["document 1", "document 2", "document 3", "document 4"]
+    assert stats.files == {"txt": 3, "md": 2}
+    assert stats.files_per_sec("txt") > 0
+
+
+def test_full_rebuild_swaps_alias_without_touching_live_index(corpus, monkeypatch):
+    cluster = _use_cluster(monkeypatch, FakeCluster())
+    cluster.indices_docs[settings.ES_INDEX_NAME] = {"legacy": "pre-alias concrete index"}
+    total = loader.ingest(str(corpus))  # migrates the concrete index behind an alias
+    blue = cluster.aliases[settings.ES_INDEX_NAME]
+    assert settings.ES_INDEX_NAME not in cluster.indices_docs and len(cluster.docs) == total
+
+    served_during_load = []
+    write = FakeVectorStore.add_embeddings
+    monkeypatch.setattr(FakeVectorStore, "add_embeddings",
+                        lambda self, *a, **kw: (served_during_load.append(cluster.aliases[settings.ES_INDEX_NAME]),
+                                                write(self, *a, **kw)))
+    assert loader.ingest(str(corpus), full=True) == total
+    green = cluster.aliases[settings.ES_INDEX_NAME]
+
+    assert set(served_during_load) == {blue} and green != blue
+    assert list(cluster.indices_docs) == [green] and len(cluster.docs) == total
+    assert cluster.merged == [blue, green]
+    assert cluster.settings[green]["refresh_interval"] == settings.ES_REFRESH_INTERVAL
+    vector = cluster.mappings[green]["properties"]["vector"]
+    assert vector["dims"] == 8 and vector["index_options"] == {
+        "type": settings.ES_VECTOR_INDEX_TYPE, "m": settings.ES_HNSW_M, "ef_construction": settings.ES_HNSW_EF_CONSTRUCTION,
+    }
+
+
+def test_near_duplicate_chunks_are_indexed_once_with_all_sources(corpus, monkeypatch):
+    original = (corpus / "a.md").read_text()
+    (corpus / "a_copy.md").write_text(original.replace("paragraph 7.", "paragraph seven."))
+    cluster = _use_cluster(monkeypatch, FakeCluster())
+
+    written = loader.ingest(str(corpus))
+    duplicates = len(loader.chunk_documents(loader.load_documents(str(corpus)))) - written
+    assert duplicates > 0 and len(cluster.docs) == written
+    shared = [i for i in cluster.docs if len(cluster.sources[i]) == 2]
+    assert shared and all(any(s.endswith("a_copy.md") for s in cluster.sources[i]) for i in shared)
+
+    (corpus / "a.md").unlink()  # the copy still references a.md's canonical chunks
+    loader.ingest(str(corpus))
+    assert all(i in cluster.docs for i in shared)
+    assert all(len(cluster.sources[i]) == 1 and cluster.sources[i][0].endswith("a_copy.md") for i in shared)
+
+
+def test_manifest_tracks_which_files_share_a_chunk(tmp_path):
+    manifest = IngestManifest(tmp_path / "manifest.json", "kb")
+    manifest.start_file("a.md", "sha-a", ["c1", "c2"])
+    manifest.start_file("b.md", "sha-b", [])
+    manifest.commit_chunks("b.md", ["c2", "c3"])
+    assert manifest.shared_ids(["c1", "c2", "c3"], exclude="a.md") == {"c2", "c3"}
+
+    manifest.start_file("b.md", "sha-b2", ["c3"])  # re-ingested b.md no longer lists c2
+    assert manifest.shared_ids(["c2"], exclude="a.md") == set()
+    manifest.save()
+    reloaded = IngestManifest.load(tmp_path / "manifest.json", "kb")
+    assert reloaded.remove_file("a.md") == ["c1", "c2"] and reloaded.shared_ids(["c1", "c2", "c3"]) == {"c3"}
+
+
+def test_local_backend_ingests_and_searches_like_exact_cosine(corpus, tmp_path, monkeypatch):
+    search = importlib.import_module("src.tools.elastic_search")
+    embeddings = DeterministicFakeEmbedding(size=8)
+    local = LocalVectorIndex(tmp_path / "local")
+    monkeypatch.setattr(settings, "RETRIEVAL_BACKEND", "local")
+    monkeypatch.setattr(loader, "get_local_index", lambda: local)
+    monkeypatch.setattr(search, "get_local_index", lambda: local)
+    monkeypatch.setattr(search, "get_embeddings", lambda: embeddings)
+
+    written = loader.ingest(str(corpus))
+    assert written == len(local) > 0 and loader.ingest(str(corpus)) == 0
+    (corpus / "c.md").unlink()
+    loader.ingest(str(corpus))
+    rows = local.search([embeddings.embed_query("x")], k=len(local))[0]
+    assert len(rows) == len(local) < written and not any(r["metadata"]["source"].endswith("c.md") for r in rows)
+
+    hits, timings = search.search_hits("b paragraph 12", k=5)
+    query = np.asarray(embeddings.embed_query("b paragraph 12"))
+    cosine = lambda v: np.dot(query, v) / np.linalg.norm(query) / np.linalg.norm(v)  # noqa: E731
+    exact = sorted(rows, key=lambda r: -cosine(embeddings.embed_query(r["text"])))[:5]
+    assert [h.id for h in hits] == [r["id"] for r in exact]
+    assert all(h.vector_score == h.score and 0 <= h.score <= 1 for h in hits) and "search_ms" in timings
+
+    reopened = LocalVectorIndex(tmp_path / "local", nlist=4, nprobe=4)  # all cells probed = exact
+    reopened.train()
+    assert reopened.trained and [r["id"] for r in reopened.search([query], 5)[0]] == [h.id for h in hits]
+
+    # same contract as index.update_sources: the number of chunks updated, committed
+    assert reopened.update_sources({hits[0].id: ["z.md"], "missing": ["z.md"]}, {}) == 1
+    rows = LocalVectorIndex(tmp_path / "local").search([query], 1)[0]
+    assert rows[0]["id"] == hits[0].id and "z.md" in rows[0]["metadata"]["sources"]
+
+    before = len(local)
+    assert loader.ingest(str(corpus), full=True) == before == len(local) and loader.ingest(str(corpus)) == 0
+
+
+def test_local_index_follows_writes_and_rebuilds_from_another_instance(tmp_path):
+    reader = LocalVectorIndex(tmp_path / "local")
+    writer = LocalVectorIndex(tmp_path / "local")
+    writer.add_embeddings([("a", [1.0, 0.0]), ("b", [0.0, 1.0])], ids=["a", "b"])
+    assert [r["id"] for r in reader.search([[1.0, 0.0]], 2)[0]] == ["a", "b"]
+
+    # deletes, reused rows and file growth past the reader's memmap are all picked up
+    writer.delete(["a"])
+    writer.add_embeddings([(f"n{i}", [1.0, i / 2000]) for i in range(1500)], ids=[f"n{i}" for i in range(1500)])
+    hits = reader.search([[1.0, 0.0]], 3)[0]
+    assert len(reader) == 1501 and [r["id"] for r in hits] == ["n0", "n1", "n2"]
+
+    # a row deleted behind the reader's back (no generation bump) is skipped, not a KeyError
+    with sqlite3.connect(reader._path / "chunks.sqlite") as db:
+        db.execute("DELETE FROM chunks WHERE id = 'n0'")
+    assert [r["id"] for r in reader.search([[1.0, 0.0]], 3)[0]] == ["n1", "n2"]
+
+    build = writer.new_build()
+    build.add_embeddings([("c", [0.0, 1.0])], ids=["c"])
+    assert reader.search([[0.0, 1.0]], 1)[0][0]["id"] == "b"  # still served until published
+    build.publish()
+    assert [r["id"] for r in reader.search([[0.0, 1.0]], 5)[0]] == ["c"] and reader.name == build.name
+    assert [p.name for p in (tmp_path / "local").iterdir() if p.is_dir()] == [build._build]
@@ -0,0 +1,102 @@
+"""Tests for the HTTP service (agent and backends stubbed)."""
+import asyncio
+import contextlib
+import time
+
+import pytest
+
+pytest.importorskip("starlette")
+from starlette.testclient import TestClient
+
+from src import server
+from src.config import settings
+
+
+def test_admission_queue_rejects_when_full():
+    async def scenario():
+        queue = server.AdmissionQueue(max_concurrency=1, max_queue=1, timeout=0.05)
+        started = await queue.acquire()
+        waiter = asyncio.create_task(queue.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(server.QueueFull) as excinfo:
+            await queue.acquire()
+        assert excinfo.value.retry_after >= 1
+        with pytest.raises(server.QueueFull):
+            await waiter  # timed out in the queue
+        queue.release(started)
+        return queue.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["rejected"] == 2
+    assert stats["in_flight"] == 0 and stats["waiting"] == 0
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def fake_arun_agent(question, use_cache=None, session_id=None):
+        return {"route": "direct", "generation": f"echo: {question} ({session_id})", "messages": [object()], "timings": {}}
+
+    monkeypatch.setattr(settings, "WARMUP_ON_START", False)
+    monkeypatch.setattr(server, "arun_agent", fake_arun_agent)
+    monkeypatch.setattr(
+        server, "_health_snapshot", lambda: {"elasticsearch": True, "ollama": False, "documents": 3, "checked_at": 0}
+    )
+    with TestClient(server.create_app()) as client:
+        yield client
+
+
+def test_ask_returns_public_result_fields(client):
+    response = client.post("/ask", json={"question": "hello"})
+    assert response.status_code == 200
+    assert response.json() == {"route": "direct", "generation": "echo: hello (None)", "timings": {}}
+    assert client.post("/ask", json={"question": "hi", "session_id": "s1"}).json()["generation"] == "echo: hi (s1)"
+    assert client.post("/ask", json={}).status_code == 400
+    assert client.post("/ask", json=[1]).status_code == 400 and client.post("/ask/stream", json="hi").status_code == 400
+    assert client.post("/ask", json={"question": 5}).status_code == 400
+    assert client.post("/ask", json={"question": "hi", "session_id": 7}).status_code == 400
+
+
+def test_ask_answers_429_with_retry_after_when_saturated(client):
+    queue = client.app.state.queue
+    queue.in_flight, queue.waiting = queue.max_concurrency, queue.max_queue
+    response = client.post("/ask", json={"question": "hello"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_health_reports_cached_status(client):
+    for _ in range(50):  # first background refresh
+        response = client.get("/health")
+        if response.json()["checked_at"] is not None:
+            break
+        time.sleep(0.02)
+    assert response.status_code == 503  # Ollama is down in the stubbed snapshot
+    body = response.json()
+    assert body["documents"] == 3 and body["queue"]["max_concurrency"] == settings.SERVER_MAX_CONCURRENCY
+
+
+@pytest.mark.parametrize("spec_version", ["2.0", "2.4"])
+def test_stream_frees_slot_when_client_disconnects_before_body(monkeypatch, spec_version):
+    monkeypatch.setattr(server, "stream_agent", lambda *args, **kwargs: iter(()))
+    app = server.create_app()
+    app.state.queue = server.AdmissionQueue(max_concurrency=1, max_queue=0, timeout=0.05)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": spec_version}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": "/ask/stream", "raw_path": b"/ask/stream", "root_path": "",
+        "query_string": b"", "headers": [(b"content-type", b"application/json")], "server": ("test", 80), "client": ("c", 1),
+    }
+    messages = [{"type": "http.request", "body": b'{"question": "hello"}', "more_body": False}]
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        if spec_version == "2.4":
+            raise OSError("client went away")  # ASGI 2.4 servers raise on send to a closed connection
+
+    async def scenario():
+        with contextlib.suppress(Exception):
+            await app(scope, receive, send)
+
+    asyncio.run(scenario())
+    assert app.state.queue.stats()["in_flight"] == 0
@@ -1,2 +1,238 @@
 """Tests for agent tools."""
-# TODO: Phase 8 — Implement tool tests
+import asyncio
+import importlib
+import json
+import threading
+import time
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.config import settings
+from src.tools import elastic_search
+from src.tools.calculator import CalculationLimitError, arithmetic_expression, calculator, evaluate
+from src.tools.elastic_search import SearchHit, rrf_fuse
+
+web_search_module = importlib.import_module("src.tools.web_search")  # the package re-exports the tool under this name
+
+
+def _raw(doc_id: str, score: float, text: str = "") -> dict:
+    return {"_id": doc_id, "_score": score, "_source": {"text": text or doc_id, "metadata": {"source": f"{doc_id}.md"}}}
+
+
+class FakeES:
+    def __init__(self, knn: list[dict], bm25: list[dict]):
+        self.knn, self.bm25 = knn, bm25
+        self.calls = []
+
+    def msearch(self, index, searches):
+        self.calls.append("msearch")
+        return {"responses": [{"hits": {"hits": self.knn if "knn" in body else self.bm25}} for body in searches[1::2]]}
+
+
+def test_rrf_rewards_agreement_between_rankings():
+    dense = [SearchHit("a", "", "", 0.9, vector_score=0.9), SearchHit("b", "", "", 0.8, vector_score=0.8)]
+    lexical = [SearchHit("c", "", "", 12.0, bm25_score=12.0), SearchHit("b", "", "", 7.0, bm25_score=7.0)]
+    fused = rrf_fuse([dense, lexical], k=3)
+    assert [h.id for h in fused] == ["b", "a", "c"]
+    assert fused[0].vector_score == 0.8 and fused[0].bm25_score == 7.0
+
+
+def test_hybrid_search_is_one_round_trip(monkeypatch):
+    es = FakeES(knn=[_raw("a", 0.91), _raw("b", 0.85)], bm25=[_raw("ENV_VAR", 14.2)])
+    monkeypatch.setattr(elastic_search, "get_es_client", lambda: es)
+    monkeypatch.setattr(elastic_search, "get_embeddings", lambda: DeterministicFakeEmbedding(size=8))
+
+    hits, timings = elastic_search.search_hits("ENV_VAR", k=3, strategy="hybrid")
+    assert es.calls == ["msearch"]
+    assert {h.id for h in hits} == {"a", "b", "ENV_VAR"}
+    assert {"embed_ms", "search_ms", "fuse_ms", "total_ms"} <= set(timings)
+
+    monkeypatch.setattr(settings, "RETRIEVAL_STRATEGY", "bm25")
+    text = elastic_search.search_knowledge_base.invoke("ENV_VAR")
+    assert text.startswith("[Doc 1] (source: ENV_VAR.md)")
+
+
+def test_concurrent_mcp_kb_searches_share_one_msearch(monkeypatch):
+    pytest.importorskip("mcp")
+    from src.mcp_server import SearchBatcher
+
+    class BatchES:
+        def __init__(self):
+            self.calls = []
+
+        def msearch(self, index, searches):
+            bodies = searches[1::2]
+            self.calls.append(len(bodies))
+            return {"responses": [
+                {"hits": {"hits": [_raw(f"{'knn' if 'knn' in b else b['query']['match']['text']}", 1.0)]}} for b in bodies
+            ]}
+
+    es = BatchES()
+    monkeypatch.setattr(elastic_search, "get_es_client", lambda: es)
+    monkeypatch.setattr(elastic_search, "get_embeddings", lambda: DeterministicFakeEmbedding(size=8))
+    monkeypatch.setattr(settings, "RETRIEVAL_STRATEGY", "hybrid")
+
+    async def scenario():
+        batcher = SearchBatcher(window=0.05, max_queries=16)
+        return await asyncio.gather(*(batcher.search(q, k=2) for q in ("alpha", "beta", "gamma")))
+
+    results = asyncio.run(scenario())
+    assert es.calls == [6]  # three queries × (kNN + BM25) in one round-trip
+    assert [{h.id for h in hits} for hits, _ in results] == [{"knn", q} for q in ("alpha", "beta", "gamma")]
+
+
+def test_mcp_batch_failures_resolve_every_caller():
+    pytest.importorskip("mcp")
+    from src.mcp_server import SearchBatcher
+
+    def failing(queries, k):
+        raise ConnectionError("es down")
+
+    async def scenario(search):
+        batcher = SearchBatcher(window=0.01, max_queries=16, search=search)
+        results = await asyncio.gather(*(batcher.search(q) for q in ("alpha", "beta")), return_exceptions=True)
+        return results, batcher._tasks
+
+    results, tasks = asyncio.run(scenario(failing))
+    assert [type(r) for r in results] == [ConnectionError, ConnectionError] and not tasks
+    results, _ = asyncio.run(scenario(lambda queries, k: [([], {})]))  # fewer results than queries
+    assert results[0] == ([], {}) and isinstance(results[1], RuntimeError)
+
+
+def test_federated_search_drops_slow_and_failing_targets(monkeypatch):
+    class IndexES:
+        def options(self, **options):
+            assert options["request_timeout"] <= 2.0 and options["max_retries"] == 0
+            return self
+
+        def msearch(self, index, searches):
+            if index == "archive":
+                time.sleep(1.0)
+            if index == "broken":
+                raise ConnectionError("index unavailable")
+            hits = {"runbooks": [_raw("deploy", 14.0), _raw("rollback", 7.0)],
+                    "reports": [_raw("q3", 0.9)]}.get(index, [])  # a weak lone hit from a small index
+            return {"responses": [{"hits": {"hits": hits}}]}
+
+    monkeypatch.setattr(elastic_search, "get_es_client", lambda: IndexES())
+    monkeypatch.setattr(settings, "RETRIEVAL_TARGETS", ["runbooks", "reports", "archive", "broken"])
+    monkeypatch.setattr(settings, "RETRIEVAL_TARGET_TIMEOUTS", {"archive": 0.2})
+
+    started = time.perf_counter()
+    hits, timings = elastic_search.search_hits("deploy", k=4, strategy="bm25")
+    assert time.perf_counter() - started < 0.8  # the slow target doesn't hold up the answer
+    assert [h.id for h in hits] == ["deploy", "rollback", "q3"]  # one scale across targets, not per-target ranks
+    assert all(0 < h.score < 1 for h in hits)
+    assert {h.metadata["index"] for h in hits} == {"runbooks", "reports"}
+    assert hits[0].bm25_score in (14.0, 0.9)  # raw scores are kept for grading
+    assert {f"{t}_ms" for t in settings.RETRIEVAL_TARGETS} <= set(timings)
+    assert 200 <= timings["archive_ms"] < 800
+
+
+class _SlowBackend:
+    name = "slow"
+
+    def __init__(self, delay: float, fail_first: bool = False):
+        self.delay, self.fail_first, self.calls = delay, fail_first, 0
+
+    def search(self, query, max_results, timeout):
+        self.calls += 1
+        if self.fail_first and self.calls == 1:
+            raise ConnectionError("reset by peer")
+        yield {"title": "first", "href": "https://example.com/1", "body": query}
+        time.sleep(self.delay)
+        yield {"title": "second", "href": "https://example.com/2", "body": query}
+
+
+def _use_web_backend(monkeypatch, tmp_path, backend):
+    monkeypatch.setattr(web_search_module, "_cache", web_search_module.WebSearchCache(tmp_path / "web.sqlite", ttl=60))
+    monkeypatch.setattr(web_search_module, "_backend", backend)
+
+
+def test_web_search_local_backend_and_cache(monkeypatch, tmp_path):
+    index = tmp_path / "index.jsonl"
+    index.write_text("\n".join(json.dumps(r) for r in [
+        {"title": "Elasticsearch 9 released", "href": "https://example.com/es9", "body": "new release notes"},
+        {"title": "Weather", "href": "https://example.com/w", "body": "sunny"},
+    ]))
+    backend = web_search_module.LocalIndexBackend(index)
+    _use_web_backend(monkeypatch, tmp_path, backend)
+
+    text = web_search_module.web_search.invoke("Elasticsearch release")
+    assert text.startswith("[Result 1] Elasticsearch 9 released\nURL: https://example.com/es9")
+    backend.records.clear()  # a second, normalized lookup must come from the cache
+    results, info = web_search_module.search_web("  elasticsearch RELEASE? ")
+    assert info["cached"] and results[0]["href"] == "https://example.com/es9"
+
+
+def test_web_search_deadline_returns_partial_results(monkeypatch, tmp_path):
+    _use_web_backend(monkeypatch, tmp_path, _SlowBackend(delay=1.0))
+    started = time.perf_counter()
+    results, info = web_search_module.search_web("slow query", timeout=0.2)
+    assert time.perf_counter() - started < 0.5
+    assert info["partial"] and [r["title"] for r in results] == ["first"]
+    assert web_search_module._cache.get(web_search_module.WebSearchCache.key("slow", "slow query", 3)) is None
+
+
+def test_web_search_retries_transient_errors(monkeypatch, tmp_path):
+    backend = _SlowBackend(delay=0, fail_first=True)
+    _use_web_backend(monkeypatch, tmp_path, backend)
+    results, info = web_search_module.search_web("retry me", timeout=5)
+    assert info["attempts"] == 2 and info["error"] is None and len(results) == 2
+
+
+def test_cancelled_web_search_takes_no_slot_and_stops_reading(monkeypatch, tmp_path):
+    backend = _SlowBackend(delay=0.5)
+    _use_web_backend(monkeypatch, tmp_path, backend)
+    slots = web_search_module._slots
+    cancelled = threading.Event()
+    token = web_search_module.cancel_event.set(cancelled)
+    try:
+        for _ in range(settings.WEB_SEARCH_MAX_CONCURRENCY):  # every slot busy: the search has to wait
+            slots.acquire()
+        threading.Timer(0.1, cancelled.set).start()
+        started = time.perf_counter()
+        results, info = web_search_module.search_web("waiting", timeout=5)
+        assert time.perf_counter() - started < 0.5 and info["error"] == "cancelled" and backend.calls == 0
+        for _ in range(settings.WEB_SEARCH_MAX_CONCURRENCY):
+            slots.release()
+
+        cancelled.clear()
+        threading.Timer(0.1, cancelled.set).start()
+        started = time.perf_counter()
+        results, info = web_search_module.search_web("in flight", timeout=5)
+        assert time.perf_counter() - started < 0.4 and info["error"] == "cancelled"
+        assert [r["title"] for r in results] == ["first"]  # the request returns, but nothing more is read
+        assert web_search_module._cache.get(web_search_module.WebSearchCache.key("slow", "in flight", 3)) is None
+        for _ in range(settings.WEB_SEARCH_MAX_CONCURRENCY):  # the slot is back once the request returns
+            assert slots.acquire(timeout=1)
+        for _ in range(settings.WEB_SEARCH_MAX_CONCURRENCY):
+            slots.release()
+    finally:
+        web_search_module.cancel_event.reset(token)
+
+
+def test_calculator_cost_limits():
+    started = time.perf_counter()
+    for expression in ("9**9**9", "10**10**4", "2**4000", "+".join(["1"] * 100)):
+        with pytest.raises(CalculationLimitError):
+            evaluate(expression)
+    assert time.perf_counter() - started < 0.5
+    assert evaluate("2**10") == 1024 and evaluate("(15 * 3.5) / 7") == 7.5
+    assert "too large" in calculator.invoke({"expression": "10.0**400"})
+    assert calculator.invoke({"expression": "9**9**9"}).startswith("Error evaluating")
+    with pytest.raises(ValueError, match="not a real number"):
+        evaluate("(-8)**0.5")
+
+
+def test_arithmetic_questions_are_recognized():
+    assert arithmetic_expression("What is 15% of 2400?") == "15 / 100 * 2400"
+    assert evaluate(arithmetic_expression("what's 2,400 times 3")) == 7200
+    assert evaluate(arithmetic_expression("calculate 2^10 - 24")) == 1000
+    assert arithmetic_expression("what is 10-2-3") == "10-2-3" and arithmetic_expression("10 - 2") == "10 - 2"
+    assert arithmetic_expression("555-1234") is None and arithmetic_expression("what is 555-1234") == "555-1234"
+    assert arithmetic_expression("1" + "+1" * 5000) is None  # over the size cap: not parsed at all
+    for question in ("What is RRF?", "what is 2024-01-05?", "what is 2024-1-5", "what happened on 2024-1-5",
+                     "hello", "what is 42", "top 10 tips for ES 8"):
+        assert arithmetic_expression(question) is None
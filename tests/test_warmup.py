@@ -0,0 +1,26 @@
+"""Tests for model warmup (Ollama stubbed)."""
+from src import warmup
+
+
+def test_warmup_reports_cold_and_warm_loads(monkeypatch):
+    class _Response:
+        def __init__(self, load_ns):
+            self.load_ns = load_ns
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"load_duration": self.load_ns}
+
+    requests = []
+
+    def _post(url, json, timeout):
+        requests.append((url, json))
+        return _Response(3_000_000_000 if url.endswith("/api/chat") else 2_000_000)
+
+    monkeypatch.setattr(warmup.httpx, "post", _post)
+    report = warmup.warmup()
+    assert report["llm"]["cold"] and report["llm"]["load_ms"] == 3000
+    assert report["embeddings"]["ok"] and not report["embeddings"]["cold"]
+    assert all(payload["keep_alive"] for _, payload in requests)